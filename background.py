@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import contextlib
+import errno
+import fcntl
+import os
+import time
+from typing import IO, Callable, Dict, Iterator, Optional, Tuple
+
+import logger
+
+LOGGER = logger.get_logger(__name__)
+
+# Seconds between attempts to take a lock held by another process.
+_RETRY_INTERVAL = 0.05
+
+# Lock file -> its only open file in this process, and (lock file, key) -> number of
+# holders of the keys this process locked with acquire. Record locks belong to the
+# process and closing any file of the lock file drops all of them, so it stays open
+# while a key is held.
+_FILES = {}  # type: Dict[str, IO]
+_HELD = {}  # type: Dict[Tuple[str, int], int]
+
+
+class LockTimeout(Exception):
+    """Another process held a lock for longer than the caller waits."""
+
+
+@contextlib.contextmanager
+def locked(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on the file 'path', shared by every process."""
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def acquire(path: str, key: int, timeout: Optional[float] = None) -> None:
+    """Hold an exclusive lock on 'key', a byte offset of the file 'path', shared by
+    every process, until the matching release. One lock file holds any number of
+    keys on a single file descriptor. A key this process already holds is only
+    counted, so nested holders don't wait for themselves. Raises LockTimeout when
+    another process held it for 'timeout' seconds.
+    """
+    if (path, key) in _HELD:
+        _HELD[path, key] += 1
+        return
+
+    f = _FILES.get(path)
+    if f is None:
+        f = _FILES[path] = open(path, "a")
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, key)
+                break
+            except OSError as e:
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise LockTimeout(
+                        f"{path} (key {key}) is still locked by another process "
+                        f"after {timeout}s"
+                    )
+                time.sleep(_RETRY_INTERVAL)
+    except BaseException:
+        _close_unused(path)
+        raise
+
+    _HELD[path, key] = 1
+
+
+def release(path: str, key: int) -> None:
+    """Release a key locked with acquire, once all of its holders released it."""
+    _HELD[path, key] -= 1
+    if _HELD[path, key]:
+        return
+
+    del _HELD[path, key]
+    fcntl.lockf(_FILES[path], fcntl.LOCK_UN, 1, key)
+    _close_unused(path)
+
+
+def _close_unused(path: str) -> None:
+    if not any(held_path == path for held_path, _ in _HELD):
+        _FILES.pop(path).close()
+
+
+def detach(target: Callable[[], None], failure: str) -> None:
+    """Run target in a background process that outlives this one, without waiting
+    for it. Errors are logged as 'failure' followed by the error.
+    """
+    pid = os.fork()
+    if pid:
+        # Reap the intermediate child, the worker is reparented to init.
+        os.waitpid(pid, 0)
+        return
+
+    # Detach from the terminal and the run, so the worker outlives it.
+    logger.after_fork()
+    try:
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        logger.after_fork()
+        # The locks of the run stay with the run, record locks aren't inherited.
+        _HELD.clear()
+        for f in _FILES.values():
+            f.close()
+        _FILES.clear()
+        target()
+    except BaseException as e:
+        LOGGER.critical(f"{failure}: {e}")
+    finally:
+        logger.shutdown()
+        os._exit(0)
+
+
+def alive(worker: Optional[list], timeout: float) -> bool:
+    """Whether the worker [pid, time it last checked in] is still running, assuming
+    it died when it didn't check in for 'timeout' seconds.
+    """
+    if not worker:
+        return False
+
+    pid, checked_in = worker
+    if time.time() - checked_in > timeout:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
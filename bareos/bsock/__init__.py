@@ -5,6 +5,10 @@ from   bareos.bsock.connectiontype      import ConnectionType
 from   bareos.bsock.directorconsole     import DirectorConsole
 from   bareos.bsock.directorconsolejson import DirectorConsoleJson
 from   bareos.bsock.filedaemon          import FileDaemon
+from   bareos.bsock.stats               import Stats
+from   bareos.bsock.asyncdirectorconsole     import AsyncDirectorConsole
+from   bareos.bsock.asyncdirectorconsolejson import AsyncDirectorConsoleJson
+from   bareos.bsock.asyncfiledaemon          import AsyncFileDaemon
 # compat
 from   bareos.bsock.bsock               import BSock
 from   bareos.bsock.bsockjson           import BSockJson
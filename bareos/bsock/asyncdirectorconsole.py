@@ -0,0 +1,28 @@
+"""
+Communicates with the bareos-dir console, using asyncio.
+"""
+
+from   bareos.bsock.connectiontype import ConnectionType
+from   bareos.bsock.asynclowlevel import AsyncLowLevel
+
+class AsyncDirectorConsole(AsyncLowLevel):
+    '''
+    asyncio version of DirectorConsole.
+
+    async with AsyncDirectorConsole(password=Password("secret")) as console:
+        result = await console.call("version")
+    '''
+
+    def __init__(self,
+                 address="localhost",
+                 port=9101,
+                 dirname=None,
+                 name="*UserAgent*",
+                 password=None):
+        super(AsyncDirectorConsole, self).__init__()
+        self._configure(address, port, dirname, ConnectionType.DIRECTOR,
+                        name=name, password=password, auth_success_regex=b'^1000 OK.*$')
+
+
+    async def _init_connection(self):
+        await self._command("autodisplay off")
@@ -0,0 +1,29 @@
+"""
+Communicates with the bareos-dir console in JSON mode, using asyncio.
+"""
+
+from   bareos.bsock.asyncdirectorconsole import AsyncDirectorConsole
+from   bareos.bsock.directorconsolejson import DirectorConsoleJson
+
+class AsyncDirectorConsoleJson(AsyncDirectorConsole):
+    """
+    asyncio version of DirectorConsoleJson.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncDirectorConsoleJson, self).__init__(*args, **kwargs)
+
+
+    async def _init_connection(self):
+        # see DirectorConsoleJson._init_connection
+        self.logger.debug(await self._command(".api json"))
+        self.logger.debug(await self._command(".api json compact=yes"))
+
+
+    async def call(self, command):
+        return DirectorConsoleJson.get_result(await self.call_fullresult(command))
+
+
+    async def call_fullresult(self, command):
+        resultstring = await super(AsyncDirectorConsoleJson, self).call(command)
+        return DirectorConsoleJson.decode_fullresult(resultstring)
@@ -0,0 +1,28 @@
+"""
+Communicates with the bareos-fd, using asyncio.
+"""
+
+from   bareos.bsock.connectiontype import ConnectionType
+from   bareos.bsock.asynclowlevel import AsyncLowLevel
+from   bareos.bsock.filedaemon import FileDaemon
+
+
+class AsyncFileDaemon(AsyncLowLevel):
+    '''asyncio version of FileDaemon'''
+
+    def __init__(self,
+                 address="localhost",
+                 port=9102,
+                 dirname=None,
+                 name=None,
+                 password=None):
+        super(AsyncFileDaemon, self).__init__()
+        self._configure(address, port, dirname, ConnectionType.FILEDAEMON,
+                        name=name, password=password, auth_success_regex=b'^2000 OK Hello.*$')
+
+    async def call(self, command):
+        '''
+        Replace spaces by char(1) in quoted arguments
+        and then call the original function.
+        '''
+        return await super(AsyncFileDaemon, self).call(FileDaemon.escape_command(command))
@@ -0,0 +1,375 @@
+"""
+asyncio socket methods to communicate with the bareos daemons.
+"""
+
+from   bareos.exceptions import *
+from   bareos.util.password import Password
+from   bareos.bsock.constants import Constants
+from   bareos.bsock.crammd5 import CramMd5
+from   bareos.bsock.protocolmessages import ProtocolMessages
+from   bareos.bsock.replyterminator import ReplyTerminator
+import asyncio
+import logging
+import struct
+
+class AsyncLowLevel(object):
+    """
+    asyncio implementation of the LowLevel socket methods.
+
+    Each instance is one session with a daemon.
+    Commands on a session run one after the other,
+    but any number of sessions can run concurrently in one event loop.
+
+    Use it as an asynchronous context manager,
+    or call open() and disconnect() explicitly.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+        self.status = None
+        self.address = None
+        self.port = None
+        self.dirname = None
+        self.connection_type = None
+        self.name = None
+        self.password = None
+        self.auth_success_regex = None
+        self.auth_credentials_valid = False
+        self.reader = None
+        self.writer = None
+        # message data received after the end of the last message
+        self.receive_buffer = b''
+        # regex -> ReplyTerminator
+        self._terminators = {}
+        # serializes commands on this session, created in the event loop
+        self._lock = None
+
+
+    def _configure(self, address, port, dirname, connection_type, name, password, auth_success_regex):
+        if not isinstance(password, Password):
+            raise AuthenticationError("password must by of type bareos.Password() not %s" % (type(password)))
+        self.address = address
+        self.port = port
+        if dirname:
+            self.dirname = dirname
+        else:
+            self.dirname = address
+        self.connection_type = connection_type
+        self.name = name
+        self.password = password
+        self.auth_success_regex = auth_success_regex
+
+
+    async def __aenter__(self):
+        return await self.open()
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.disconnect()
+
+
+    async def open(self):
+        '''
+        connect, authenticate and initialize the session
+        '''
+        await self._connect()
+        await self._auth()
+        await self._init_connection()
+        return self
+
+
+    async def _connect(self):
+        await self.disconnect()
+        self.receive_buffer = b''
+        try:
+            self.reader, self.writer = await asyncio.open_connection(self.address, self.port)
+        except OSError as e:
+            raise ConnectionError(
+                "failed to connect to host " + str(self.address) + ", port " + str(self.port) + ": " + str(e))
+        self.logger.debug("connected to " + str(self.address) + ":" + str(self.port))
+        return True
+
+
+    async def _auth(self):
+        await self.send(ProtocolMessages.hello(self.name, type=self.connection_type))
+
+        (ssl, result_compatible, result) = await self._cram_md5_respond(password=self.password.md5(), tls_remote_need=0)
+        if not result:
+            raise AuthenticationError("failed (in response)")
+        if not await self._cram_md5_challenge(clientname=self.name, password=self.password.md5(), tls_local_need=0, compatible=True):
+            raise AuthenticationError("failed (in challenge)")
+        await self.recv_msg(self.auth_success_regex)
+        self.auth_credentials_valid = True
+        return True
+
+
+    async def _init_connection(self):
+        pass
+
+
+    async def disconnect(self):
+        ''' disconnect '''
+        writer = self.writer
+        self.reader = None
+        self.writer = None
+        if writer is not None:
+            # tell the daemon we are done, like bconsole does on quit
+            writer.write(struct.pack("!i", Constants.BNET_TERMINATE))
+            writer.close()
+            # Python >= 3.7
+            if hasattr(writer, "wait_closed"):
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+
+    async def reconnect(self):
+        result = False
+        if self.auth_credentials_valid:
+            try:
+                await self._connect()
+                await self._auth()
+                await self._init_connection()
+                result = True
+            except (OSError, Error) as e:
+                self.logger.warning("failed to reconnect: %s" % (e))
+        return result
+
+
+    async def call(self, command):
+        '''
+        call a command on the daemon
+        '''
+        if isinstance(command, list):
+            command = " ".join(command)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            return await self._call(command, 0)
+
+
+    async def _call(self, command, count):
+        '''
+        Send a command and receive the result.
+        If connection is lost, try to reconnect.
+        '''
+        result = b''
+        try:
+            result = await self._command(command)
+        except (SocketEmptyHeader, ConnectionLostError) as e:
+            self.logger.error("connection problem (%s): %s" % (type(e).__name__, str(e)))
+            if count == 0:
+                if await self.reconnect():
+                    return await self._call(command, count+1)
+        return result
+
+
+    async def keepalive(self, timeout=10):
+        '''
+        Check that an idle connection still works,
+        by sending a BNET_HEARTBEAT signal, which the director answers with BNET_POLL.
+        Reconnects if there is no answer within timeout seconds.
+        Returns whether the connection works.
+        '''
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                await self.signal(Constants.BNET_HEARTBEAT)
+                await asyncio.wait_for(self._wait_for_signal(Constants.BNET_POLL), timeout)
+                return True
+            except (SocketEmptyHeader, ConnectionLostError, asyncio.TimeoutError) as e:
+                self.logger.warning("no answer to keepalive (%s), reconnecting" % (type(e).__name__))
+                return await self.reconnect()
+
+
+    async def _wait_for_signal(self, value):
+        while True:
+            header, frame = await self._get_frame()
+            if header == value:
+                return
+            if header > 0:
+                self.logger.debug("ignoring unexpected message: %s" % (frame))
+
+
+    async def _command(self, command):
+        '''
+        Send a command and receive the result,
+        without taking the session lock and without reconnecting.
+        '''
+        await self.send(bytearray(command, 'utf-8'))
+        return await self.recv_msg()
+
+
+    async def send(self, msg):
+        '''send a message to the daemon'''
+        self._check_connection()
+        try:
+            self.writer.write(struct.pack("!i", len(msg)) + msg)
+            await self.writer.drain()
+            self.logger.debug("%s" %(msg))
+        except OSError as e:
+            await self._handle_connection_error(e)
+
+
+    async def signal(self, value):
+        '''send a signal, like BNET_HEARTBEAT, to the daemon'''
+        self._check_connection()
+        try:
+            self.writer.write(struct.pack("!i", value))
+            await self.writer.drain()
+        except OSError as e:
+            await self._handle_connection_error(e)
+
+
+    async def recv(self):
+        '''receive a single frame from the daemon'''
+        header, frame = await self._get_frame()
+        if header <= 0:
+            self.logger.debug("header: " + str(header))
+            return bytearray()
+        return bytearray(frame)
+
+
+    async def recv_msg(self, regex = br'^\d\d\d\d OK.*$', timeout = None):
+        '''
+        receive data from the daemon,
+        until a line matches regex or the daemon signals the end of the message.
+        timeout: seconds to wait for the whole message, None waits forever.
+        When it expires, asyncio.TimeoutError is raised and the connection is dropped,
+        as the rest of the message could still arrive on it.
+        '''
+        if timeout is None:
+            return await self._recv_msg(regex)
+        try:
+            return await asyncio.wait_for(self._recv_msg(regex), timeout)
+        except asyncio.TimeoutError:
+            self.logger.error("no complete message within %ss" % (timeout))
+            await self.disconnect()
+            raise
+
+
+    async def _recv_msg(self, regex):
+        terminator = self._terminator(regex)
+        # start with the data left over from the previous message
+        msg = bytearray(self.receive_buffer)
+        lastlineindex = 0
+        self.receive_buffer = b''
+        while True:
+            header, frame = await self._get_frame()
+            if header <= 0:
+                # header is a signal
+                self._set_status(header)
+                if header == Constants.BNET_HEARTBEAT:
+                    await self.signal(Constants.BNET_HB_RESPONSE)
+                elif self.is_end_of_message(header):
+                    return bytes(msg)
+            else:
+                msg += frame
+                match, lastlineindex = terminator.search(msg, lastlineindex)
+                # Bareos indicates end of command result by line starting with 4 digits
+                if match:
+                    self.receive_buffer = bytes(msg[match.end()+1:])
+                    del msg[match.end():]
+                    return bytes(msg)
+
+
+    async def _get_frame(self):
+        '''
+        Receive the next frame.
+        Returns (header, data), where header is the frame length or a signal,
+        and data is None for signals.
+        '''
+        self._check_connection()
+        try:
+            header = struct.unpack("!i", await self.reader.readexactly(4))[0]
+            if header <= 0:
+                return (header, None)
+            return (header, await self.reader.readexactly(header))
+        except asyncio.IncompleteReadError:
+            self.logger.debug("received empty header, assuming connection is closed")
+            await self.disconnect()
+            raise SocketEmptyHeader()
+        except OSError as e:
+            await self._handle_connection_error(e)
+            raise ConnectionLostError(str(e))
+
+
+    def _terminator(self, regex):
+        terminator = self._terminators.get(regex)
+        if terminator is None:
+            terminator = self._terminators[regex] = ReplyTerminator(regex)
+        return terminator
+
+
+    def _set_status(self, status):
+        self.status = status
+        self.logger.debug(str(Constants.get_description(status)) + " (" + str(status) + ")")
+
+
+    def is_end_of_message(self, data):
+        return ((not self.is_connected()) or
+                data == Constants.BNET_EOD or
+                data == Constants.BNET_TERMINATE or
+                data == Constants.BNET_MAIN_PROMPT or
+                data == Constants.BNET_SUB_PROMPT)
+
+
+    def is_connected(self):
+        return (self.status != Constants.BNET_TERMINATE)
+
+
+    async def _cram_md5_challenge(self, clientname, password, tls_local_need=0, compatible=True):
+        '''
+        client launch the challenge,
+        client confirm the daemon is the correct one
+        '''
+        chal, msg = CramMd5.challenge(clientname, tls_local_need)
+        await self.send(msg)
+        msg = await self.recv()
+        if msg and msg[-1] == 0:
+            del msg[-1]
+
+        expected = CramMd5.expected_responses(password, chal)
+        is_correct = msg in expected
+        if is_correct:
+            await self.send(ProtocolMessages.auth_ok())
+        else:
+            self.logger.error("expected result: %s or %s, but get %s" %(expected[0], expected[1], msg))
+            await self.send(ProtocolMessages.auth_failed())
+        return is_correct
+
+
+    async def _cram_md5_respond(self, password, tls_remote_need=0, compatible=True):
+        '''
+        client connect to the daemon,
+        the daemon confirm the password and the config is correct
+        '''
+        msg = await self.recv()
+        # invalid username
+        if ProtocolMessages.is_not_authorized(msg):
+            self.logger.error("failed: " + str(msg))
+            return (0, True, False)
+
+        chal, ssl = CramMd5.parse_challenge(msg)
+        await self.send(CramMd5.response(password, chal))
+        received = await self.recv()
+        result = ProtocolMessages.is_auth_ok(received)
+        if not result:
+            self.logger.error("failed: " + str(received))
+        return (ssl, True, result)
+
+
+    def _check_connection(self):
+        if self.writer is None:
+            if self.auth_credentials_valid:
+                # connection have worked before, but now it is gone
+                raise ConnectionLostError("currently no network connection")
+            else:
+                raise RuntimeError("should connect first before send data")
+
+
+    async def _handle_connection_error(self, exception):
+        self.logger.error("socket error:" + str(exception))
+        await self.disconnect()
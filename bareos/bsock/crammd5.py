@@ -0,0 +1,64 @@
+"""
+cram-md5 authentication between the bareos daemons.
+"""
+
+from   bareos.util.bareosbase64 import BASE64
+import hmac
+import random
+import time
+
+class CramMd5(object):
+    '''
+    The computations of the cram-md5 handshake,
+    independent of how the messages are sent and received.
+    password is the md5 hex digest of the password, see Password.md5().
+    '''
+
+    @staticmethod
+    def challenge(clientname, tls_local_need=0):
+        '''
+        Create a challenge.
+        Returns the challenge and the message to send it with.
+        '''
+        rand = random.randint(1000000000, 9999999999)
+        chal = '<%u.%u@%s>' %(rand, int(time.time()), clientname)
+        msg = bytearray('auth cram-md5 %s ssl=%d\n' %(chal, tls_local_need), 'utf-8')
+        return (chal, msg)
+
+    @staticmethod
+    def parse_challenge(msg):
+        '''
+        Get the challenge and the ssl setting
+        from a received 'auth cram-md5 <challenge> ssl=<n>' message.
+        '''
+        msg_list = msg.split(b" ")
+        chal = bytes(msg_list[2])
+        ssl = int(msg_list[3][4:5])
+        return (chal, ssl)
+
+    @staticmethod
+    def digest(password, chal):
+        '''
+        hmac the challenge with the password
+        '''
+        if not isinstance(chal, (bytes, bytearray)):
+            chal = bytearray(chal, 'utf-8')
+        hmac_md5 = hmac.new(bytes(bytearray(password, 'utf-8')), bytes(chal), 'md5')
+        return bytearray(hmac_md5.digest())
+
+    @staticmethod
+    def response(password, chal):
+        '''
+        The base64 encoded response to a challenge.
+        '''
+        return BASE64.string_to_base64(CramMd5.digest(password, chal))
+
+    @staticmethod
+    def expected_responses(password, chal):
+        '''
+        The responses accepted for our challenge,
+        in compatible base64 and Bareos specific base64.
+        '''
+        digest = CramMd5.digest(password, chal)
+        return (BASE64.string_to_base64(digest, True),
+                BASE64.string_to_base64(digest, False))
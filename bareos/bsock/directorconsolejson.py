@@ -3,6 +3,8 @@ Reimplementation of the bconsole program in python.
 """
 
 from   bareos.bsock.directorconsole import DirectorConsole
+from   bareos.exceptions import JsonRpcError
+from   bareos.util.jsonstream import JsonStream
 from   pprint import pformat, pprint
 import json
 
@@ -23,7 +25,63 @@ class DirectorConsoleJson(DirectorConsole):
 
 
     def call(self, command):
-        json = self.call_fullresult(command)
+        return self.get_result(self.call_fullresult(command))
+
+
+    def call_fullresult(self, command):
+        resultstring = super(DirectorConsoleJson, self).call(command)
+        return self.decode_fullresult(resultstring)
+
+
+    def call_many(self, commands, window=None):
+        resultstrings = super(DirectorConsoleJson, self).call_many(commands, window)
+        return [self.get_result(self.decode_fullresult(resultstring))
+                for resultstring in resultstrings]
+
+
+    def call_items(self, command, key=None, keys=None):
+        '''
+        Call a list command and yield the items of its result
+        while the response arrives,
+        instead of decoding the whole response at once.
+        key: member of the result that contains the items,
+        by default the only list in the result.
+        keys: only keep these members of each item.
+        '''
+        chunks = super(DirectorConsoleJson, self).call_iter(command, lines=False)
+        try:
+            for item in JsonStream(chunks).items(key, keys):
+                yield item
+        finally:
+            # reads the rest of the response, if we stopped early
+            chunks.close()
+
+
+    def call_iter(self, command, page_size=1000, key=None, keys=None):
+        '''
+        Call a list command page by page (using limit and offset)
+        and yield the items of the result one by one,
+        so the full result never has to be kept in memory.
+        key: member of the result that contains the items,
+        by default the only list in the result.
+        keys: only keep these members of each item.
+        '''
+        offset = 0
+        while True:
+            count = 0
+            for item in self.call_items("%s limit=%d offset=%d" % (command, page_size, offset), key, keys):
+                count += 1
+                yield item
+            if count < page_size:
+                return
+            offset += count
+
+
+    @staticmethod
+    def get_result(json):
+        '''
+        Get the result member of a decoded JSON-RPC response.
+        '''
         if json == None:
             return
         if 'result' in json:
@@ -34,8 +92,11 @@ class DirectorConsoleJson(DirectorConsole):
         return result
 
 
-    def call_fullresult(self, command):
-        resultstring = super(DirectorConsoleJson, self).call(command)
+    @staticmethod
+    def decode_fullresult(resultstring):
+        '''
+        Decode a JSON-RPC response.
+        '''
         data = None
         if resultstring:
             try:
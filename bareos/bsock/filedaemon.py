@@ -26,6 +26,18 @@ class FileDaemon(LowLevel):
         Replace spaces by char(1) in quoted arguments
         and then call the original function.
         '''
+        return super(FileDaemon, self).call(self.escape_command(command))
+
+    def call_many(self, commands, window=None):
+        return super(FileDaemon, self).call_many(
+            [self.escape_command(command) for command in commands], window)
+
+    @staticmethod
+    def escape_command(command):
+        '''
+        Split command into its arguments,
+        replacing spaces by char(1) in quoted arguments.
+        '''
         if isinstance(command, list):
             cmdlist=command
         else:
@@ -33,4 +45,4 @@ class FileDaemon(LowLevel):
         command0 = []
         for arg in cmdlist:
             command0.append(arg.replace(" ", "\x01"))
-        return super(FileDaemon, self).call(command0)
+        return command0
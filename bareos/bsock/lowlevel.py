@@ -6,16 +6,16 @@ Low Level socket methods to communication with the bareos-director.
 # https://github.com/hanxiangduo/bacula-console-python
 
 from   bareos.exceptions import *
-from   bareos.util.bareosbase64 import BareosBase64
 from   bareos.util.password import Password
 from   bareos.bsock.constants import Constants
 from   bareos.bsock.connectiontype import ConnectionType
+from   bareos.bsock.crammd5 import CramMd5
 from   bareos.bsock.protocolmessages import ProtocolMessages
-import hmac
+from   bareos.bsock.replyterminator import ReplyTerminator
+from   bareos.bsock.stats import Stats
+import contextlib
 import logging
-import random
-import re
-from   select import select
+import selectors
 import socket
 import struct
 import sys
@@ -26,6 +26,13 @@ class LowLevel(object):
     Low Level socket methods to communicate with the bareos-director.
     """
 
+    # initial size of the receive buffer, grows when a frame does not fit.
+    RECV_BUFFER_SIZE = 64 * 1024
+    # seconds to wait for a single frame during authentication.
+    RECV_TIMEOUT = 10
+    # maximum number of commands call_many() sends ahead of their results.
+    PIPELINE_WINDOW = 16
+
     def __init__(self):
         self.logger = logging.getLogger()
         self.logger.debug("init")
@@ -37,7 +44,43 @@ class LowLevel(object):
         self.socket = None
         self.auth_credentials_valid = False
         self.connection_type = None
+        # message data received after the end of the last message
         self.receive_buffer = b''
+        # frames are received into this buffer,
+        # unread data is between _recv_start and _recv_end.
+        self._recv_buffer = bytearray(self.RECV_BUFFER_SIZE)
+        self._recv_start = 0
+        self._recv_end = 0
+        # regex -> ReplyTerminator, see recv_msg
+        self._terminators = {}
+        # waits for the socket, see __selector
+        self._selector = None
+        self._selector_socket = None
+        # instrumentation, see measure()
+        self.stats = None
+        self._trace = False
+
+    @contextlib.contextmanager
+    def measure(self, stats=None):
+        '''
+        Record what the connection does within the with block
+        into stats (a new Stats by default), which is returned.
+        Per frame debug messages are only logged while measuring.
+        Nested measurements are added to the outer one.
+        '''
+        if stats is None:
+            stats = Stats()
+        outer = self.stats
+        self.stats = stats
+        self._trace = self.logger.isEnabledFor(logging.DEBUG)
+        try:
+            yield stats
+        finally:
+            self.stats = outer
+            self._trace = outer is not None and self.logger.isEnabledFor(logging.DEBUG)
+            if outer is not None:
+                outer.merge(stats)
+
 
     def connect(self, address, port, dirname, type):
         self.address = address
@@ -51,6 +94,11 @@ class LowLevel(object):
 
 
     def __connect(self):
+        # drop anything left over from a previous connection
+        self.__close()
+        self.receive_buffer = b''
+        self._recv_start = 0
+        self._recv_end = 0
         try:
             self.socket = socket.create_connection((self.address, self.port))
         except socket.gaierror as e:
@@ -78,6 +126,15 @@ class LowLevel(object):
 
 
     def __auth(self):
+        if self.stats is None:
+            return self.__handshake()
+        start = time.monotonic()
+        result = self.__handshake()
+        self.stats.add_handshake(time.monotonic() - start)
+        return result
+
+
+    def __handshake(self):
         bashed_name = ProtocolMessages.hello(self.name, type=self.connection_type)
         # send the bash to the director
         self.send(bashed_name)
@@ -98,18 +155,36 @@ class LowLevel(object):
 
     def disconnect(self):
         ''' disconnect '''
-        # TODO
-        pass
+        if self.socket is not None:
+            try:
+                # tell the daemon we are done, like bconsole does on quit
+                self.signal(Constants.BNET_TERMINATE)
+            finally:
+                self.__close()
+
+
+    def __close(self):
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+            self._selector_socket = None
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except socket.error:
+                pass
+            self.socket = None
 
 
     def reconnect(self):
         result = False
         if self.auth_credentials_valid:
             try:
-                if self.__connect() and self.__auth() and self._init_connection():
+                if self.__connect() and self.__auth():
+                    self._init_connection()
                     result = True
-            except socket.error:
-                self.logger.warning("failed to reconnect")
+            except (socket.error, Error) as e:
+                self.logger.warning("failed to reconnect: %s" % (e))
         return result
 
 
@@ -119,7 +194,13 @@ class LowLevel(object):
         '''
         if isinstance(command, list):
             command = " ".join(command)
-        return self.__call(command, 0)
+        if self.stats is None:
+            return self.__call(command, 0)
+        start = time.monotonic()
+        try:
+            return self.__call(command, 0)
+        finally:
+            self.stats.add_command(command, time.monotonic() - start)
 
 
     def __call(self, command, count):
@@ -139,6 +220,127 @@ class LowLevel(object):
         return result
 
 
+    def call_many(self, commands, window=None):
+        '''
+        call several commands, pipelined:
+        commands are sent without waiting for the results of the ones before,
+        with at most window (PIPELINE_WINDOW by default) results outstanding.
+        Returns the results in the order of the commands.
+
+        Results are told apart by the end of message signals only,
+        so commands that prompt for input can't be pipelined.
+        If the connection is lost, it is reconnected once
+        and the commands without a result so far are sent again,
+        otherwise the error is raised.
+        '''
+        if window is None:
+            window = self.PIPELINE_WINDOW
+        commands = [" ".join(command) if isinstance(command, list) else command
+                    for command in commands]
+        results = []
+        # when each outstanding command was sent, for the stats
+        sent_at = [None] * len(commands)
+        count = 0
+        while True:
+            try:
+                sent = len(results)
+                while len(results) < len(commands):
+                    # keep the pipeline full
+                    while sent < len(commands) and sent - len(results) < window:
+                        self.send(bytearray(commands[sent], 'utf-8'))
+                        if self.stats is not None:
+                            sent_at[sent] = time.monotonic()
+                        sent += 1
+                    result = self.recv_msg(regex=None)
+                    if result is None:
+                        raise ConnectionLostError("connection lost during pipelined call")
+                    if self.stats is not None and sent_at[len(results)] is not None:
+                        self.stats.add_command(commands[len(results)], time.monotonic() - sent_at[len(results)])
+                    results.append(result)
+                return results
+            except (SocketEmptyHeader, ConnectionLostError) as e:
+                self.logger.error("connection problem (%s): %s" % (type(e).__name__, str(e)))
+                count += 1
+                if count > 1 or not self.reconnect():
+                    raise
+
+
+    def call_iter(self, command, lines=True, timeout=None):
+        '''
+        call a command and yield its result while it arrives,
+        line by line (or frame by frame, if lines is False),
+        instead of collecting the whole result in memory first.
+        The result ends with the end of message signal.
+
+        Unlike call(), a lost connection is not retried,
+        as part of the result may already have been consumed.
+        If the iteration is stopped early,
+        the rest of the result is read and dropped,
+        so the connection can be used for the next command.
+        '''
+        if isinstance(command, list):
+            command = " ".join(command)
+        self.send(bytearray(command, 'utf-8'))
+        deadline = self.__deadline(timeout)
+        # start with the data left over from the previous message
+        partial = bytearray(self.receive_buffer)
+        self.receive_buffer = b''
+        complete = False
+        try:
+            while True:
+                header, frame = self.__get_frame(deadline)
+                if header <= 0:
+                    # header is a signal
+                    self.__set_status(header)
+                    if header == Constants.BNET_HEARTBEAT:
+                        self.signal(Constants.BNET_HB_RESPONSE)
+                    elif self.is_end_of_message(header):
+                        complete = True
+                        if partial:
+                            yield bytes(partial)
+                        return
+                elif not lines:
+                    # the frame is only valid until the next receive
+                    data = bytes(partial) + bytes(frame)
+                    frame.release()
+                    partial = bytearray()
+                    yield data
+                else:
+                    partial += frame
+                    frame.release()
+                    start = 0
+                    newline = partial.find(b'\n')
+                    while newline >= 0:
+                        yield bytes(partial[start:newline + 1])
+                        start = newline + 1
+                        newline = partial.find(b'\n', start)
+                    del partial[:start]
+        except GeneratorExit:
+            if not complete:
+                self.__skip_message(deadline)
+            raise
+        except socket.timeout as e:
+            self.logger.error("no complete message within %ss" % (timeout))
+            self._handleSocketError(e)
+            raise
+        except socket.error as e:
+            self._handleSocketError(e)
+            raise ConnectionLostError(str(e))
+
+
+    def __skip_message(self, deadline):
+        '''
+        Read and drop the rest of the current message.
+        '''
+        while True:
+            header, frame = self.__get_frame(deadline)
+            if header > 0:
+                frame.release()
+            elif self.is_end_of_message(header):
+                self.__set_status(header)
+                return
+
+
     def send_command(self, command):
         return self.call(command)
 
@@ -150,8 +352,22 @@ class LowLevel(object):
 
         try:
             # convert to network flow
-            self.socket.sendall(struct.pack("!i", msg_len) + msg)
-            self.logger.debug("%s" %(msg))
+            self.__sendall(struct.pack("!i", msg_len) + msg)
+            if self.stats is not None:
+                self.stats.frames_sent += 1
+            if self._trace:
+                self.logger.debug("%s" %(msg))
+        except socket.error as e:
+            self._handleSocketError(e)
+
+
+    def signal(self, value):
+        '''send a signal, like BNET_TERMINATE, to the director'''
+        self.__check_socket_connection()
+        try:
+            self.__sendall(struct.pack("!i", value))
+            if self.stats is not None:
+                self.stats.frames_sent += 1
         except socket.error as e:
             self._handleSocketError(e)
 
@@ -159,77 +375,74 @@ class LowLevel(object):
     def recv(self):
         '''will receive data from director '''
         self.__check_socket_connection()
-        # get the message header
-        header = self.__get_header()
+        # get the message header and the message
+        header, frame = self.__get_frame(self.__deadline(self.RECV_TIMEOUT))
         if header <= 0:
-            self.logger.debug("header: " + str(header))
-        # get the message
-        length = header
-        msg = self.recv_submsg(length)
+            if self._trace:
+                self.logger.debug("header: " + str(header))
+            return bytearray()
+        msg = bytearray(frame)
+        frame.release()
         return msg
 
 
     def recv_msg(self, regex = b'^\d\d\d\d OK.*$', timeout = None):
-        '''will receive data from director '''
+        '''
+        will receive data from director,
+        until a line matches regex or the director signals the end of the message.
+        regex None only ends the message on a signal.
+        timeout: seconds to wait for the whole message, None waits forever.
+        When it expires, socket.timeout is raised and the connection is dropped,
+        as the rest of the message could still arrive on it.
+        '''
         self.__check_socket_connection()
+        deadline = self.__deadline(timeout)
+        terminator = None
+        if regex is not None:
+            terminator = self.__terminator(regex)
+        # start with the data left over from the previous message
+        msg = bytearray(self.receive_buffer)
+        lastlineindex = 0
+        self.receive_buffer = b''
         try:
-            timeouts = 0
             while True:
-                # get the message header
-                self.socket.settimeout(0.1)
-                try:
-                    header = self.__get_header()
-                except socket.timeout:
-                    # only log every 100 timeouts
-                    if timeouts % 100 == 0:
-                        self.logger.debug("timeout (%i) on receiving header" % (timeouts))
-                    timeouts+=1
+                header, frame = self.__get_frame(deadline)
+                if header <= 0:
+                    # header is a signal
+                    self.__set_status(header)
+                    if header == Constants.BNET_HEARTBEAT:
+                        self.signal(Constants.BNET_HB_RESPONSE)
+                    elif self.is_end_of_message(header):
+                        return bytes(msg)
                 else:
-                    if header <= 0:
-                        # header is a signal
-                        self.__set_status(header)
-                        if self.is_end_of_message(header):
-                            result = self.receive_buffer
-                            self.receive_buffer = b''
-                            return result
-                    else:
-                        # header is the length of the next message
-                        length = header
-                        submsg = self.recv_submsg(length)
-                        # check for regex in new submsg
-                        # and last line in old message,
-                        # which might have been incomplete without new submsg.
-                        lastlineindex = self.receive_buffer.rfind(b'\n') + 1
-                        self.receive_buffer += submsg
-                        match = re.search(regex, self.receive_buffer[lastlineindex:], re.MULTILINE)
-                        # Bareos indicates end of command result by line starting with 4 digits
-                        if match:
-                            self.logger.debug("msg \"{0}\" matches regex \"{1}\"".format(self.receive_buffer.strip(), regex))
-                            result = self.receive_buffer[0:lastlineindex] + self.receive_buffer[lastlineindex:match.end()]
-                            self.receive_buffer = self.receive_buffer[lastlineindex+match.end()+1:]
-                            return result
-                        #elif re.search("^\d\d\d\d .*$", msg, re.MULTILINE):
-                            #return msg
+                    # check for regex in new frame
+                    # and last line in old message,
+                    # which might have been incomplete without new frame.
+                    msg += frame
+                    frame.release()
+                    if terminator is None:
+                        continue
+                    match, lastlineindex = terminator.search(msg, lastlineindex)
+                    # Bareos indicates end of command result by line starting with 4 digits
+                    if match:
+                        if self._trace:
+                            self.logger.debug("msg \"{0}\" matches regex \"{1}\"".format(msg.strip(), regex))
+                        self.receive_buffer = bytes(msg[match.end()+1:])
+                        del msg[match.end():]
+                        return bytes(msg)
+        except socket.timeout as e:
+            self.logger.error("no complete message within %ss" % (timeout))
+            self._handleSocketError(e)
+            raise
         except socket.error as e:
             self._handleSocketError(e)
 
 
     def recv_submsg(self, length):
         # get the message
-        msg = b''
-        while length > 0:
-            self.logger.debug("  submsg len: " + str(length))
-            # TODO
-            self.socket.settimeout(10)
-            submsg = self.socket.recv(length)
-            length -= len(submsg)
-            #self.logger.debug(submsg)
-            msg += submsg
-        if (type(msg) is str):
-            msg = bytearray(msg.decode('utf-8'), 'utf-8')
-        if (type(msg) is bytes):
-            msg = bytearray(msg)
-        #self.logger.debug(str(msg))
+        self.__fill(length, self.__deadline(self.RECV_TIMEOUT))
+        msg = self._recv_buffer[self._recv_start:self._recv_start + length]
+        self._recv_start += length
         return msg
 
 
@@ -264,30 +477,160 @@ class LowLevel(object):
             sys.stdout.write(b'\n')
 
 
-    def __get_header(self):
-        header = b''
-        header_length = 4
-        while header_length > 0:
-            self.logger.debug("  remaining header len: {}".format(header_length))
+    def __terminator(self, regex):
+        '''
+        Return the ReplyTerminator for regex,
+        compiled once per connection.
+        '''
+        terminator = self._terminators.get(regex)
+        if terminator is None:
+            terminator = self._terminators[regex] = ReplyTerminator(regex)
+        return terminator
+
+
+    def __fill(self, length, deadline=None):
+        '''
+        Make sure at least length bytes are buffered,
+        receiving straight into the free end of the buffer.
+        Data already buffered is only moved when the buffer runs out of room,
+        and the buffer only grows when a single frame does not fit,
+        so every received byte is copied a constant number of times.
+        Waits for data until deadline (see __deadline).
+        '''
+        while self._recv_end - self._recv_start < length:
             self.__check_socket_connection()
-            # TODO
-            self.socket.settimeout(10)
-            submsg = self.socket.recv(header_length)
-            header_length -= len(submsg)
-            header += submsg
-        if len(header) == 0:
-            self.logger.debug("received empty header, assuming connection is closed")
-            raise SocketEmptyHeader()
+            self.__selector()
+            if self._recv_start + length > len(self._recv_buffer):
+                self.__compact(length)
+            view = memoryview(self._recv_buffer)[self._recv_end:]
+            try:
+                received = self.socket.recv_into(view)
+            except BlockingIOError:
+                # nothing to read yet
+                received = None
+            finally:
+                view.release()
+            if received is None:
+                self.__wait(selectors.EVENT_READ, deadline)
+            elif received == 0:
+                self.logger.debug("received empty header, assuming connection is closed")
+                raise SocketEmptyHeader()
+            else:
+                self._recv_end += received
+            if self.stats is not None:
+                self.stats.recv_calls += 1
+                if received:
+                    self.stats.bytes_received += received
+
+
+    def __sendall(self, data):
+        '''
+        Send all of data over the non-blocking socket.
+        '''
+        self.__selector()
+        view = memoryview(data)
+        try:
+            while view:
+                try:
+                    sent = self.socket.send(view)
+                except BlockingIOError:
+                    self.__wait(selectors.EVENT_WRITE, None)
+                else:
+                    view = view[sent:]
+                    if self.stats is not None:
+                        self.stats.bytes_sent += sent
+        finally:
+            view.release()
+
+
+    def __deadline(self, timeout):
+        if timeout is None:
+            return None
+        return time.monotonic() + timeout
+
+
+    def __selector(self):
+        '''
+        Return the selector for the current socket,
+        switching the socket to non-blocking mode when it is first used.
+        Blocking is left to the selector,
+        so no timeout has to be set on the socket before each receive.
+        '''
+        if self._selector_socket is not self.socket:
+            if self._selector is not None:
+                self._selector.close()
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self.socket, selectors.EVENT_READ)
+            self._selector_socket = self.socket
+            self.socket.setblocking(False)
+        return self._selector
+
+
+    def __wait(self, events, deadline):
+        '''
+        Wait until the socket is ready for events,
+        raise socket.timeout if the deadline passes first.
+        '''
+        selector = self.__selector()
+        if selector.get_key(self.socket).events != events:
+            selector.modify(self.socket, events)
+        if deadline is None:
+            timeout = None
         else:
-            return self.__get_header_data(header)
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                self.__timed_out()
+        if not selector.select(timeout):
+            self.__timed_out()
 
 
-    def __get_header_data(self, header):
-        # struct.unpack:
-        #   !: network (big/little endian conversion)
-        #   i: integer (4 bytes)
-        data = struct.unpack("!i", header)[0]
-        return data
+    def __timed_out(self):
+        if self.stats is not None:
+            self.stats.timeouts += 1
+        raise socket.timeout("timed out")
+
+
+    def __compact(self, length):
+        '''
+        Move the unread data to the start of the buffer,
+        growing the buffer if length bytes would not fit.
+        '''
+        unread = self._recv_end - self._recv_start
+        if length > len(self._recv_buffer):
+            size = len(self._recv_buffer)
+            while size < length:
+                size *= 2
+            buf = bytearray(size)
+            buf[:unread] = self._recv_buffer[self._recv_start:self._recv_end]
+            self._recv_buffer = buf
+        else:
+            self._recv_buffer[:unread] = self._recv_buffer[self._recv_start:self._recv_end]
+        self._recv_start = 0
+        self._recv_end = unread
+
+
+    def __get_frame(self, deadline=None):
+        '''
+        Receive the next frame.
+        Returns (header, data), where header is the frame length or a signal.
+        data is None for signals, otherwise a memoryview into the receive buffer,
+        which is only valid until the next receive and must be released.
+        Nothing is consumed from the buffer until the whole frame has arrived,
+        so a timeout can be retried.
+        '''
+        self.__fill(4, deadline)
+        header = struct.unpack_from("!i", self._recv_buffer, self._recv_start)[0]
+        if self.stats is not None:
+            self.stats.frames_received += 1
+        if header <= 0:
+            self._recv_start += 4
+            return (header, None)
+        if self._trace:
+            self.logger.debug("  submsg len: " + str(header))
+        self.__fill(4 + header, deadline)
+        start = self._recv_start + 4
+        self._recv_start = start + header
+        return (header, memoryview(self._recv_buffer)[start:self._recv_start])
 
 
     def is_end_of_message(self, data):
@@ -308,26 +651,18 @@ class LowLevel(object):
         client confirm the dir is the correct director
         '''
 
-        # get the timestamp
-        # here is the console
         # to confirm the director so can do this on bconsole`way
-        rand = random.randint(1000000000, 9999999999)
-        #chal = "<%u.%u@%s>" %(rand, int(time.time()), self.dirname)
-        chal = '<%u.%u@%s>' %(rand, int(time.time()), clientname)
-        msg = bytearray('auth cram-md5 %s ssl=%d\n' %(chal, tls_local_need), 'utf-8')
+        chal, msg = CramMd5.challenge(clientname, tls_local_need)
         # send the confirmation
         self.send(msg)
         # get the response
         msg = self.recv()
-        if msg[-1] == 0:
+        if msg and msg[-1] == 0:
             del msg[-1]
         self.logger.debug("received: " + str(msg))
 
         # hash with password
-        hmac_md5 = hmac.new(bytes(bytearray(password, 'utf-8')))
-        hmac_md5.update(bytes(bytearray(chal, 'utf-8')))
-        bbase64compatible = BareosBase64().string_to_base64(bytearray(hmac_md5.digest()), True)
-        bbase64notcompatible = BareosBase64().string_to_base64(bytearray(hmac_md5.digest()), False)
+        bbase64compatible, bbase64notcompatible = CramMd5.expected_responses(password, chal)
         self.logger.debug("string_to_base64, compatible:     " + str(bbase64compatible))
         self.logger.debug("string_to_base64, not compatible: " + str(bbase64notcompatible))
 
@@ -349,38 +684,27 @@ class LowLevel(object):
         the dir confirm the password and the config is correct
         '''
         # receive from the director
-        chal = ""
-        ssl = 0
         result = False
-        msg = ""
         try:
             msg = self.recv()
         except RuntimeError:
             self.logger.error("RuntimeError exception in recv")
             return (0, True, False)
-        
+
         # invalid username
         if ProtocolMessages.is_not_authorized(msg):
             self.logger.error("failed: " + str(msg))
             return (0, True, False)
-        
+
         # check the receive message
         self.logger.debug("(recv): " + str(msg))
-        
-        msg_list = msg.split(b" ")
-        chal = msg_list[2]
-        # get th timestamp and the tle info from director response
-        ssl = int(msg_list[3][4])
-        compatible = True
-        # hmac chal and the password
-        hmac_md5 = hmac.new(bytes(bytearray(password, 'utf-8')))
-        hmac_md5.update(bytes(chal))
 
-        # base64 encoding
-        msg = BareosBase64().string_to_base64(bytearray(hmac_md5.digest()))
+        # get the challenge and the tls info from director response
+        chal, ssl = CramMd5.parse_challenge(msg)
+        compatible = True
 
-        # send the base64 encoding to director
-        self.send(msg)
+        # send the base64 encoded hmac of the challenge to director
+        self.send(CramMd5.response(password, chal))
         received = self.recv()
         if  ProtocolMessages.is_auth_ok(received):
             result = True
@@ -391,19 +715,26 @@ class LowLevel(object):
 
     def __set_status(self, status):
         self.status = status
-        status_text = Constants.get_description(status)
-        self.logger.debug(str(status_text) + " (" + str(status) + ")")
+        if self._trace:
+            status_text = Constants.get_description(status)
+            self.logger.debug(str(status_text) + " (" + str(status) + ")")
 
 
-    def has_data(self):
+    def has_data(self, timeout=0.1):
+        '''
+        Wait up to timeout seconds for data from the director.
+        '''
         self.__check_socket_connection()
-        timeout = 0.1
-        readable, writable, exceptional = select([self.socket], [], [], timeout)
-        return readable
+        if self._recv_end > self._recv_start:
+            return True
+        try:
+            self.__wait(selectors.EVENT_READ, self.__deadline(timeout))
+        except socket.timeout:
+            return False
+        return True
 
 
     def get_to_prompt(self):
-        time.sleep(0.1)
         if self.has_data():
             msg = self.recv_msg()
             self.logger.debug("received message: " + str(msg))
@@ -425,4 +756,4 @@ class LowLevel(object):
 
     def _handleSocketError(self, exception):
         self.logger.error("socket error:" + str(exception))
-        self.socket = None
+        self.__close()
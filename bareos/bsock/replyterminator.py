@@ -0,0 +1,67 @@
+"""
+Detection of the line that terminates a reply from the bareos-director.
+"""
+
+import re
+
+
+def starts_with_status(regex):
+    '''
+    Whether regex only matches lines starting with 4 digits,
+    like b'^\\d\\d\\d\\d OK.*$' or b'^1000 OK.*$'.
+    '''
+    # alternatives, like b'^\\d\\d\\d\\d|^Error', could match anything
+    if b'|' in regex or not regex.startswith(b'^'):
+        return False
+    rest = regex[1:]
+    for i in range(4):
+        if rest.startswith(br'\d'):
+            rest = rest[2:]
+        elif rest[:1].isdigit():
+            rest = rest[1:]
+        else:
+            return False
+    # a quantifier could make the last digit optional
+    return rest[:1] not in (b'*', b'?', b'{')
+
+
+class ReplyTerminator(object):
+    '''
+    A precompiled regex matching the line that ends a reply, like b'^1000 OK.*$',
+    searched incrementally while the reply arrives.
+
+    Bareos indicates the end of a command result by a line starting with 4 digits.
+    When the regex requires that, only lines starting with 4 digits
+    are handed to the regex, all others are skipped with a plain newline search.
+    '''
+
+    def __init__(self, regex):
+        self.regex = regex
+        self.pattern = re.compile(regex, re.MULTILINE)
+        self.status_prefix = starts_with_status(regex)
+
+
+    def search(self, msg, pos=0):
+        '''
+        Search msg for the terminating line, starting at pos,
+        which must be the start of a line.
+        Returns a tuple of the match (or None)
+        and the start of the last line searched.
+        As the last line might still be incomplete,
+        the next search must start there.
+        '''
+        if not self.status_prefix:
+            match = self.pattern.search(msg, pos)
+            if match:
+                return (match, msg.rfind(b'\n', pos, match.start()) + 1 or pos)
+            return (None, msg.rfind(b'\n', pos) + 1 or pos)
+
+        while True:
+            if msg[pos:pos + 4].isdigit():
+                match = self.pattern.match(msg, pos)
+                if match:
+                    return (match, pos)
+            newline = msg.find(b'\n', pos)
+            if newline < 0:
+                return (None, pos)
+            pos = newline + 1
@@ -0,0 +1,144 @@
+"""
+Counters and latency histograms of a connection to a bareos daemon.
+"""
+
+import bisect
+
+class LatencyHistogram(object):
+    """
+    Latencies in buckets growing by factors of about 2, from 1ms to 5 minutes.
+    """
+
+    # upper bounds of the buckets in seconds, the last bucket has no bound
+    BOUNDS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+              1, 2, 5, 10, 20, 50, 100, 300]
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+
+    def add(self, seconds):
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+
+    def merge(self, other):
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+
+    def percentile(self, percent):
+        '''
+        Upper bound of the bucket containing the given percentile,
+        or the maximum for the last bucket.
+        '''
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                if i < len(self.BOUNDS):
+                    return min(self.BOUNDS[i], self.max)
+                return self.max
+        return self.max
+
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean(),
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class Stats(object):
+    """
+    What a connection spent its time on.
+    Assign an instance to LowLevel.stats, or use LowLevel.measure(),
+    to have the connection record into it.
+    """
+
+    COUNTERS = ('bytes_sent', 'bytes_received', 'frames_sent', 'frames_received',
+                'recv_calls', 'timeouts', 'handshakes')
+
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+        self.handshake_latency = LatencyHistogram()
+        # first word of a command, like "list" -> LatencyHistogram
+        self.commands = {}
+
+
+    def add_command(self, command, seconds):
+        name = command.split(None, 1)[0] if command.strip() else ''
+        histogram = self.commands.get(name)
+        if histogram is None:
+            histogram = self.commands[name] = LatencyHistogram()
+        histogram.add(seconds)
+
+
+    def add_handshake(self, seconds):
+        self.handshakes += 1
+        self.handshake_latency.add(seconds)
+
+
+    def merge(self, other):
+        '''
+        Add the counters and latencies of other.
+        '''
+        for counter in self.COUNTERS:
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+        self.handshake_latency.merge(other.handshake_latency)
+        for name, histogram in other.commands.items():
+            if name not in self.commands:
+                self.commands[name] = LatencyHistogram()
+            self.commands[name].merge(histogram)
+
+
+    def as_dict(self):
+        result = dict((counter, getattr(self, counter)) for counter in self.COUNTERS)
+        result['handshake_latency'] = self.handshake_latency.as_dict()
+        result['commands'] = dict((name, histogram.as_dict())
+                                  for name, histogram in self.commands.items())
+        return result
+
+
+    def __str__(self):
+        lines = ["%s: %d" % (counter, getattr(self, counter)) for counter in self.COUNTERS]
+        for name, histogram in [('handshake', self.handshake_latency)] + sorted(self.commands.items()):
+            if histogram.count:
+                lines.append("%s: %d calls, mean %.3fs, p90 %.3fs, max %.3fs"
+                             % (name, histogram.count, histogram.mean(), histogram.percentile(90), histogram.max))
+        return "\n".join(lines)
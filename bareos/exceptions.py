@@ -31,3 +31,9 @@ class AuthenticationError(Error):
     error during Authentication
     """
     pass
+
+class JsonRpcError(Error):
+    """
+    the director answered with a JSON-RPC error
+    """
+    pass
@@ -1,4 +1,5 @@
 #__all__ = [ "bconsole" ]
-from   bareos.util.bareosbase64 import BareosBase64
+from   bareos.util.bareosbase64 import BareosBase64, BASE64
+from   bareos.util.jsonstream   import JsonStream
 from   bareos.util.password     import Password
 from   bareos.util.path         import Path
\ No newline at end of file
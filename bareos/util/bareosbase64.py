@@ -3,9 +3,17 @@ Bacula and therefore Bareos specific implementation of a base64 decoder.
 This class offers functions to handle this.
 """
 
+from   base64 import b64decode
+import binascii
+import itertools
+import struct
+
 class BareosBase64(object):
     '''
     Bacula and therefore Bareos specific implementation of a base64 decoder
+
+    The conversion tables are built once, on import,
+    so instances are cheap, but BASE64 can be used instead of creating new ones.
     '''
 
     base64_digits = \
@@ -15,11 +23,17 @@ class BareosBase64(object):
          'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z',
          '0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '+', '/']
 
-    def __init__(self):
-        '''
-        Initialize the Base 64 conversion routines
-        '''
-        self.base64_map = dict(list(zip(self.base64_digits, list(range(0, 64)))))
+    base64_map = dict(zip(base64_digits, range(0, 64)))
+
+    # the two digits of every 12 bit value, to encode 3 bytes with 2 lookups
+    base64_pairs = [(a + b).encode('ascii') for a, b in itertools.product(base64_digits, repeat=2)]
+
+    # Bareos encodes 64 bit values in at most 11 digits
+    MAX_DIGITS = 11
+    INT64_MAX = (1 << 63) - 1
+
+    # number of values -> struct.Struct to unpack them
+    unpackers = {}
 
     @staticmethod
     def twos_comp(val, bits):
@@ -30,24 +44,82 @@ class BareosBase64(object):
 
     def base64_to_int(self, base64):
         '''
-        Convert the Base 64 characters in base64 to a value.
+        Convert the Base 64 characters in base64 to a signed 64 bit value,
+        wrapped like Bareos does, the same as base64_to_ints.
         '''
+        if not isinstance(base64, str):
+            base64 = base64.decode('ascii')
         value = 0
-        first = 0
         neg = False
 
-        if base64[0] == '-':
+        if base64[:1] == '-':
             neg = True
-            first = 1
+            base64 = base64[1:]
+
+        if len(base64) > self.MAX_DIGITS:
+            raise ValueError("base64 value %r exceeds 64 bits" % (base64))
+        base64_map = self.base64_map
+        try:
+            for digit in base64:
+                value = (value << 6) | base64_map[digit]
+        except KeyError:
+            raise ValueError("invalid base64 digit %r in %r" % (digit, base64))
+
+        value = self.twos_comp(value & ((1 << 64) - 1), 64)
+        if neg:
+            value = -value
+            if value > self.INT64_MAX:
+                value -= 1 << 64
+        return value
+
+    def base64_to_ints(self, values):
+        '''
+        Convert many signed 64 bit values at once,
+        like the fields of a stat packet in a file attribute stream.
+        values: list of base64 strings, or one string of them separated by spaces.
+        Returns a list of ints, wrapped to signed 64 bit like Bareos does,
+        the same as base64_to_int.
+        '''
+        if isinstance(values, (bytes, bytearray)):
+            values = values.decode('ascii')
+        if isinstance(values, str):
+            values = values.split()
+        else:
+            values = [value if isinstance(value, str) else value.decode('ascii') for value in values]
+        if not values:
+            return []
+
+        negative = []
+        if '-' in ''.join(values):
+            for i, value in enumerate(values):
+                if value[:1] == '-':
+                    negative.append(i)
+                    values[i] = value[1:]
 
-        for i in range(first, len(base64)):
-            value = value << 6
-            try:
-                value += self.base64_map[base64[i]]
-            except KeyError:
-                print("KeyError:", i)
+        longest = max(values, key=len)
+        if len(longest) > self.MAX_DIGITS:
+            raise ValueError("base64 value %r exceeds 64 bits" % (longest))
+        # Pad every value to 12 digits, which decode to 9 bytes,
+        # and decode them all with one call: a zero byte and a 64 bit value each.
+        padded = ''.join([value.rjust(12, 'A') for value in values])
+        try:
+            data = b64decode(padded, validate=True)
+        except binascii.Error as e:
+            raise ValueError("invalid base64 values: %s" % (e))
+        result = list(self.__unpacker(len(values)).unpack(data))
 
-        return -value if neg else value
+        for i in negative:
+            result[i] = -result[i]
+            if result[i] > self.INT64_MAX:
+                result[i] -= 1 << 64
+        return result
+
+    def __unpacker(self, count):
+        unpacker = self.unpackers.get(count)
+        if unpacker is None:
+            # unsigned 64 bit values read as signed, to wrap them like Bareos
+            unpacker = self.unpackers[count] = struct.Struct('>' + 'xq' * count)
+        return unpacker
 
     def int_to_base64(self, value):
         """
@@ -58,42 +130,58 @@ class BareosBase64(object):
             result = "-"
             value = -value
 
-        while value:
-            charnumber = value % 0x3F
-            result += self.base64_digits[charnumber]
+        digits = []
+        while True:
+            digits.append(self.base64_digits[value & 0x3F])
             value = value >> 6
-        return result
+            if not value:
+                break
+        return result + "".join(reversed(digits))
 
     def string_to_base64(self, string, compatible=False):
         """
         Convert a string to base64
+
+        Unless compatible, the bytes are taken as signed chars, like Bacula does:
+        a byte >= 128 sets the bits left over from the previous byte.
         """
-        buf = ""
-        reg = 0
-        rem = 0
-        char = 0
-        i = 0
-        while i < len(string):
-            if rem < 6:
-                reg <<= 8
-                char = string[i]
-                if not compatible:
-                    if char >= 128:
-                        char = self.twos_comp(char, 8)
-                reg |= char
-                i += 1
-                rem += 8
-
-            save = reg
-            reg >>= (rem - 6)
-            buf += self.base64_digits[reg & 0x3F]
-            reg = save
-            rem -= 6
-
-        if rem:
+        string = bytes(string)
+        pairs = self.base64_pairs
+        buf = []
+        full = len(string) - len(string) % 3
+        for i in range(0, full, 3):
+            c1, c2, c3 = string[i], string[i+1], string[i+2]
+            group = (c1 << 16) | (c2 << 8) | c3
+            if not compatible:
+                if c2 & 0x80:
+                    group |= 0x30000
+                if c3 & 0x80:
+                    group |= 0xF00
+            buf.append(pairs[group >> 12])
+            buf.append(pairs[group & 0xFFF])
+
+        rest = string[full:]
+        if rest:
+            c1 = rest[0]
+            if len(rest) == 1:
+                # 6 bits, 2 left over
+                reg = c1
+                rem = 2
+            else:
+                c2 = rest[1]
+                reg = (c1 << 8) | c2
+                if not compatible and c2 & 0x80:
+                    reg |= 0x300
+                rem = 4
+                buf.append(self.base64_digits[reg >> 10].encode('ascii'))
+            buf.append(self.base64_digits[(reg >> rem) & 0x3F].encode('ascii'))
             mask = (1 << rem) - 1
             if compatible:
-                buf += self.base64_digits[(reg & mask) << (6 - rem)]
+                buf.append(self.base64_digits[(reg & mask) << (6 - rem)].encode('ascii'))
             else:
-                buf += self.base64_digits[reg & mask]
-        return bytearray(buf, 'utf-8')
+                buf.append(self.base64_digits[reg & mask].encode('ascii'))
+        return bytearray(b''.join(buf))
+
+
+# shared instance
+BASE64 = BareosBase64()
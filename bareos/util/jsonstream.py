@@ -0,0 +1,162 @@
+"""
+Incremental decoding of JSON-RPC responses of the director.
+"""
+
+from   bareos.exceptions import JsonRpcError
+import codecs
+import json
+
+class JsonStream(object):
+    """
+    Decode a JSON-RPC response from chunks of bytes, as they arrive,
+    and yield the items of the lists in its result one by one.
+
+    Only the item being decoded and the undecoded rest of the current chunk
+    are kept in memory, never the whole response.
+    """
+
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+
+    def items(self, key=None, keys=None):
+        '''
+        Yield the items of the result.
+        key: member of the result that contains the items,
+        by default the only list in the result.
+        keys: only keep these members of each item.
+        '''
+        char = self.__peek()
+        if char == '':
+            # empty response
+            return
+        if char != '{':
+            self.__fail("expected a JSON-RPC response")
+        self.pos += 1
+        for name in self.__members():
+            if name == 'result':
+                for item in self.__result(key):
+                    if keys is not None and isinstance(item, dict):
+                        item = dict((k, item[k]) for k in keys if k in item)
+                    yield item
+            elif name == 'error':
+                raise JsonRpcError(self.__value())
+            else:
+                self.__value()
+
+
+    def __result(self, key):
+        char = self.__peek()
+        if char == '[':
+            for item in self.__array():
+                yield item
+        elif char == '{':
+            self.pos += 1
+            found = None
+            for name in self.__members():
+                if self.__peek() != '[' or (key is not None and name != key):
+                    self.__value()
+                elif found is not None:
+                    raise JsonRpcError("result contains multiple lists, choose one by key: %s, %s" % (found, name))
+                else:
+                    found = name
+                    for item in self.__array():
+                        yield item
+        else:
+            raise JsonRpcError("result is not a list: %s" % (self.__value()))
+
+
+    def __members(self):
+        '''
+        Yield the member names of an object, whose "{" has been consumed.
+        The caller has to consume each value before the next name.
+        '''
+        if self.__peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            name = self.__value()
+            if not isinstance(name, str) or self.__peek() != ':':
+                self.__fail("expected a member name")
+            self.pos += 1
+            yield name
+            char = self.__peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                self.__fail("expected ',' or '}'")
+
+
+    def __array(self):
+        '''
+        Yield the values of an array.
+        '''
+        self.pos += 1
+        if self.__peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.__value()
+            char = self.__peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                self.__fail("expected ',' or ']'")
+
+
+    def __value(self):
+        '''
+        Decode the next complete value.
+        '''
+        self.__peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError as e:
+                if self.eof:
+                    raise JsonRpcError("invalid JSON-RPC response: %s" % (e))
+            # read at least as much again as we have,
+            # so large values are not decoded over and over
+            needed = 2 * (len(self.buffer) - self.pos)
+            while not self.eof and len(self.buffer) - self.pos < needed:
+                self.__read()
+
+
+    def __peek(self):
+        '''
+        Skip whitespace and return the next character, or '' at the end.
+        '''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos+1]
+            self.__read()
+
+
+    def __read(self):
+        try:
+            chunk = next(self.chunks)
+            text = self.decoder.decode(chunk)
+        except StopIteration:
+            text = self.decoder.decode(b'', True)
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+
+
+    def __fail(self, message):
+        raise JsonRpcError("invalid JSON-RPC response, %s at: %s" % (message, self.buffer[self.pos:self.pos+40]))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the Bareos base64 codec in bareos.util: cram-md5 responses
+encoded per handshake, and stat packets of a 'list files' like listing decoded
+one value at a time with base64_to_int compared to a whole packet per call with
+base64_to_ints.
+
+Run from the repository root with: python -m benchmarks.bench_base64 [files]
+"""
+
+import hashlib
+import sys
+import time
+
+from bareos.util.bareosbase64 import BASE64, BareosBase64
+
+STAT = "gB DL+b IGk B Po Po A Cp BAA I BhjW2x BhjW2x BhjW2x A A C"
+
+
+def encode_digests(count: int):
+    digest = bytearray(hashlib.md5(b"challenge").digest())
+    for _ in range(count):
+        # A handshake encodes the digest both ways, on a new instance each time.
+        BareosBase64().string_to_base64(digest, True)
+        BareosBase64().string_to_base64(digest, False)
+
+
+def decode_per_value(packets):
+    return [[BASE64.base64_to_int(value) for value in p.split()] for p in packets]
+
+
+def decode_bulk(packets):
+    return [BASE64.base64_to_ints(packet) for packet in packets]
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    start = time.perf_counter()
+    encode_digests(files // 10)
+    elapsed = time.perf_counter() - start
+    print(f"cram-md5 responses {files // 10} in {elapsed * 1000:.1f} ms")
+
+    packets = [STAT] * files
+    for name, decode in (
+        ("base64_to_int", decode_per_value),
+        ("base64_to_ints", decode_bulk),
+    ):
+        start = time.perf_counter()
+        decode(packets)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<15} {files} stat packets in {elapsed * 1000:.1f} ms "
+            f"({files / elapsed:,.0f} packets/sec)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Startup time of every brs_backup subcommand: a fresh interpreter importing main and
+dispatching '<subcommand> --help', which is what each run pays before doing any work.
+Also checks that no backend (database, git, director, broker) is imported until a
+command uses it.
+
+Exits with 1 when a subcommand's median startup is over the budget in milliseconds,
+or a backend is imported, so regressions show up.
+
+Run from the repository root with: python -m benchmarks.bench_import_time [runs]
+[budget_ms]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import main as brs_backup
+
+BUDGET_MS = 200
+
+# Modules only imported by the commands using them, see lazy.load.
+BACKENDS = ("asyncio", "bareos.bsock", "git", "mysql.connector", "sqlite3")
+
+CHILD = """
+import contextlib, io, json, sys, time
+start = time.perf_counter()
+import main
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        main.cli.main(sys.argv[1:] + ["--help"], "brs_backup", standalone_mode=False)
+    except SystemExit:
+        pass
+elapsed = time.perf_counter() - start
+backends = [name for name in %r if name in sys.modules]
+print(json.dumps({"ms": elapsed * 1000, "backends": backends}))
+""" % (BACKENDS,)
+
+
+def measure(args, runs: int):
+    """Median milliseconds of the process and of importing main and dispatching,
+    and the backends imported.
+    """
+    process_ms = []
+    startup_ms = []
+    backends = set()
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD] + args,
+            stdout=subprocess.PIPE,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(brs_backup.__file__)),
+        ).stdout
+        process_ms.append((time.perf_counter() - start) * 1000)
+
+        result = json.loads(output.decode("utf-8").splitlines()[-1])
+        startup_ms.append(result["ms"])
+        backends.update(result["backends"])
+
+    return statistics.median(process_ms), statistics.median(startup_ms), backends
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else BUDGET_MS
+
+    failed = False
+    for command in [""] + sorted(brs_backup.cli.commands):
+        process, startup, backends = measure([command] if command else [], runs)
+        over = startup > budget
+        failed = failed or over or bool(backends)
+        print(
+            f"{'brs_backup ' + command:<28} {startup:7.1f}ms startup "
+            f"{process:7.1f}ms process"
+            f"{'  OVER BUDGET' if over else ''}"
+            f"{'  imports ' + ', '.join(sorted(backends)) if backends else ''}"
+        )
+
+    print(f"budget {budget:.0f}ms, median of {runs} runs")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
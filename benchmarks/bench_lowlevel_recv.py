@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the receive path of bareos.bsock.LowLevel: time to receive a single
+multi-megabyte command result made of line sized frames, as sent for 'llist jobs'
+or 'list files', compared to the previous implementation that appended each frame
+to an immutable bytes buffer.
+
+The time per megabyte stays flat for LowLevel.recv_msg, but grows with the
+response size for the previous implementation.
+
+Run from the repository root with: python -m benchmarks.bench_lowlevel_recv [MB ...]
+"""
+
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+
+from bareos.bsock.constants import Constants
+from bareos.bsock.lowlevel import LowLevel
+
+# The previous implementation is quadratic, only run it up to this size.
+LEGACY_MAX_MB = 4
+
+
+def make_response(megabytes: float) -> bytes:
+    """A response of roughly the given size with one frame per line, ending with a
+    BNET_EOD signal.
+    """
+    frames = []
+    size = 0
+    i = 0
+    while size < megabytes * 1024 * 1024:
+        line = (
+            b"| %8d | backup-u%07d | 2019-01-01 00:00:00 | B  | F  | %10d | T |\n"
+            % (i, i, i * 4096)
+        )
+        frames.append(struct.pack("!i", len(line)) + line)
+        size += len(line)
+        i += 1
+    frames.append(struct.pack("!i", Constants.BNET_EOD))
+    return b"".join(frames)
+
+
+def legacy_recv_msg(sock, regex=rb"^\d\d\d\d OK.*$"):
+    """The previous LowLevel.recv_msg, without logging and timeouts."""
+
+    def recv_exactly(length):
+        msg = b""
+        while length > 0:
+            submsg = sock.recv(length)
+            length -= len(submsg)
+            msg += submsg
+        return msg
+
+    receive_buffer = b""
+    while True:
+        header = struct.unpack("!i", recv_exactly(4))[0]
+        if header <= 0:
+            return receive_buffer
+        submsg = bytearray(recv_exactly(header))
+        lastlineindex = receive_buffer.rfind(b"\n") + 1
+        receive_buffer += submsg
+        match = re.search(regex, receive_buffer[lastlineindex:], re.MULTILINE)
+        if match:
+            return receive_buffer[0 : lastlineindex + match.end()]
+
+
+def bench(receive, response: bytes) -> float:
+    director, client = socket.socketpair()
+    try:
+        sender = threading.Thread(target=director.sendall, args=(response,))
+        start = time.perf_counter()
+        sender.start()
+        receive(client)
+        elapsed = time.perf_counter() - start
+        sender.join()
+        return elapsed
+    finally:
+        director.close()
+        client.close()
+
+
+def recv_msg(sock):
+    bsock = LowLevel()
+    bsock.socket = sock
+    return bsock.recv_msg()
+
+
+def main():
+    sizes = [float(arg) for arg in sys.argv[1:]] or [1, 2, 4, 8, 16]
+
+    for megabytes in sizes:
+        response = make_response(megabytes)
+        for name, receive in (
+            ("previous recv_msg", legacy_recv_msg),
+            ("LowLevel.recv_msg", recv_msg),
+        ):
+            if receive is legacy_recv_msg and megabytes > LEGACY_MAX_MB:
+                continue
+
+            elapsed = bench(receive, response)
+            print(
+                f"{name:<18} {megabytes:>5g} MB in {elapsed:.3f}s "
+                f"({elapsed / megabytes * 1000:.1f} ms/MB)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark for renderer.py: renders/sec for a batch of Job and FileSet resources,
+compared to re-reading and formatting the template file for every resource.
+
+Run from the repository root with: python -m benchmarks.bench_renderer [count]
+"""
+
+import os
+import sys
+import time
+
+import renderer
+
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(renderer.__file__)), "templates"
+)
+
+
+def make_resources(count: int):
+    jobs = [
+        {
+            "name": f"u{i:07d}",
+            "fileset": f"u{i:07d}",
+            "client": "bareos-fd",
+            "jobdef": "DefaultJob",
+            "storage": "S3_Object",
+        }
+        for i in range(count)
+    ]
+    filesets = [
+        {
+            "name": f"u{i:07d}",
+            "description": f"Home directory for u{i:07d}",
+            "file_location": f"/uufs/chpc.utah.edu/common/home/u{i:07d}",
+            "compression": "GZIP",
+        }
+        for i in range(count)
+    ]
+    return jobs, filesets
+
+
+def bench_reread(jobs, filesets):
+    """The previous approach: open, read and str.format per resource."""
+    for values in jobs:
+        with open(os.path.join(TEMPLATE_DIR, "job.txt"), "r") as f:
+            f.read().format(**values)
+    for values in filesets:
+        with open(os.path.join(TEMPLATE_DIR, "fileset.txt"), "r") as f:
+            f.read().format(**values)
+
+
+def bench_render(jobs, filesets):
+    for values in jobs:
+        renderer.render("job", **values)
+    for values in filesets:
+        renderer.render("fileset", **values)
+
+
+def bench_render_many(jobs, filesets):
+    renderer.render_many("job", jobs)
+    renderer.render_many("fileset", filesets)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    jobs, filesets = make_resources(count)
+
+    for name, bench in (
+        ("re-read + str.format", bench_reread),
+        ("renderer.render", bench_render),
+        ("renderer.render_many", bench_render_many),
+    ):
+        start = time.perf_counter()
+        bench(jobs, filesets)
+        elapsed = time.perf_counter() - start
+
+        renders = 2 * count
+        print(
+            f"{name:<22} {renders} renders in {elapsed:.3f}s "
+            f"({renders / elapsed:,.0f} renders/sec)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for finding the end of a director reply in bareos.bsock: the time
+spent searching a 100k line reply for its terminating line as it arrives, using
+ReplyTerminator compared to the previous per frame 'rfind' and 're.search' from the
+start of the last line.
+
+Replies arrive either as one frame per line, or in large frames of many lines.
+
+Run from the repository root with: python -m benchmarks.bench_reply_terminator [lines]
+"""
+
+import re
+import sys
+import time
+
+from bareos.bsock.replyterminator import ReplyTerminator
+
+REGEX = rb"^\d\d\d\d OK.*$"
+
+
+def make_reply(lines: int):
+    """The lines of a 'list files' like reply, ending with a status line."""
+    reply = [
+        b"/uufs/chpc.utah.edu/common/home/u%07d/project/data/file-%06d.dat\n" % (i, i)
+        for i in range(lines)
+    ]
+    reply.append(b"1000 OK: bareos-dir Version: 17.2.4\n")
+    return reply
+
+
+def in_frames(lines, frame_size: int):
+    """Join lines into frames of about frame_size bytes, splitting lines across
+    frames like the director does.
+    """
+    data = b"".join(lines)
+    return [data[i : i + frame_size] for i in range(0, len(data), frame_size)]
+
+
+def search_previous(frames):
+    msg = bytearray()
+    for frame in frames:
+        lastlineindex = msg.rfind(b"\n") + 1
+        msg += frame
+        match = re.compile(REGEX, re.MULTILINE).search(msg, lastlineindex)
+        if match:
+            return match
+    return None
+
+
+def search_terminator(frames):
+    terminator = ReplyTerminator(REGEX)
+    msg = bytearray()
+    lastlineindex = 0
+    for frame in frames:
+        msg += frame
+        match, lastlineindex = terminator.search(msg, lastlineindex)
+        if match:
+            return match
+    return None
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    reply = make_reply(lines)
+
+    for shape, frames in (
+        ("1 line/frame", reply),
+        ("64 KB frames", in_frames(reply, 64 * 1024)),
+    ):
+        for name, search in (
+            ("previous re.search", search_previous),
+            ("ReplyTerminator", search_terminator),
+        ):
+            start = time.perf_counter()
+            match = search(frames)
+            elapsed = time.perf_counter() - start
+
+            assert match and match.group().startswith(b"1000 OK")
+            print(
+                f"{shape:<13} {name:<19} {lines} lines in {elapsed * 1000:.1f} ms "
+                f"({lines / elapsed:,.0f} lines/sec)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import os
+import signal
+import socket
+from typing import Optional
+
+import bareos.bsock
+import bareos.exceptions
+
+import logger
+import config
+import secrets
+
+LOGGER = logger.get_logger(__name__)
+
+# Seconds the director has to answer a keepalive.
+_KEEPALIVE_TIMEOUT = 10
+
+
+class BrokerUnavailable(Exception):
+    """No broker is listening on the socket."""
+
+
+class BrokerError(Exception):
+    """The broker failed to run a command."""
+
+
+def call(
+    command: str, path: Optional[str] = None, timeout: float = config.BROKER_TIMEOUT
+) -> str:
+    """Run a director command on one of the broker's sessions and return its output.
+
+    Raises BrokerUnavailable if no broker listens on 'path' (config.BROKER_SOCKET by
+    default), and BrokerError if the broker failed to run the command.
+    """
+    path = path or config.BROKER_SOCKET
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(path)
+        except OSError as e:
+            raise BrokerUnavailable(f"No broker listening on {path}: {e}") from e
+
+        sock.sendall(json.dumps({"command": command}).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    except socket.timeout as e:
+        raise BrokerError(f"No answer from the broker within {timeout}s") from e
+    finally:
+        sock.close()
+
+    if not line:
+        raise BrokerError("The broker closed the connection without an answer")
+
+    reply = json.loads(line)
+    if "error" in reply:
+        raise BrokerError(reply["error"])
+    return reply["result"]
+
+
+class Broker:
+    """Keeps authenticated director sessions open, so runs of brs_backup don't have to
+    connect and authenticate for every command.
+
+    Runs connect to a Unix socket and send JSON lines '{"command": ...}', answered
+    with '{"result": ...}' or '{"error": ...}'. Each command runs on the next idle
+    session, which reconnects transparently if the director went away. Idle sessions
+    are kept alive with BNET_HEARTBEAT signals every 'keepalive' seconds.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        sessions: Optional[int] = None,
+        keepalive: Optional[float] = None,
+    ):
+        self.path = path or config.BROKER_SOCKET
+        self.size = sessions or config.BROKER_SESSIONS
+        self.keepalive = keepalive or config.BROKER_KEEPALIVE
+        self.commands = 0
+        self._sessions = []
+        # Created in the event loop.
+        self._idle = None
+        self._closing = None
+        self._server = None
+        self._keepalive_task = None
+
+    def _new_session(self) -> bareos.bsock.AsyncDirectorConsole:
+        return bareos.bsock.AsyncDirectorConsole(
+            address=config.DIRECTOR_ADDRESS,
+            port=config.DIRECTOR_PORT,
+            password=bareos.bsock.Password(secrets.bconsole_password),
+        )
+
+    async def start(self) -> None:
+        self._check_socket()
+
+        self._idle = asyncio.Queue()
+        self._closing = asyncio.Event()
+        for _ in range(self.size):
+            session = self._new_session()
+            self._sessions.append(session)
+            self._idle.put_nowait(session)
+
+        # Authenticate up front, sessions that fail are retried when used.
+        for session in self._sessions:
+            try:
+                await session.open()
+            except (OSError, bareos.exceptions.Error) as e:
+                LOGGER.warning(f"Failed to open a director session: {e}")
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Only the user running the broker may use its sessions.
+        umask = os.umask(0o077)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        finally:
+            os.umask(umask)
+
+        self._keepalive_task = asyncio.ensure_future(self._keep_alive())
+        LOGGER.info(f"Broker listening on {self.path} with {self.size} sessions")
+
+    def _check_socket(self) -> None:
+        """Remove the socket of a broker that didn't shut down cleanly, refuse to
+        start if another broker is still listening on it.
+        """
+        if not os.path.exists(self.path):
+            return
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            os.remove(self.path)
+        else:
+            raise RuntimeError(f"A broker is already listening on {self.path}")
+        finally:
+            sock.close()
+
+    async def close(self) -> None:
+        if self._keepalive_task is not None:
+            # The event stops the task even if wait_for swallowed the cancellation.
+            self._closing.set()
+            self._keepalive_task.cancel()
+            try:
+                await self._keepalive_task
+            except asyncio.CancelledError:
+                pass
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+        for session in self._sessions:
+            await session.disconnect()
+
+        LOGGER.info(f"Broker stopped after {self.commands} commands")
+
+    async def run(self, command: str) -> str:
+        """Run a command on the next idle session."""
+        session = await self._idle.get()
+        try:
+            if not session.auth_credentials_valid:
+                await session.open()
+
+            result = await session.call(command)
+            if session.writer is None:
+                raise bareos.exceptions.ConnectionLostError(
+                    "Lost the connection to the director"
+                )
+        finally:
+            self._idle.put_nowait(session)
+
+        self.commands += 1
+        return result.decode("utf-8", "replace")
+
+    async def _handle(self, reader, writer) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    command = json.loads(line.decode())["command"]
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = {"error": f"Invalid request: {e}"}
+                else:
+                    LOGGER.debug(f"Running '{command}'")
+                    try:
+                        reply = {"result": await self.run(command)}
+                    except Exception as e:
+                        LOGGER.error(f"Failed to run '{command}': {e}")
+                        reply = {"error": str(e)}
+
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionResetError:
+            pass
+        finally:
+            writer.close()
+
+    async def _keep_alive(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.keepalive)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+            # Only sessions that are idle right now, busy ones are alive anyway.
+            for _ in range(self._idle.qsize()):
+                session = self._idle.get_nowait()
+                try:
+                    if session.auth_credentials_valid:
+                        await session.keepalive(_KEEPALIVE_TIMEOUT)
+                    else:
+                        await session.open()
+                except (OSError, bareos.exceptions.Error) as e:
+                    LOGGER.warning(f"Failed to keep a director session alive: {e}")
+                finally:
+                    self._idle.put_nowait(session)
+
+
+def serve(
+    path: Optional[str] = None,
+    sessions: Optional[int] = None,
+    keepalive: Optional[float] = None,
+) -> None:
+    """Run a broker until SIGINT or SIGTERM."""
+    loop = asyncio.new_event_loop()
+    broker = Broker(path, sessions, keepalive)
+
+    try:
+        loop.run_until_complete(broker.start())
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, loop.stop)
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(broker.close())
+        loop.close()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import time
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import logger
+import config
+
+LOGGER = logger.get_logger(__name__)
+
+# SQLite builds before 3.32 only allow 999 variables per statement.
+_SQLITE_CHUNK_SIZE = 500
+
+_CACHE = None
+_CACHE_OPENED = False
+
+
+class DirCache:
+    """An on-disk SQLite cache of user home and PE home directories.
+
+    Entries expire 'ttl' seconds after they were stored, and the least recently used
+    entries are evicted once there are more than 'max_entries' of them. Expired
+    entries are kept until evicted so they can still be served when the database is
+    unreachable.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = config.CACHE_TTL,
+        max_entries: int = config.CACHE_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "name TEXT PRIMARY KEY, "
+            "homedir_source TEXT, "
+            "pe_homedir_source TEXT, "
+            "expires REAL NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS users_last_used ON users (last_used)"
+        )
+        self._db.commit()
+
+    def get_many(
+        self, users: List[str], include_expired: bool = False
+    ) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """Return the cached '(homedir_source, pe_homedir_source)' of every given user
+        that has an entry, skipping expired entries unless include_expired is set.
+        """
+        now = time.time()
+        found = {}
+
+        users = iter(users)
+        while True:
+            chunk = list(islice(users, _SQLITE_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            s_str = ",".join(["?"] * len(chunk))
+            rows = self._db.execute(
+                f"SELECT name, homedir_source, pe_homedir_source, expires FROM users "
+                f"WHERE name in ({s_str})",
+                chunk,
+            )
+
+            for name, homedir_source, pe_homedir_source, expires in rows:
+                if include_expired or expires > now:
+                    found[name] = (homedir_source, pe_homedir_source)
+
+        if found:
+            self._db.executemany(
+                "UPDATE users SET last_used = ? WHERE name = ?",
+                ((now, name) for name in found),
+            )
+            self._db.commit()
+
+        return found
+
+    def put_many(self, rows: Iterable[Tuple[str, Optional[str], Optional[str]]]) -> int:
+        """Store '(user, homedir_source, pe_homedir_source)' rows, replacing existing
+        entries, and evict the least recently used entries over max_entries.
+
+        Returns the number of rows stored.
+        """
+        now = time.time()
+        expires = now + self.ttl
+        stored = 0
+
+        rows = iter(rows)
+        while True:
+            chunk = [
+                (name, homedir_source, pe_homedir_source, expires, now)
+                for name, homedir_source, pe_homedir_source in islice(
+                    rows, _SQLITE_CHUNK_SIZE
+                )
+            ]
+            if not chunk:
+                break
+
+            self._db.executemany(
+                "INSERT OR REPLACE INTO users "
+                "(name, homedir_source, pe_homedir_source, expires, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                chunk,
+            )
+            stored += len(chunk)
+
+        self._evict()
+        self._db.commit()
+
+        return stored
+
+    def _evict(self) -> None:
+        (count,) = self._db.execute("SELECT COUNT(*) FROM users").fetchone()
+        if count <= self.max_entries:
+            return
+
+        self._db.execute(
+            "DELETE FROM users WHERE name IN "
+            "(SELECT name FROM users ORDER BY last_used LIMIT ?)",
+            (count - self.max_entries,),
+        )
+        LOGGER.debug(f"Evicted {count - self.max_entries} entries from {self.path}")
+
+    def log_stats(self, hits: int, misses: int) -> None:
+        self.hits += hits
+        self.misses += misses
+        LOGGER.info(
+            f"Directory cache: {hits} hits, {misses} misses "
+            f"({self.hits} hits, {self.misses} misses in total)"
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def get_cache() -> Optional[DirCache]:
+    """Return the directory cache shared by the whole process, opening it on first
+    use. Returns 'None' when config.CACHE_LOCATION is unset or the cache could not be
+    opened, in which case every lookup goes to the database.
+    """
+    global _CACHE, _CACHE_OPENED
+
+    if not _CACHE_OPENED:
+        _CACHE_OPENED = True
+
+        if config.CACHE_LOCATION:
+            try:
+                _CACHE = DirCache(config.CACHE_LOCATION)
+            except (OSError, sqlite3.Error) as e:
+                LOGGER.warning(
+                    f"Running without the directory cache, failed to open "
+                    f"{config.CACHE_LOCATION}: {e}"
+                )
+
+    return _CACHE
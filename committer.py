@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import time
+from typing import ContextManager, Iterable, Optional
+
+from git import Repo
+
+import background
+import config
+import logger
+
+LOGGER = logger.get_logger(__name__)
+
+# Seconds after which a push worker that didn't check in is assumed dead.
+_WORKER_TIMEOUT = 600
+
+
+class Committer:
+    """Commits changed config files to the git repository at config.GIT_LOCATION
+    and pushes them.
+
+    Only the paths a run changed are staged, through the index, instead of scanning
+    the whole tree with 'git add -A'. Every run commits locally right away and queues
+    the commit in an outbox, a background worker pushes the queue once 'window'
+    seconds passed since the oldest queued commit. Queued commits are squashed into
+    one before pushing, and failed pushes are retried with exponential backoff.
+
+    The outbox is kept in the repository's git directory, guarded by a lock file
+    shared by all runs.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        window: Optional[float] = None,
+        remote: Optional[str] = None,
+    ):
+        self.path = path or config.GIT_LOCATION
+        self.window = config.GIT_COMMIT_WINDOW if window is None else window
+        self.remote = remote or config.GIT_REMOTE
+
+        self.repo = Repo(self.path)
+        if self.repo.bare:
+            err_msg = f"{self.path} is not an initialized git repo."
+            LOGGER.error(err_msg)
+            raise FileNotFoundError(err_msg)
+
+        self._state_path = os.path.join(self.repo.git_dir, "brs_backup-outbox.json")
+        self._lock_path = os.path.join(self.repo.git_dir, "brs_backup.lock")
+
+    def _locked(self) -> ContextManager[None]:
+        return background.locked(self._lock_path)
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self._state_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {
+                # Local commits that aren't pushed yet, oldest first.
+                "queue": [],
+                # Failed pushes since the last successful one.
+                "attempts": 0,
+                "retry_at": None,
+                "last_error": None,
+                "last_push": None,
+                "worker": None,
+            }
+
+    def _write_state(self, state: dict) -> None:
+        tmp_path = f"{self._state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._state_path)
+
+    @property
+    def _remote_ref(self) -> str:
+        return f"{self.remote}/{self.repo.active_branch.name}"
+
+    def _has_remote_ref(self) -> bool:
+        refs = self.repo.remote(self.remote).refs
+        return self._remote_ref in [ref.name for ref in refs]
+
+    def pending(self) -> int:
+        """Number of local commits that aren't pushed yet."""
+        with self._locked():
+            return len(self._read_state()["queue"])
+
+    def status(self) -> dict:
+        """The outbox: the number of queued commits, when the oldest was queued,
+        the failed pushes since the last successful one and the last push.
+        """
+        with self._locked():
+            state = self._read_state()
+        queue = state["queue"]
+        return {
+            "queued": len(queue),
+            "oldest": queue[0]["queued"] if queue else None,
+            "attempts": state["attempts"],
+            "retry_at": state["retry_at"],
+            "last_error": state["last_error"],
+            "last_push": state["last_push"],
+            "worker": background.alive(state["worker"], _WORKER_TIMEOUT),
+        }
+
+    def record(self, message: str, paths: Iterable[str]) -> bool:
+        """Commit the current content of paths (or their removal) locally and queue
+        the commit to be pushed. Returns whether anything changed.
+        """
+        with self._locked():
+            self._stage(paths)
+            index = self.repo.index
+            if self.repo.head.is_valid() and not index.diff("HEAD"):
+                LOGGER.info("Nothing changed, not committing")
+                return False
+
+            commit = index.commit(message)
+            state = self._read_state()
+            state["queue"].append(
+                {"message": message, "commit": commit.hexsha, "queued": time.time()}
+            )
+            self._write_state(state)
+            LOGGER.info(f"Committed {commit.hexsha}, {len(state['queue'])} queued")
+            return True
+
+    def _stage(self, paths: Iterable[str]) -> None:
+        entries = self.repo.index.entries
+        added = []
+        removed = []
+        for path in paths:
+            relative = os.path.relpath(
+                os.path.abspath(path), self.repo.working_tree_dir
+            )
+            if relative.startswith(os.pardir):
+                LOGGER.warning(f"Not committing {path}, it is outside of {self.path}")
+            elif os.path.exists(path):
+                added.append(relative)
+            elif (relative, 0) in entries:
+                removed.append(relative)
+
+        # 'git rm --cached' writes the index itself, add to the index it leaves.
+        if removed:
+            self.repo.index.remove(removed)
+        if added:
+            self.repo.index.add(added)
+
+    def _squash(self, state: dict) -> None:
+        """Replace the queued commits by one, as long as they are the only commits
+        that aren't pushed. Must hold the lock.
+        """
+        queue = state["queue"]
+        if len(queue) < 2 or not self._has_remote_ref():
+            return
+
+        unpushed = list(self.repo.iter_commits(f"{self._remote_ref}..HEAD"))
+        if {c.hexsha for c in unpushed} != {entry["commit"] for entry in queue}:
+            # Someone else committed (or merged) too, leave their commits alone.
+            return
+        if len(unpushed) < 2 or any(len(c.parents) != 1 for c in unpushed):
+            return
+
+        message = f"Ran {len(queue)} commands\n\n" + "\n".join(
+            entry["message"] for entry in queue
+        )
+        # The index matches HEAD, every run commits what it stages.
+        self.repo.head.reset(unpushed[-1].parents[0], index=False)
+        commit = self.repo.index.commit(message)
+        for entry in queue:
+            entry["commit"] = commit.hexsha
+        self._write_state(state)
+        LOGGER.info(f"Squashed {len(unpushed)} commits into {commit.hexsha}")
+
+    def push(self) -> int:
+        """Squash the queued commits, merge changes made on the remote and push,
+        once. The lock is only held while committing, not while waiting for the
+        remote. Returns the number of queued commits that were pushed.
+        """
+        branch = self.repo.active_branch.name
+        git = self.repo.git
+
+        with self._locked():
+            state = self._read_state()
+            if not state["queue"]:
+                return 0
+            self._squash(state)
+
+        start = time.monotonic()
+        git.fetch(self.remote)
+        if self._has_remote_ref():
+            with self._locked():
+                try:
+                    git.merge(self._remote_ref)
+                except Exception:
+                    # Don't leave a conflicted merge for the next run to commit.
+                    if os.path.exists(os.path.join(self.repo.git_dir, "MERGE_HEAD")):
+                        git.merge("--abort")
+                    raise
+
+        LOGGER.info(f"Pushing {branch} to {self.remote}")
+        git.push(self.remote, branch)
+        seconds = time.monotonic() - start
+
+        with self._locked():
+            state = self._read_state()
+            # Runs may have committed while pushing, those are still queued unless
+            # the push took them along.
+            unpushed = {
+                c.hexsha for c in self.repo.iter_commits(f"{self._remote_ref}..HEAD")
+            }
+            pushed = [e for e in state["queue"] if e["commit"] not in unpushed]
+            state["queue"] = [e for e in state["queue"] if e["commit"] in unpushed]
+            if pushed:
+                state["last_push"] = {
+                    "at": time.time(),
+                    "seconds": round(seconds, 3),
+                    "commits": len(pushed),
+                    "delay": round(time.time() - pushed[0]["queued"], 3),
+                }
+            state["attempts"] = 0
+            state["retry_at"] = None
+            state["last_error"] = None
+            self._write_state(state)
+
+        LOGGER.info(
+            f"Pushed {len(pushed)} commits in {seconds:.2f}s, "
+            f"{len(state['queue'])} still queued"
+        )
+        return len(pushed)
+
+    def _failed(self, error: Exception) -> float:
+        """Record a failed push, returns the seconds to wait before the next."""
+        with self._locked():
+            state = self._read_state()
+            state["attempts"] += 1
+            backoff = min(
+                config.GIT_PUSH_BACKOFF_MAX,
+                config.GIT_PUSH_BACKOFF * 2 ** (state["attempts"] - 1),
+            )
+            state["retry_at"] = time.time() + backoff
+            state["last_error"] = str(error)
+            self._write_state(state)
+
+        LOGGER.warning(
+            f"Push {state['attempts']} failed, retrying in {backoff}s: {error}"
+        )
+        return backoff
+
+    def flush(self, wait: bool = True) -> int:
+        """Push the queued commits, after the window of the oldest has passed unless
+        'wait' is false. A failed push stays queued and is raised.
+        """
+        if wait:
+            oldest = self.status()["oldest"]
+            if oldest is not None:
+                time.sleep(max(0, oldest + self.window - time.time()))
+
+        try:
+            return self.push()
+        except Exception as e:
+            self._failed(e)
+            raise
+
+    def schedule(self) -> None:
+        """Push the queued commits in a background process, unless one is already
+        running or nothing is queued.
+        """
+        with self._locked():
+            state = self._read_state()
+            running = background.alive(state["worker"], _WORKER_TIMEOUT)
+            if not state["queue"] or running:
+                return
+
+        background.detach(self._worker, "Failed to push to GitLab due to")
+
+    def _worker(self) -> None:
+        # The persistent 'git cat-file' processes of the inherited Repo belong to
+        # the run, and die when it exits.
+        self.repo = Repo(self.path)
+
+        with self._locked():
+            state = self._read_state()
+            if background.alive(state["worker"], _WORKER_TIMEOUT):
+                return
+            state["worker"] = [os.getpid(), time.time()]
+            self._write_state(state)
+
+        failures = 0
+        try:
+            # Commits queued while pushing didn't start another worker.
+            while True:
+                with self._locked():
+                    state = self._read_state()
+                    if not state["queue"] or failures >= config.GIT_PUSH_ATTEMPTS:
+                        state["worker"] = None
+                        self._write_state(state)
+                        break
+                    state["worker"] = [os.getpid(), time.time()]
+                    self._write_state(state)
+
+                wake = max(
+                    state["queue"][0]["queued"] + self.window, state["retry_at"] or 0
+                )
+                time.sleep(max(0, wake - time.time()))
+                try:
+                    self.push()
+                    failures = 0
+                except Exception as e:
+                    self._failed(e)
+                    failures += 1
+        except BaseException:
+            with self._locked():
+                state = self._read_state()
+                state["worker"] = None
+                self._write_state(state)
+            raise
+
+        if failures:
+            LOGGER.critical(
+                f"Gave up pushing {len(state['queue'])} commits after {failures} "
+                "attempts, the next run or 'brs_backup flush' retries"
+            )
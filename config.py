@@ -6,8 +6,33 @@ DEFAULT_STORAGE = "S3_Object"
 # File Writing Locations
 JOB_FILE_LOCATION = "/etc/bareos/bareos-dir.d/job"
 FILESET_FILE_LOCATION = "/etc/bareos/bareos-dir.d/fileset"
+CLIENT_FILE_LOCATION = "/etc/bareos/bareos-dir.d/client"
+STORAGE_FILE_LOCATION = "/etc/bareos/bareos-dir.d/storage"
+JOBDEFS_FILE_LOCATION = "/etc/bareos/bareos-dir.d/jobdefs"
 GIT_LOCATION = "/etc/bareos"
 
+# Packed Layout
+# Pack the Jobs and FileSets into this many files per directory, by a hash of their
+# name, instead of one file per resource (ex: 256). Must match the layout on disk,
+# see 'brs_backup migrate-layout'.
+PACKED_SHARDS = None
+
+# Concurrent Runs
+# Directory of the lock file of the config files runs are checking or changing, so
+# concurrent runs only wait for each other on the same files. Set to None to not lock
+# them, when only one run happens at a time.
+LOCK_LOCATION = "/var/cache/brs_backup/locks"
+# Seconds a run waits for another run to be done with a config file before failing.
+LOCK_TIMEOUT = 60
+
+# Bareos Director
+DIRECTOR_ADDRESS = "localhost"
+DIRECTOR_PORT = 9101
+# Add new FileSets and Jobs to the running director with 'configure add', instead of
+# writing their files and making it re-read every config file with 'reload'. Removals
+# always reload.
+DIRECTOR_CONFIGURE_ADD = True
+
 # Bareos Capabilities
 COMPRESSION_OPTIONS = [
     "GZIP",
@@ -26,3 +51,78 @@ COMPRESSION_OPTIONS = [
     "LZ4HC",
 ]
 
+
+# Bulk Import
+# Number of manifest rows that are looked up and written together.
+IMPORT_BATCH_SIZE = 1000
+
+# Database Lookups
+# Maximum number of users looked up in a single query.
+DB_CHUNK_SIZE = 1000
+# Seconds to wait for the database connection to be established.
+DB_CONNECTION_TIMEOUT = 5
+
+# Directory Cache
+# SQLite cache of looked up directories, set to None to always query the database.
+CACHE_LOCATION = "/var/cache/brs_backup/directories.sqlite3"
+# Seconds a cached directory is used before it is looked up again.
+CACHE_TTL = 24 * 60 * 60
+# Least recently used entries are evicted beyond this many users.
+CACHE_MAX_ENTRIES = 200000
+
+# Resource Index
+# Index of every resource name in the directories above, set to None to rescan on
+# every run instead of persisting it.
+INDEX_LOCATION = "/var/cache/brs_backup/resources.json"
+# Refuse to write Jobs that reference a FileSet, Client, Storage or JobDefs that isn't
+# defined in the directories above, instead of only logging a warning.
+STRICT_REFERENCES = False
+
+# Director Session Broker
+# Unix socket of the broker keeping director sessions open between runs, see
+# 'brs_backup broker'. Runs connect to the director directly when no broker listens
+# on it, set it to None to never use the broker.
+BROKER_SOCKET = "/run/brs_backup/broker.sock"
+# Number of director sessions the broker keeps open.
+BROKER_SESSIONS = 2
+# Seconds between keepalives on idle director sessions.
+BROKER_KEEPALIVE = 60
+# Seconds a run waits for the broker to answer a command.
+BROKER_TIMEOUT = 300
+
+# Director Reloads
+# State of the reloads requested by runs, and its lock file next to it. Runs reload
+# the director right away when set to None.
+RELOAD_STATE_LOCATION = "/var/cache/brs_backup/reload.json"
+# Seconds without another request before the director is reloaded, so runs in a row
+# share one reload.
+RELOAD_QUIET_WINDOW = 2
+# Reload anyway once the oldest request waited this many seconds.
+RELOAD_MAX_DELAY = 30
+# Wait for the reload covering a run's changes before it exits, see '--wait-reload'.
+RELOAD_WAIT = False
+
+# Git Repository
+# Remote of GIT_LOCATION that changes are pushed to.
+GIT_REMOTE = "origin"
+# Seconds to wait for other runs after a commit, so their commits are pushed as one.
+GIT_COMMIT_WINDOW = 5
+# Push in a background process, instead of making runs wait for it.
+GIT_PUSH_ASYNC = True
+# Seconds before retrying a failed push, doubled after every failure in a row.
+GIT_PUSH_BACKOFF = 5
+# Longest wait between retries.
+GIT_PUSH_BACKOFF_MAX = 300
+# Failed pushes in a row before the background process gives up, the commits stay
+# queued for the next run or 'brs_backup flush'.
+GIT_PUSH_ATTEMPTS = 8
+
+# Logging
+# Syslog socket the logs are written to.
+LOG_ADDRESS = "/dev/log"
+# Records below this level are discarded before they are formatted.
+LOG_LEVEL = "DEBUG"
+# Records waiting for syslog, beyond this many new records are dropped and counted.
+LOG_QUEUE_SIZE = 10000
+# Maximum number of queued records written to syslog per wakeup of the listener.
+LOG_BATCH_SIZE = 64
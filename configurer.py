@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import re
+from typing import Dict, List, NamedTuple
+
+# Values that can go unquoted inside the Include block of a 'configure add fileset'
+# argument, which is quoted itself.
+_BARE_VALUE_RE = re.compile(r"^[\w./:@+-]+$")
+
+
+class NeedsReload(Exception):
+    """The resource can't be added to the running director, write its file and
+    reload the director instead.
+    """
+
+
+class Resource(NamedTuple):
+    """A resource to add with 'configure add'.
+
+    'directives' are the directives given to 'configure add', 'expected' are the
+    directives 'show' must print for the resource to be verified.
+    """
+
+    kind: str
+    name: str
+    directives: Dict[str, str]
+    expected: Dict[str, str]
+
+    def add_command(self) -> str:
+        arguments = " ".join(
+            f"{key}={_quote(value)}" for key, value in self.directives.items()
+        )
+        return f"configure add {self.kind} name={_quote(self.name)} {arguments}"
+
+    def show_command(self) -> str:
+        return f"show {self.kind}={_quote(self.name)}"
+
+    def verify(self, output: str) -> List[str]:
+        """Return the expected directives missing from the 'show' output."""
+        missing = []
+        for key, value in dict(Name=self.name, **self.expected).items():
+            directive = re.compile(
+                rf'^\s*{key}\s*=\s*"?{re.escape(value)}"?\s*$', re.I | re.M
+            )
+            if not directive.search(output):
+                missing.append(f"{key} = {value}")
+        return missing
+
+
+def _quote(value: str) -> str:
+    # The console's argument parser has no escapes, quotes can't be nested.
+    if '"' in value or "\\" in value or "\n" in value:
+        raise NeedsReload(f"Can't pass {value!r} to 'configure add'")
+    return f'"{value}"'
+
+
+def file_set(
+    name: str, description: str, file_location: str, compression: str = "GZIP"
+) -> Resource:
+    """The FileSet resource of templates/fileset.txt, with its Include block given
+    as a single directive.
+    """
+    for value in (file_location, compression):
+        if not _BARE_VALUE_RE.match(value):
+            raise NeedsReload(f"Can't pass {value!r} inside an Include block")
+
+    include = (
+        "{ Options { Signature = MD5; aclsupport = yes; xattrsupport = yes; "
+        f"compression = {compression} }}; File = {file_location} }}"
+    )
+    return Resource(
+        "fileset",
+        name,
+        {"description": description, "include": include},
+        {"Description": description, "File": file_location},
+    )
+
+
+def job(name: str, fileset: str, client: str, jobdef: str, storage: str) -> Resource:
+    """The Job resource of templates/job.txt."""
+    directives = {
+        "client": client,
+        "jobdefs": jobdef,
+        "fileset": fileset,
+        "storage": storage,
+    }
+    return Resource(
+        "job",
+        name,
+        directives,
+        {
+            "Client": client,
+            "JobDefs": jobdef,
+            "FileSet": fileset,
+            "Storage": storage,
+        },
+    )
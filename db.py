@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+import atexit
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Tuple
+
+import mysql.connector
+from mysql.connector.errors import InterfaceError, OperationalError
+
+import cache
+import logger
+import config
+import secrets
+
+LOGGER = logger.get_logger(__name__)
+
+# A looked up user as '(name, homedir_source, pe_homedir_source)'.
+UserDirs = Tuple[str, Optional[str], Optional[str]]
+
+# Errors raised when the database can't be reached.
+CONNECTION_ERRORS = (InterfaceError, OperationalError)
+
+_SESSION = None
+
+
+def _unique(items: Iterable[str]) -> Iterator[str]:
+    """Lazily drop duplicates while keeping the order the items were given in."""
+    seen = set()
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            yield item
+
+
+def _statement_size(n: int, chunk_size: int) -> int:
+    """Round the number of users in a chunk up to the next power of two (capped at
+    chunk_size) so only a handful of distinct statements ever get prepared.
+    """
+    size = 1
+    while size < n:
+        size <<= 1
+    return min(size, chunk_size)
+
+
+class Session:
+    """A connection to the accounts database that is reused for every lookup in the
+    process.
+
+    Lookups are answered from the directory cache where possible, the rest run as
+    prepared statements. Chunks are padded with NULLs to a few fixed sizes so each
+    statement is prepared once per session and then only executed.
+    """
+
+    def __init__(self, offline: bool = False):
+        # Serve users from the directory cache, even when expired, when the
+        # database can't be reached.
+        self.offline = offline
+        self._unreachable = False
+        self._cnx = None
+        # Statement size -> (prepared cursor, query).
+        self._statements = {}
+
+    def _connect(self) -> None:
+        self.close()
+        self._cnx = mysql.connector.connect(
+            user=secrets.sql_username,
+            password=secrets.sql_password,
+            host=secrets.DB_HOST,
+            port=secrets.DB_PORT,
+            database=secrets.DB_NAME,
+            connection_timeout=config.DB_CONNECTION_TIMEOUT,
+        )
+        LOGGER.debug(f"Connected to database {secrets.DB_NAME} at {secrets.DB_HOST}")
+
+    def _statement(self, size: int):
+        if size not in self._statements:
+            # The query string must be the same object on every execute for the
+            # cursor to reuse its prepared statement.
+            s_str = ",".join(["?"] * size)
+            query = (
+                f"SELECT name, homedir_source, pe_homedir_source FROM accounts_user "
+                f"WHERE name in ({s_str})"
+            )
+            self._statements[size] = (self._cnx.cursor(prepared=True), query)
+
+        return self._statements[size]
+
+    def _execute(self, chunk: list, chunk_size: int):
+        size = _statement_size(len(chunk), chunk_size)
+        params = tuple(chunk) + (None,) * (size - len(chunk))
+
+        if self._cnx is None:
+            self._connect()
+
+        try:
+            cur, query = self._statement(size)
+            cur.execute(query, params)
+        except CONNECTION_ERRORS:
+            # The connection went away since the last lookup, try once more.
+            LOGGER.debug("Lost database connection, reconnecting")
+            self._connect()
+            cur, query = self._statement(size)
+            cur.execute(query, params)
+
+        return cur
+
+    def _lookup_chunk(
+        self, chunk: list, chunk_size: int, dir_cache: Optional[cache.DirCache]
+    ) -> Iterator[UserDirs]:
+        pending = dict.fromkeys(chunk)
+        found = []
+        cur = None
+
+        try:
+            if self._unreachable:
+                raise InterfaceError("database was unreachable earlier in this process")
+
+            cur = self._execute(chunk, chunk_size)
+            for name, homedir_source, pe_homedir_source in cur:
+                pending.pop(name, None)
+                found.append((name, homedir_source, pe_homedir_source))
+                yield name, homedir_source, pe_homedir_source
+        except GeneratorExit:
+            # Stopped early, rows left unread fail the next query on the connection.
+            if cur is not None:
+                try:
+                    cur.fetchall()
+                except mysql.connector.Error:
+                    self.close()
+            raise
+        except CONNECTION_ERRORS as e:
+            if not self.offline or dir_cache is None:
+                raise
+
+            # Don't wait on the connection timeout again for every chunk.
+            self._unreachable = True
+
+            LOGGER.warning(
+                f"Database unreachable, serving {len(pending)} users from the cache: "
+                f"{e}"
+            )
+            stale = dir_cache.get_many(list(pending), include_expired=True)
+            for name in pending:
+                yield (name,) + stale.get(name, (None, None))
+            return
+        finally:
+            if dir_cache is not None and found:
+                dir_cache.put_many(found)
+
+        for name in pending:
+            yield name, None, None
+
+    def lookup(
+        self, users: Iterable[str], chunk_size: int = config.DB_CHUNK_SIZE
+    ) -> Iterator[UserDirs]:
+        """Look up both the home and PE home directory of each user in a single query
+        per chunk of at most chunk_size names. Users found in the directory cache are
+        not queried.
+
+        Yields '(user, homedir_source, pe_homedir_source)' tuples as the rows arrive.
+        Once a chunk is exhausted, every user of that chunk without a row is yielded
+        with 'None' for both directories.
+        """
+        dir_cache = cache.get_cache()
+        users = _unique(users)
+        hits = 0
+        misses = 0
+
+        try:
+            while True:
+                chunk = list(islice(users, chunk_size))
+                if not chunk:
+                    return
+
+                if dir_cache is not None:
+                    cached = dir_cache.get_many(chunk)
+                    for name in chunk:
+                        if name in cached:
+                            yield (name,) + cached[name]
+
+                    chunk = [name for name in chunk if name not in cached]
+                    hits += len(cached)
+                    misses += len(chunk)
+                    if not chunk:
+                        continue
+
+                yield from self._lookup_chunk(chunk, chunk_size, dir_cache)
+        finally:
+            if dir_cache is not None and (hits or misses):
+                dir_cache.log_stats(hits, misses)
+
+    def dump(self) -> Iterator[UserDirs]:
+        """Stream every user in the accounts table, used to warm up the directory
+        cache.
+        """
+        if self._cnx is None:
+            self._connect()
+
+        cur = self._cnx.cursor(buffered=False)
+        try:
+            cur.execute(
+                "SELECT name, homedir_source, pe_homedir_source FROM accounts_user"
+            )
+            yield from cur
+        finally:
+            cur.close()
+
+    def close(self) -> None:
+        for cur, _ in self._statements.values():
+            try:
+                cur.close()
+            except mysql.connector.Error:
+                pass
+        self._statements = {}
+
+        if self._cnx is not None:
+            try:
+                self._cnx.close()
+            except mysql.connector.Error:
+                pass
+            self._cnx = None
+
+
+def get_session() -> Session:
+    """Return the database session shared by the whole process, creating it on first
+    use. It is closed automatically when the process exits.
+    """
+    global _SESSION
+
+    if _SESSION is None:
+        _SESSION = Session()
+        atexit.register(_SESSION.close)
+
+    return _SESSION
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def load(name: str) -> ModuleType:
+    """Return the module 'name', only running its code (and its imports) the first
+    time one of its attributes is used. Commands that don't use a backend, like
+    'brs_backup remove' the database, don't pay for importing it.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -1,18 +1,175 @@
 #!/usr/bin/env python3
 
+import atexit
 import logging
 import logging.handlers
+import os
+import queue
+import threading
+from typing import List, Optional
+
+import config
+
+FORMAT = "brs_backup.%(funcName)s: [%(levelname)s] %(message)s"
+
+_LOCK = threading.Lock()
+# The one handler of every logger, created on the first get_logger call.
+_HANDLER = None  # type: Optional[DroppingQueueHandler]
+_LISTENER = None  # type: Optional[BatchingQueueListener]
+# The process the listener thread runs in.
+_PID = None  # type: Optional[int]
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Puts records on a bounded queue for the listener thread, and drops them
+    instead of blocking when the queue is full.
+    """
+
+    def __init__(self, queue_: queue.Queue):
+        super().__init__(queue_)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """Hands records to the syslog handler in batches of up to batch_size, taking
+    everything that queued up while the previous batch was written at once.
+    """
+
+    def __init__(self, queue_, handler, batch_size, source):
+        super().__init__(queue_, handler)
+        self.batch_size = batch_size
+        # The DroppingQueueHandler whose drops are reported.
+        self.source = source
+        self._reported = 0
+        self._stopping = False
+
+    def dequeue(self, block: bool):
+        if self._stopping:
+            self._stopping = False
+            return self._sentinel
+
+        record = self.queue.get(block)
+        if record is self._sentinel:
+            return record
+
+        batch = [record]
+        while len(batch) < self.batch_size:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is self._sentinel:
+                self._stopping = True
+                break
+            batch.append(record)
+        return batch
+
+    def handle(self, batch: List[logging.LogRecord]) -> None:
+        for record in batch:
+            super().handle(record)
+
+        dropped = self.source.dropped
+        if dropped != self._reported:
+            super().handle(
+                logging.makeLogRecord(
+                    {
+                        "name": __name__,
+                        "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "funcName": "handle",
+                        "msg": f"Dropped {dropped - self._reported} log records, "
+                        "syslog is backed up",
+                    }
+                )
+            )
+            self._reported = dropped
+
+    def enqueue_sentinel(self) -> None:
+        # Wait for room, unlike records the sentinel must not be dropped.
+        self.queue.put(self._sentinel)
+
+
+def _install() -> None:
+    """Start the listener thread writing to syslog, once per process."""
+    global _HANDLER, _LISTENER, _PID
+
+    records = queue.Queue(config.LOG_QUEUE_SIZE)
+    syslog = logging.handlers.SysLogHandler(address=config.LOG_ADDRESS)
+    syslog.setFormatter(logging.Formatter(FORMAT))
+
+    handler = DroppingQueueHandler(records)
+    if _HANDLER is not None:
+        handler.dropped = _HANDLER.dropped
+    listener = BatchingQueueListener(records, syslog, config.LOG_BATCH_SIZE, handler)
+    listener.start()
+
+    if _HANDLER is not None:
+        # After a fork, move the loggers over to the new queue.
+        for logger in logging.Logger.manager.loggerDict.values():
+            if isinstance(logger, logging.Logger) and _HANDLER in logger.handlers:
+                logger.removeHandler(_HANDLER)
+                logger.addHandler(handler)
+
+    _HANDLER = handler
+    _LISTENER = listener
+    _PID = os.getpid()
+
+
+def after_fork() -> None:
+    """The listener thread doesn't survive a fork, give the child its own. Runs on
+    its own after os.fork from Python 3.7, call it in the child before logging on
+    older versions. Does nothing when the listener already runs in this process.
+    """
+    global _LOCK, _LISTENER
+    if _PID == os.getpid():
+        return
+
+    # Another thread may have held the lock while forking.
+    _LOCK = threading.Lock()
+    if _LISTENER is not None:
+        _LISTENER = None
+        _install()
+
+
+def shutdown() -> None:
+    """Write the queued records to syslog and stop the listener thread."""
+    global _LISTENER
+    with _LOCK:
+        if _LISTENER is not None:
+            _LISTENER.stop()
+            _LISTENER = None
+
+
+def dropped() -> int:
+    """Number of records dropped because syslog couldn't keep up."""
+    return _HANDLER.dropped if _HANDLER is not None else 0
 
 
 def get_logger(name: str) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    handler = logging.handlers.SysLogHandler(address="/dev/log")
-    handler.setFormatter(
-        logging.Formatter(
-            "brs_backup.%(funcName)s: [%(levelname)s] %(message)s"
-        )
-    )
-    logger.addHandler(handler)
+    """Return the logger 'name', writing to syslog through a queue, so logging
+    never waits for syslog.
+
+    Records below config.LOG_LEVEL are rejected before they are created. Calling
+    this again for the same name doesn't add another handler.
+    """
+    with _LOCK:
+        if _LISTENER is None:
+            _install()
+
+        logger = logging.getLogger(name)
+        logger.setLevel(config.LOG_LEVEL)
+        if _HANDLER not in logger.handlers:
+            logger.addHandler(_HANDLER)
 
     return logger
+
+
+atexit.register(shutdown)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=after_fork)
@@ -1,32 +1,62 @@
 #!/usr/bin/env python3
 
-from typing import List
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+import json
 import sys
+import time
 
 import click
 
+import lazy
 import logger
+from manifest import MANIFEST_FORMATS, ManifestRow, read_manifest
+from configurer import NeedsReload
 from util import (
+    configure_backups,
     get_dir_from_db,
     get_pe_dir_from_db,
+    iter_dirs_from_db,
+    migrate_layout,
     write_file_set_file,
     write_job_file,
     remove_file_set_file,
     remove_job_file,
-    reload_bconsole,
+    request_reload,
     push_to_gitlab,
+    set_offline,
+    set_reload_wait,
+    warm_dir_cache,
 )
 import config
+from staging import BatchWriter
+
+# Backends only imported by the commands using them, see lazy.load.
+broker = lazy.load("broker")
+committer = lazy.load("committer")
 
 LOGGER = logger.get_logger(__name__)
 
 
 @click.group()
-def cli():
+@click.option(
+    "--offline",
+    is_flag=True,
+    default=False,
+    help="Serve directory lookups from the local cache when the database is down.",
+)
+@click.option(
+    "--wait-reload",
+    is_flag=True,
+    default=config.RELOAD_WAIT,
+    help="Wait for the director reload covering this run's changes before exiting.",
+)
+def cli(offline: bool, wait_reload: bool):
     """brs_backup is a tool to add and remove user and group home directories from the
     Bareos backup system.
     """
-    pass
+    set_offline(offline)
+    set_reload_wait(wait_reload)
 
 
 @cli.command("uadd", short_help="Add user home directories to backups")
@@ -61,53 +91,56 @@ def uadd(p: bool, compression: str, users: List[str]):
     else:
         directories = get_dir_from_db(users)
 
-    print(p)
-    print(directories)
-    return
-
+    # (name, description, 'client:/path', compression) of each user found.
+    backups = []
     for user in users:
-        if user not in directories:
+        if directories.get(user) is None:
+            LOGGER.error(f"Failed to add {user}: no directory found")
             failures.append(user)
             continue
 
-        # Make the file set file.
-        try:
-            if compression:
-                write_file_set_file(
-                    user,
-                    f"Home directory for {user}",
-                    directories[user].split(":")[1],
-                    compression,
-                )
-            else:
-                write_file_set_file(
-                    user, f"Home directory for {user}", directories[user].split(":")[1]
-                )
-        except BaseException as e:
-            LOGGER.error(str(e))
+        backups.append(
+            (user, f"Home directory for {user}", directories[user], compression)
+        )
+
+    # Add the resources to the running director, unless that needs a reload.
+    if config.DIRECTOR_CONFIGURE_ADD and backups:
+        errors = configure_backups(backups)
+    else:
+        errors = [NeedsReload()] * len(backups)
+
+    # Stage the files of the rest and write them together.
+    batch = BatchWriter()
+    staged = []
+    for backup, error in zip(backups, errors):
+        user = backup[0]
+        if error is None:
+            success.append(user)
+            continue
+        if not isinstance(error, NeedsReload):
+            LOGGER.error(error)
             failures.append(user)
+            continue
 
-        # Make the job file.
         try:
-            write_job_file(user, user, client=directories[user].split(":")[0])
+            _add_resource(*backup, batch)
+            staged.append(user)
         except BaseException as e:
             LOGGER.error(e)
-            # If we couldn't make the job file, try cleaning up the fileset file.
-            try:
-                remove_file_set_file(user)
-            except BaseException:
-                LOGGER.error(
-                    f"Failed FileSet file cleanup for {user} when Job file creation "
-                    f"failed."
-                )
-
             failures.append(user)
 
-        success.append(user)
+    try:
+        batch.commit()
+        success.extend(staged)
+    except BaseException as e:
+        LOGGER.error(f"Failed to commit staged files: {e}")
+        failures.extend(staged)
+        staged = []
 
-    # Only reload/push when files were changed.
+    # Only reload when files were written, and push when anything changed.
+    if staged:
+        request_reload()
     if success:
-        reload_bconsole()
         push_to_gitlab(
             f"Ran command: brs_backup uadd {'-p ' if p else ''}{' '.join(users)}"
         )
@@ -149,6 +182,9 @@ def uremove(p: bool, users: List[str]):
     else:
         directories = get_pe_dir_from_db(users)
 
+    # Stage every removal so they are applied together.
+    batch = BatchWriter()
+
     for user in users:
         if user not in directories:
             failures.append(user)
@@ -156,23 +192,30 @@ def uremove(p: bool, users: List[str]):
 
         # Remove the job file.
         try:
-            remove_job_file(user)
+            remove_job_file(user, batch=batch)
         except BaseException as e:
             LOGGER.error(e)
             failures.append(user)
 
         # Remove the file set file.
         try:
-            remove_file_set_file(user)
+            remove_file_set_file(user, batch=batch)
         except BaseException as e:
             LOGGER.error(e)
             failures.append(user)
 
         success.append(user)
 
+    try:
+        batch.commit()
+    except BaseException as e:
+        LOGGER.error(e)
+        failures.extend(success)
+        success = []
+
     # Only reload/push when files were changed.
     if success:
-        reload_bconsole()
+        request_reload()
         push_to_gitlab(
             f"Ran command: brs_backup uremove {'-p ' if p else ''}{' '.join(users)}"
         )
@@ -205,19 +248,30 @@ def add(job_name: str, directory: str, compression: str):
     brs_backup add horel-group3 saltflats-vg3-1-lv1.chpc.utah.edu:/uufs/saltflats/common/saltflats-vg3-1-lv1/horel
     brs_backup add horel-group4 saltflats-vg6-0-lv1.chpc.utah.edu:/uufs/saltflats/common/saltflats-vg6-0-lv1/horel --compression=GZIP
     """  # noqa: E501
+    description = f"Group space for {job_name}"
+
+    # Add the resources to the running director, unless that needs a reload.
+    if config.DIRECTOR_CONFIGURE_ADD:
+        (error,) = configure_backups([(job_name, description, directory, compression)])
+        if error is None:
+            push_to_gitlab(f"Ran command: brs_backup add {job_name} {directory}")
+            click.echo("success")
+            sys.exit(0)
+            return
+        if not isinstance(error, NeedsReload):
+            LOGGER.error(error)
+            click.echo("failed")
+            sys.exit(1)
+            return
+
     # Create the FileSet file.
     try:
         if compression:
             write_file_set_file(
-                job_name,
-                f"Group space for {job_name}",
-                directory.split(":")[1],
-                compression,
+                job_name, description, directory.split(":")[1], compression
             )
         else:
-            write_file_set_file(
-                job_name, f"Group space for {job_name}", directory.split(":")[1]
-            )
+            write_file_set_file(job_name, description, directory.split(":")[1])
     except BaseException as e:
         LOGGER.error(e)
         click.echo("failed")
@@ -242,7 +296,7 @@ def add(job_name: str, directory: str, compression: str):
         sys.exit(1)
         return
 
-    reload_bconsole()
+    request_reload()
     push_to_gitlab(f"Ran command: brs_backup add {job_name} {directory}")
 
     click.echo("success")
@@ -260,30 +314,438 @@ def gremove(job_name: str):
     brs_backup remove horel-group3
     brs_backup remove horel-group4
     """
-    # Delete the job file.
+    # Delete the Job and FileSet file together.
     try:
-        remove_job_file(job_name)
+        with BatchWriter() as batch:
+            remove_job_file(job_name, batch=batch)
+            remove_file_set_file(job_name, batch=batch)
     except BaseException as e:
         LOGGER.error(e)
         click.echo("failed")
         sys.exit(1)
         return
 
-    # Delete the FileSet file.
+    request_reload()
+    push_to_gitlab(f"Ran command: brs_backup remove {job_name}")
+
+    click.echo("success")
+    sys.exit(0)
+
+
+@cli.command("cache-warm", short_help="Fill the directory lookup cache")
+def cache_warm():
+    """Fill the local directory lookup cache from a full dump of the accounts
+    database, so later lookups (and --offline runs) don't need to query it.
+
+    \b
+    Example:
+    brs_backup cache-warm
+    """
     try:
-        remove_file_set_file(job_name)
+        count = warm_dir_cache()
     except BaseException as e:
         LOGGER.error(e)
         click.echo("failed")
         sys.exit(1)
         return
 
-    reload_bconsole()
-    push_to_gitlab(f"Ran command: brs_backup remove {job_name}")
+    click.echo(f"success: {count} users cached")
+    sys.exit(0)
+
+
+@cli.command("broker", short_help="Keep director sessions open for other runs")
+@click.option(
+    "--socket",
+    "socket_path",
+    default=config.BROKER_SOCKET,
+    help="The Unix socket to listen on.",
+)
+@click.option(
+    "--sessions",
+    default=config.BROKER_SESSIONS,
+    type=click.IntRange(min=1),
+    help="The number of director sessions to keep open.",
+)
+def run_broker(socket_path: str, sessions: int):
+    """Run the director session broker in the foreground until it is stopped with
+    SIGINT or SIGTERM.
+
+    While it runs, other runs of brs_backup send their director commands (like
+    'reload') to its already authenticated sessions instead of connecting to the
+    director themselves.
+
+    \b
+    Example:
+    brs_backup broker
+    brs_backup broker --sessions=4
+    """
+    try:
+        broker.serve(socket_path, sessions)
+    except BaseException as e:
+        LOGGER.error(e)
+        click.echo("failed")
+        sys.exit(1)
+        return
 
-    click.echo("success")
     sys.exit(0)
 
 
+@cli.command("flush", short_help="Push the queued commits to GitLab now")
+@click.option(
+    "--status",
+    "status_only",
+    is_flag=True,
+    default=False,
+    help="Only show the queued commits and the last push, don't push.",
+)
+def flush(status_only: bool):
+    """Push the commits queued by earlier runs to GitLab now, without waiting for
+    the background push or its backoff after failed pushes.
+
+    \b
+    Example:
+    brs_backup flush
+    brs_backup flush --status
+    """
+    try:
+        git = committer.Committer()
+        if not status_only:
+            pushed = git.flush(wait=False)
+        status = git.status()
+    except BaseException as e:
+        LOGGER.error(e)
+        click.echo("failed")
+        sys.exit(1)
+        return
+
+    if not status_only:
+        click.echo(f"success: {pushed} commits pushed")
+    for line in _describe_outbox(status):
+        click.echo(line)
+    sys.exit(0)
+
+
+def _add_resource(
+    name: str,
+    description: str,
+    directory: str,
+    compression: Optional[str],
+    batch: BatchWriter,
+) -> None:
+    """Stage the FileSet and Job file for a single 'host:/path' directory, dropping
+    the FileSet file again when the Job file could not be staged.
+    """
+    client, file_location = directory.split(":", 1)
+
+    if compression:
+        write_file_set_file(name, description, file_location, compression, batch=batch)
+    else:
+        write_file_set_file(name, description, file_location, batch=batch)
+
+    try:
+        write_job_file(name, name, client=client, batch=batch)
+    except BaseException:
+        try:
+            remove_file_set_file(name, batch=batch)
+        except BaseException:
+            LOGGER.error(
+                f"Failed FileSet file cleanup for {name} when Job file creation "
+                f"failed."
+            )
+        raise
+
+
+@cli.command("migrate-layout", short_help="Convert between per-file and packed files")
+@click.option(
+    "--packed/--per-file",
+    "to_packed",
+    default=True,
+    help="Pack the resources into shard files, or write one file per resource.",
+)
+@click.option(
+    "--shards",
+    default=config.PACKED_SHARDS or 256,
+    type=click.IntRange(min=1),
+    help="The number of shard files per directory when packing.",
+)
+def migrate_layout_cmd(to_packed: bool, shards: int):
+    """Move every Job and FileSet between one file per resource and a fixed number
+    of packed shard files per directory, changing all files together. Set
+    PACKED_SHARDS in config.py to match (None for one file per resource).
+
+    \b
+    Example:
+    brs_backup migrate-layout --packed --shards=256
+    brs_backup migrate-layout --per-file
+    """
+    try:
+        count = migrate_layout(shards if to_packed else None)
+    except BaseException as e:
+        LOGGER.error(e)
+        click.echo("failed")
+        sys.exit(1)
+        return
+
+    request_reload()
+    push_to_gitlab(
+        "Ran command: brs_backup migrate-layout "
+        + (f"--packed --shards={shards}" if to_packed else "--per-file")
+    )
+
+    click.echo(f"success: {count} resources moved")
+    sys.exit(0)
+
+
+def _describe_outbox(status: dict) -> List[str]:
+    """Lines describing the queued commits and the last push for 'flush'."""
+    now = time.time()
+    lines = [f"queued: {status['queued']} commits"]
+    if status["oldest"] is not None:
+        lines[0] += f", oldest {now - status['oldest']:.0f}s ago"
+
+    last_push = status["last_push"]
+    if last_push:
+        lines.append(
+            f"last push: {last_push['commits']} commits in "
+            f"{last_push['seconds']:.2f}s, {now - last_push['at']:.0f}s ago, "
+            f"{last_push['delay']:.1f}s after the oldest was queued"
+        )
+    if status["attempts"]:
+        lines.append(
+            f"failed pushes: {status['attempts']}, retrying in "
+            f"{max(0, status['retry_at'] - now):.0f}s: {status['last_error']}"
+        )
+    if status["worker"]:
+        lines.append("background push: running")
+    return lines
+
+
+def _resolve_batch(
+    rows: List[ManifestRow],
+) -> Iterator[Tuple[ManifestRow, Optional[str]]]:
+    """Yield every row of a batch with its directory ('None' when not found) as soon
+    as the lookup returns it, so files can be written while later rows are still
+    being fetched from the DB. Standard and PE rows share a single lookup.
+    """
+    pending = {}
+
+    for row in rows:
+        if row.kind == "group":
+            yield row, row.directory
+        else:
+            pending.setdefault(row.name, []).append(row)
+
+    if not pending:
+        return
+
+    for name, homedir_source, pe_homedir_source in iter_dirs_from_db(list(pending)):
+        for row in pending.pop(name, []):
+            yield row, pe_homedir_source if row.pe else homedir_source
+
+
+def _description(row: ManifestRow) -> str:
+    if row.kind == "user":
+        return f"Home directory for {row.name}"
+    return f"Group space for {row.name}"
+
+
+def _import_row(row: ManifestRow, directory: Optional[str], batch: BatchWriter) -> dict:
+    """Write the resources of a single resolved manifest row and return its summary
+    record.
+    """
+    record = {"line": row.line, "type": row.kind, "name": row.name}
+
+    if directory is None:
+        record["status"] = "failure"
+        record["error"] = "no directory found"
+        return record
+
+    try:
+        _add_resource(row.name, _description(row), directory, row.compression, batch)
+    except BaseException as e:
+        LOGGER.error(e)
+        record["status"] = "failure"
+        record["error"] = str(e)
+    else:
+        record["status"] = "success"
+        record["directory"] = directory
+        record["applied"] = "reload"
+
+    return record
+
+
+def _configure_rows(
+    rows: List[Tuple[ManifestRow, str]], batch: BatchWriter
+) -> List[dict]:
+    """Add the resources of resolved manifest rows to the running director with
+    'configure add' and return their summary records. The files of rows that need a
+    reload are staged in the batch instead.
+    """
+    if not rows:
+        return []
+
+    errors = configure_backups(
+        [
+            (row.name, _description(row), directory, row.compression)
+            for row, directory in rows
+        ]
+    )
+
+    records = []
+    for (row, directory), error in zip(rows, errors):
+        if isinstance(error, NeedsReload):
+            records.append(_import_row(row, directory, batch))
+            continue
+
+        record = {"line": row.line, "type": row.kind, "name": row.name}
+        if error is None:
+            record["status"] = "success"
+            record["directory"] = directory
+            record["applied"] = "configure"
+        else:
+            record["status"] = "failure"
+            record["error"] = str(error)
+        records.append(record)
+
+    return records
+
+
+def _import_rows(rows: Iterator[ManifestRow]) -> Iterator[dict]:
+    """Stream manifest rows through the lookup and write stages, yielding one result
+    record per row. The files of each batch are staged as rows resolve and committed
+    together once the batch is done.
+    """
+    while True:
+        batch = list(islice(rows, config.IMPORT_BATCH_SIZE))
+        if not batch:
+            return
+
+        records = []
+        valid = []
+        for row in batch:
+            if row.error is None:
+                valid.append(row)
+            else:
+                records.append(
+                    {
+                        "line": row.line,
+                        "type": row.kind,
+                        "name": row.name,
+                        "status": "failure",
+                        "error": row.error,
+                    }
+                )
+
+        writer = BatchWriter()
+        done = set()
+        # Rows added with 'configure add' together once the batch is resolved.
+        resolved = []
+        try:
+            for row, directory in _resolve_batch(valid):
+                done.add(row)
+                if config.DIRECTOR_CONFIGURE_ADD and directory is not None:
+                    resolved.append((row, directory))
+                else:
+                    records.append(_import_row(row, directory, writer))
+        except Exception as e:
+            LOGGER.error(f"Directory lookup failed: {e}")
+            for row in valid:
+                if row not in done:
+                    records.append(
+                        {
+                            "line": row.line,
+                            "type": row.kind,
+                            "name": row.name,
+                            "status": "failure",
+                            "error": f"directory lookup failed: {e}",
+                        }
+                    )
+
+        records.extend(_configure_rows(resolved, writer))
+
+        try:
+            writer.commit()
+        except BaseException as e:
+            LOGGER.error(f"Failed to commit staged files: {e}")
+            for record in records:
+                if record.get("applied") == "reload":
+                    record["status"] = "failure"
+                    record["error"] = f"failed to commit staged files: {e}"
+                    del record["directory"]
+
+        yield from records
+
+
+@cli.command("import", short_help="Add users and directories from a manifest")
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format",
+    "fmt",
+    required=False,
+    type=click.Choice(MANIFEST_FORMATS),
+    help="The manifest format, guessed from the file extension when not given.",
+)
+@click.option(
+    "--summary",
+    type=click.File("w"),
+    default="-",
+    help="Where to write the JSON lines summary (default: stdout).",
+)
+def import_manifest(manifest: str, fmt: str, summary):
+    """Add every user and group directory listed in a CSV or JSONL manifest to the
+    backup system. New resources are added to the running director with
+    'configure add' where possible, the rest with a single director reload at the end,
+    followed by a single git commit.
+
+    \b
+    CSV manifests need the header 'type,name,directory,pe,compression', JSONL
+    manifests one object per line with the same keys. 'type' is 'user' or
+    'group', 'directory' (host:/path) is required for groups, 'pe' selects a
+    user's PE directory.
+
+    \b
+    A JSON object is written per row with its 'status' and how it was 'applied'
+    ('configure' or 'reload') or, on failure, the 'error', followed by one object
+    with the totals.
+
+    \b
+    Example:
+    brs_backup import department.csv
+    brs_backup import department.jsonl --summary=import-summary.jsonl
+    """
+    success = 0
+    failures = 0
+    reload = False
+
+    for record in _import_rows(read_manifest(manifest, fmt)):
+        if record["status"] == "success":
+            success += 1
+            reload = reload or record["applied"] == "reload"
+        else:
+            failures += 1
+        summary.write(json.dumps(record) + "\n")
+
+    # Only reload when files were written, and push when anything changed.
+    if reload:
+        request_reload()
+    if success:
+        push_to_gitlab(f"Ran command: brs_backup import {manifest}")
+
+    summary.write(
+        json.dumps(
+            {"total": success + failures, "success": success, "failure": failures}
+        )
+        + "\n"
+    )
+    summary.flush()
+
+    if failures == 0:
+        sys.exit(0)
+    elif success == 0:
+        sys.exit(1)
+    else:
+        sys.exit(2)
+
+
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import csv
+import json
+from typing import Iterator, NamedTuple, Optional
+
+import config
+
+MANIFEST_FORMATS = ["csv", "jsonl"]
+MANIFEST_FIELDS = ["type", "name", "directory", "pe", "compression"]
+
+
+class ManifestRow(NamedTuple):
+    """A single resource to add, as read from an import manifest.
+
+    'line' is the 1-based line number in the manifest so failures can be traced back
+    to their source. 'error' is set instead of raising when a row could not be parsed,
+    letting the rest of the manifest go through.
+    """
+
+    line: int
+    kind: str
+    name: str
+    directory: Optional[str] = None
+    pe: bool = False
+    compression: Optional[str] = None
+    error: Optional[str] = None
+
+
+def _to_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+def _to_str(value) -> str:
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def _make_row(line: int, record: dict) -> ManifestRow:
+    # JSONL values can be numbers (ex: a numeric user name), objects or lists.
+    nested = [
+        field
+        for field in ("type", "name", "directory", "compression")
+        if isinstance(record.get(field), (dict, list))
+    ]
+    kind = _to_str(record.get("type")).lower()
+    name = _to_str(record.get("name"))
+    directory = _to_str(record.get("directory")) or None
+    compression = _to_str(record.get("compression")) or None
+
+    error = None
+    if nested:
+        error = f"invalid '{nested[0]}', expected a string"
+    elif not name:
+        error = "missing 'name'"
+    elif kind not in ("user", "group"):
+        error = f"invalid type '{kind}', expected 'user' or 'group'"
+    elif kind == "group" and (directory is None or ":" not in directory):
+        error = "group rows need a 'directory' of the form host:/path"
+    elif compression and compression not in config.COMPRESSION_OPTIONS:
+        error = f"invalid compression '{compression}'"
+
+    return ManifestRow(
+        line=line,
+        kind=kind,
+        name=name,
+        directory=directory,
+        pe=_to_bool(record.get("pe")),
+        compression=compression,
+        error=error,
+    )
+
+
+def _read_csv(f) -> Iterator[ManifestRow]:
+    reader = csv.DictReader(f)
+    for record in reader:
+        yield _make_row(reader.line_num, record)
+
+
+def _read_jsonl(f) -> Iterator[ManifestRow]:
+    for line, text in enumerate(f, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError as e:
+            yield ManifestRow(line=line, kind="", name="", error=f"invalid JSON: {e}")
+            continue
+
+        if not isinstance(record, dict):
+            yield ManifestRow(
+                line=line, kind="", name="", error="expected a JSON object"
+            )
+            continue
+
+        yield _make_row(line, record)
+
+
+def read_manifest(path: str, fmt: Optional[str] = None) -> Iterator[ManifestRow]:
+    """Lazily read an import manifest of users and group directories.
+
+    CSV manifests need a header row with the columns in MANIFEST_FIELDS, JSONL
+    manifests hold one object per line with the same keys. 'directory' is only used
+    for group rows, 'pe' only for user rows. When no format is given it is guessed
+    from the file extension.
+    """
+    if fmt is None:
+        fmt = "jsonl" if path.endswith((".jsonl", ".json")) else "csv"
+
+    if fmt not in MANIFEST_FORMATS:
+        raise ValueError(f"Unknown manifest format '{fmt}'")
+
+    with open(path, "r", newline="") as f:
+        if fmt == "csv":
+            yield from _read_csv(f)
+        else:
+            yield from _read_jsonl(f)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import functools
+import os
+import re
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import logger
+from staging import BatchWriter
+
+LOGGER = logger.get_logger(__name__)
+
+# Shard files are named '{SHARD_PREFIX}{number}.conf'. '@' is not allowed in
+# resource names, so they never collide with a file named after a resource.
+SHARD_PREFIX = "packed@"
+
+HEADER = "# Resources packed by brs_backup, see 'brs_backup migrate-layout'.\n"
+
+# Quoted strings, comments and braces, everything else doesn't affect nesting.
+_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\\n])*"|#[^\n]*|[{}]')
+_NAME_RE = re.compile(r'^[ \t]*Name[ \t]*=[ \t]*"?([^"\r\n]*?)"?[ \t]*$', re.I | re.M)
+
+
+def shard_path(location: str, name: str, shards: int) -> str:
+    """The shard file of the given directory holding the resource 'name'."""
+    width = len(f"{shards - 1:x}")
+    shard = zlib.crc32(name.encode("utf-8")) % shards
+    return os.path.join(location, f"{SHARD_PREFIX}{shard:0{width}x}.conf")
+
+
+def is_shard(path: str) -> bool:
+    return os.path.basename(path).startswith(SHARD_PREFIX)
+
+
+def split_resources(contents: str) -> List[Tuple[Optional[str], str]]:
+    """Split config file contents into its top level resources, as (name, text)
+    pairs in file order. Text outside of resources, like comments, is dropped.
+    """
+    resources = []
+    depth = 0
+    start = 0
+    for match in _TOKEN_RE.finditer(contents):
+        token = match.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth < 0:
+                raise ValueError(f"Unbalanced '}}' at offset {match.start()}")
+            if depth == 0:
+                text = contents[start : match.end()]
+                # The resource starts at its type, after the comments before it.
+                lines = text.lstrip().split("\n")
+                while lines and lines[0].lstrip().startswith("#"):
+                    lines.pop(0)
+                text = "\n".join(lines).strip()
+                name = _NAME_RE.search(text)
+                resources.append((name.group(1) if name else None, text))
+                start = match.end()
+
+    if depth:
+        raise ValueError("Unbalanced '{' at the end")
+    return resources
+
+
+def render(resources: Dict[str, str]) -> str:
+    """The contents of a shard holding the given resources, by name."""
+    return HEADER + "".join(f"\n{text}\n" for text in resources.values())
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_shard(contents: str) -> Tuple[Tuple[Optional[str], str], ...]:
+    # Cached, a batch looks into the same shards again and again.
+    return tuple(split_resources(contents))
+
+
+def _resources(path: str, contents: Optional[str]) -> "OrderedDict[str, str]":
+    resources = OrderedDict()
+    if contents is None:
+        return resources
+
+    for name, text in _parse_shard(contents):
+        if name is None:
+            err_msg = f"Resource without a name in {path}"
+            LOGGER.error(err_msg)
+            raise ValueError(err_msg)
+        resources[name] = text
+    return resources
+
+
+def contains(path: str, name: str, writer: BatchWriter) -> bool:
+    """Whether the shard will hold the resource once the batch is committed. Other
+    runs may change the shard meanwhile, but not this resource while the batch holds
+    the lock of its name.
+    """
+    return name in _resources(path, writer.preview(path))
+
+
+def add(path: str, name: str, text: str, writer: BatchWriter) -> None:
+    """Stage the shard with the resource added. Raises FileExistsError if the
+    shard already holds it.
+    """
+    if contains(path, name, writer):
+        raise FileExistsError(f"'{name}' already exists in {path}")
+
+    text = text.strip()
+
+    def change(contents: Optional[str]) -> str:
+        # The shard as of the commit, with the resources other runs added since.
+        resources = _resources(path, contents)
+        if name in resources:
+            raise FileExistsError(f"'{name}' already exists in {path}")
+        resources[name] = text
+        return render(resources)
+
+    writer.edit(path, change)
+
+
+def remove(path: str, name: str, writer: BatchWriter) -> None:
+    """Stage the shard without the resource, or the removal of the shard if it was
+    the last one. Raises FileNotFoundError if the shard doesn't hold it.
+    """
+    if not contains(path, name, writer):
+        raise FileNotFoundError(f"'{name}' not found in {path}")
+
+    def change(contents: Optional[str]) -> Optional[str]:
+        resources = _resources(path, contents)
+        if name not in resources:
+            raise FileNotFoundError(f"'{name}' not found in {path}")
+        del resources[name]
+        return render(resources) if resources else None
+
+    writer.edit(path, change)
+
+
+def migrate(location: str, shards: Optional[int], writer: BatchWriter) -> int:
+    """Stage moving every resource of the '.conf' files in 'location' into
+    'shards' shard files, or into one file per resource when 'shards' is None.
+    Returns the number of resources moved.
+    """
+    resources = OrderedDict()
+    sources = []
+    for filename in sorted(os.listdir(location)):
+        path = os.path.join(location, filename)
+        if not filename.endswith(".conf") or not os.path.isfile(path):
+            continue
+        sources.append(path)
+        for name, text in split_resources(writer.read(path) or ""):
+            if name is None:
+                err_msg = f"Resource without a name in {path}"
+                LOGGER.error(err_msg)
+                raise ValueError(err_msg)
+            if name in resources:
+                err_msg = f"'{name}' is defined more than once in {location}"
+                LOGGER.error(err_msg)
+                raise ValueError(err_msg)
+            resources[name] = text
+
+    targets = OrderedDict()
+    for name, text in resources.items():
+        if shards is None:
+            path = os.path.join(location, f"{name}.conf")
+            targets[path] = text + "\n"
+        else:
+            path = shard_path(location, name, shards)
+            targets.setdefault(path, OrderedDict())[name] = text
+    if shards is not None:
+        targets = OrderedDict((path, render(shard)) for path, shard in targets.items())
+
+    for path in sources:
+        if path not in targets:
+            writer.remove(path)
+    for path, contents in targets.items():
+        if writer.read(path) != contents:
+            writer.replace(path, contents)
+
+    return len(resources)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import time
+from typing import Callable, ContextManager, Optional
+
+import background
+import config
+import logger
+
+LOGGER = logger.get_logger(__name__)
+
+# Seconds after which a reload worker that didn't check in is assumed dead.
+_WORKER_TIMEOUT = 600
+
+# Seconds between checks of runs waiting for their reload.
+_POLL_INTERVAL = 0.1
+
+
+class ReloadError(Exception):
+    """The reload covering a request failed."""
+
+
+class Reloader:
+    """Coalesces the director reloads requested by concurrent and back-to-back runs.
+
+    Runs register a pending reload in a state file guarded by a lock file shared by
+    all runs, and a background worker calls 'reload' once no run asked for one for
+    'window' seconds, or the oldest pending request waited 'max_delay' seconds. A
+    reload covers every request registered before it started, so N runs in a row
+    cost about one reload.
+    """
+
+    def __init__(
+        self,
+        reload: Callable[[], None],
+        path: Optional[str] = None,
+        window: Optional[float] = None,
+        max_delay: Optional[float] = None,
+    ):
+        self.reload = reload
+        self.path = path or config.RELOAD_STATE_LOCATION
+        self.window = config.RELOAD_QUIET_WINDOW if window is None else window
+        self.max_delay = config.RELOAD_MAX_DELAY if max_delay is None else max_delay
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock_path = f"{self.path}.lock"
+
+    def _locked(self) -> ContextManager[None]:
+        return background.locked(self._lock_path)
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {
+                # Sequence numbers of the last request, and of the last request
+                # covered by a successful and a failed reload.
+                "requested": 0,
+                "reloaded": 0,
+                "failed": 0,
+                # When the oldest and the newest pending request were made.
+                "first": None,
+                "last": None,
+                "last_error": None,
+                "last_reload": None,
+                "worker": None,
+            }
+
+    def _write_state(self, state: dict) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _pending(state: dict) -> bool:
+        return max(state["reloaded"], state["failed"]) < state["requested"]
+
+    def status(self) -> dict:
+        """The number of pending requests and the last reload."""
+        with self._locked():
+            state = self._read_state()
+        return {
+            "pending": state["requested"] - max(state["reloaded"], state["failed"]),
+            "last_error": state["last_error"],
+            "last_reload": state["last_reload"],
+            "worker": background.alive(state["worker"], _WORKER_TIMEOUT),
+        }
+
+    def request(self) -> int:
+        """Register a pending reload, returns its sequence number for wait."""
+        with self._locked():
+            state = self._read_state()
+            now = time.time()
+            if not self._pending(state):
+                state["first"] = now
+            state["requested"] += 1
+            state["last"] = now
+            self._write_state(state)
+            return state["requested"]
+
+    def schedule(self) -> None:
+        """Reload in a background process once the requests settle, unless one is
+        already waiting to do so or nothing is pending.
+        """
+        with self._locked():
+            state = self._read_state()
+            running = background.alive(state["worker"], _WORKER_TIMEOUT)
+            if not self._pending(state) or running:
+                return
+
+        background.detach(self._worker, "Failed to reload the director due to")
+
+    def wait(self, sequence: int) -> None:
+        """Wait for the reload covering the request 'sequence'. Raises ReloadError if
+        that reload failed.
+        """
+        while True:
+            with self._locked():
+                state = self._read_state()
+                running = background.alive(state["worker"], _WORKER_TIMEOUT)
+            if state["reloaded"] >= sequence:
+                return
+            if state["failed"] >= sequence:
+                raise ReloadError(
+                    f"Reloading the director failed: {state['last_error']}"
+                )
+            if not running:
+                # The worker died without finishing, take over.
+                self.schedule()
+            time.sleep(_POLL_INTERVAL)
+
+    def _due(self, state: dict) -> float:
+        return min(state["last"] + self.window, state["first"] + self.max_delay)
+
+    def _worker(self) -> None:
+        with self._locked():
+            state = self._read_state()
+            if background.alive(state["worker"], _WORKER_TIMEOUT):
+                return
+            state["worker"] = [os.getpid(), time.time()]
+            self._write_state(state)
+
+        try:
+            # Requests registered while reloading didn't start another worker.
+            while True:
+                with self._locked():
+                    state = self._read_state()
+                    if not self._pending(state):
+                        state["worker"] = None
+                        self._write_state(state)
+                        return
+                    state["worker"] = [os.getpid(), time.time()]
+                    self._write_state(state)
+
+                wait = self._due(state) - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                    continue
+
+                try:
+                    self._reload()
+                except Exception as e:
+                    # Waiting runs were told, later requests get another reload.
+                    LOGGER.critical(f"Failed to reload the director due to: {e}")
+        except BaseException:
+            with self._locked():
+                state = self._read_state()
+                state["worker"] = None
+                self._write_state(state)
+            raise
+
+    def _reload(self) -> None:
+        """Reload once, covering every request registered so far."""
+        with self._locked():
+            target = self._read_state()["requested"]
+
+        started = time.time()
+        start = time.monotonic()
+        try:
+            self.reload()
+        except Exception as e:
+            with self._locked():
+                state = self._read_state()
+                state["failed"] = target
+                state["last_error"] = str(e)
+                self._settle(state, target, started)
+            raise
+
+        seconds = time.monotonic() - start
+        with self._locked():
+            state = self._read_state()
+            covered = target - max(state["reloaded"], state["failed"])
+            state["reloaded"] = target
+            state["last_error"] = None
+            state["last_reload"] = {
+                "at": time.time(),
+                "seconds": round(seconds, 3),
+                "requests": covered,
+            }
+            self._settle(state, target, started)
+
+        LOGGER.info(f"Reloaded the director for {covered} requests in {seconds:.2f}s")
+
+    def _settle(self, state: dict, target: int, started: float) -> None:
+        # Requests registered during the reload are still pending.
+        state["first"] = started if state["requested"] > target else None
+        self._write_state(state)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import functools
+import pkgutil
+import string
+from typing import Iterable, List, Mapping
+
+
+class Template:
+    """A config template compiled once into a '%'-style format string, so rendering
+    is a single C-level substitution instead of re-parsing the template's
+    'str.format' fields on every call.
+
+    Only plain '{name}' fields are supported, which is all the Bareos templates use.
+    """
+
+    def __init__(self, text: str):
+        self.fields = []
+        parts = []
+
+        for literal, field, format_spec, conversion in string.Formatter().parse(text):
+            parts.append(literal.replace("%", "%%"))
+
+            if field is None:
+                continue
+
+            if not field.isidentifier() or format_spec or conversion:
+                raise ValueError(f"Unsupported template field '{{{field}}}'")
+
+            if field not in self.fields:
+                self.fields.append(field)
+            parts.append(f"%({field})s")
+
+        self._format = "".join(parts)
+
+    def render(self, **values) -> str:
+        return self._format % values
+
+    def render_many(self, resources: Iterable[Mapping]) -> List[str]:
+        """Render the template once for each mapping of field values."""
+        fmt = self._format
+        return [fmt % values for values in resources]
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(template: str) -> Template:
+    """Load and compile 'templates/{template}.txt' once per process.
+
+    Templates are read relative to this module rather than the working directory, and
+    through pkgutil so they can also be read from inside the .par archive.
+    """
+    return Template(pkgutil.get_data(__name__, f"templates/{template}.txt").decode())
+
+
+def render(template: str, **values) -> str:
+    """Render the named template with the given field values."""
+    return get_template(template).render(**values)
+
+
+def render_many(template: str, resources: Iterable[Mapping]) -> List[str]:
+    """Render the named template for a whole batch of resources in one call."""
+    return get_template(template).render_many(resources)
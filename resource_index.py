@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+import logger
+import config
+
+LOGGER = logger.get_logger(__name__)
+
+# Matches the 'Name = ...' directive of a resource, quoted or not.
+NAME_RE = re.compile(rb'^[ \t]*Name[ \t]*=[ \t]*"?([^"\r\n]*?)"?[ \t]*$', re.I | re.M)
+
+# Format version of the persisted index, bump when its layout changes.
+_VERSION = 1
+
+# Seconds within which a directory or file mtime is too recent to be trusted.
+_RACY_SECONDS = 2
+
+_INDEX = None
+
+
+def parse_names(contents: bytes) -> List[str]:
+    """Return the names of every resource defined in a config file."""
+    return [name.decode("utf-8", "replace") for name in NAME_RE.findall(contents)]
+
+
+def resource_dirs() -> Dict[str, str]:
+    """The directories indexed for each resource kind."""
+    return {
+        "job": config.JOB_FILE_LOCATION,
+        "fileset": config.FILESET_FILE_LOCATION,
+        "client": config.CLIENT_FILE_LOCATION,
+        "storage": config.STORAGE_FILE_LOCATION,
+        "jobdefs": config.JOBDEFS_FILE_LOCATION,
+    }
+
+
+class ResourceIndex:
+    """An index of the names of every Bareos resource defined in the '.conf' files of
+    the bareos-dir.d directories, keyed by resource kind.
+
+    The index is persisted to 'path' together with the mtime of every directory and
+    file. On load, a directory whose mtime didn't change is not scanned at all, and
+    in a changed directory only files with a new mtime or size are parsed again.
+    Since editing a file in place doesn't change its directory's mtime, such edits
+    are only picked up once something is added to or removed from the directory.
+    """
+
+    def __init__(self, path: Optional[str] = None, dirs: Optional[Dict] = None):
+        self.path = path
+        self.dirs = dirs if dirs is not None else resource_dirs()
+        # Kind -> {"dir": ..., "mtime_ns": ..., "files": {file: [mtime_ns, size, names]}}
+        self._state = {}
+        # Kind -> name -> files defining it.
+        self._names = {}
+        self.scanned_files = 0
+
+    def load(self) -> "ResourceIndex":
+        """Bring the index up to date, reusing the persisted index where possible, and
+        persist it again if anything changed.
+        """
+        saved = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                if data.get("version") == _VERSION:
+                    saved = data["kinds"]
+            except (OSError, ValueError, KeyError) as e:
+                LOGGER.warning(f"Ignoring unreadable resource index {self.path}: {e}")
+
+        changed = False
+        for kind, directory in self.dirs.items():
+            state = saved.get(kind)
+            if state is None or state.get("dir") != directory:
+                state = {"dir": directory, "mtime_ns": None, "files": {}}
+
+            if self._refresh(state):
+                changed = True
+            self._state[kind] = state
+
+        self._build_names()
+
+        if changed:
+            LOGGER.debug(f"Rescanned {self.scanned_files} resource files")
+            self.save()
+
+        return self
+
+    def _refresh(self, state: dict) -> bool:
+        """Rescan a directory if its mtime changed. Returns whether it was rescanned."""
+        try:
+            mtime_ns = os.stat(state["dir"]).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+
+        if mtime_ns is not None and mtime_ns == state["mtime_ns"]:
+            return False
+
+        old_files = state["files"]
+        files = {}
+        # Timestamps this recent may still be shared with a change that lands right
+        # after the scan, so they aren't trusted next time (like git's racy index).
+        racy_ns = int((time.time() - _RACY_SECONDS) * 1e9)
+
+        if mtime_ns is not None:
+            with os.scandir(state["dir"]) as it:
+                for entry in it:
+                    if not entry.name.endswith(".conf") or not entry.is_file():
+                        continue
+
+                    stat = entry.stat()
+                    old = old_files.get(entry.name)
+                    if old is not None and old[:2] == [stat.st_mtime_ns, stat.st_size]:
+                        files[entry.name] = old
+                        continue
+
+                    with open(entry.path, "rb") as f:
+                        names = parse_names(f.read())
+                    if stat.st_mtime_ns > racy_ns:
+                        files[entry.name] = [None, stat.st_size, names]
+                    else:
+                        files[entry.name] = [stat.st_mtime_ns, stat.st_size, names]
+                    self.scanned_files += 1
+
+        state["mtime_ns"] = (
+            mtime_ns if mtime_ns is None or mtime_ns <= racy_ns else None
+        )
+        state["files"] = files
+        return True
+
+    def _build_names(self) -> None:
+        self._names = {}
+        for kind, state in self._state.items():
+            names = self._names[kind] = {}
+            for filename, (_, _, file_names) in state["files"].items():
+                for name in file_names:
+                    names.setdefault(name, []).append(
+                        os.path.join(state["dir"], filename)
+                    )
+
+    def save(self) -> None:
+        """Atomically persist the index to 'path', if one was given."""
+        if not self.path:
+            return
+
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"version": _VERSION, "kinds": self._state}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            LOGGER.warning(f"Failed to persist resource index {self.path}: {e}")
+
+    def names(self, kind: str) -> Set[str]:
+        return set(self._names.get(kind, ()))
+
+    def __contains__(self, item) -> bool:
+        kind, name = item
+        return name in self._names.get(kind, {})
+
+    def files(self, kind: str, name: str) -> List[str]:
+        """The paths of the files defining the named resource."""
+        return list(self._names.get(kind, {}).get(name, ()))
+
+    def duplicates(self, kind: str) -> Dict[str, List[str]]:
+        """Names defined more than once, with the files defining them."""
+        return {
+            name: files
+            for name, files in self._names.get(kind, {}).items()
+            if len(files) > 1
+        }
+
+    def missing(self, kind: str, names: Iterable[str]) -> List[str]:
+        """The given names that have no resource of that kind."""
+        known = self._names.get(kind, {})
+        return [name for name in names if name not in known]
+
+
+def get_index() -> ResourceIndex:
+    """Return the resource index shared by the whole process, loading it on first
+    use.
+    """
+    global _INDEX
+
+    if _INDEX is None:
+        _INDEX = ResourceIndex(config.INDEX_LOCATION).load()
+
+    return _INDEX
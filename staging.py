@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Callable, List, Optional
+
+import background
+import config
+import logger
+
+LOGGER = logger.get_logger(__name__)
+
+# Paths written or removed by committed batches, see take_committed_paths.
+_COMMITTED_PATHS = []  # type: List[str]
+
+
+def take_committed_paths() -> List[str]:
+    """Return the paths changed by batches committed since the last call, so only
+    those are staged in git.
+    """
+    paths = list(dict.fromkeys(_COMMITTED_PATHS))
+    del _COMMITTED_PATHS[:]
+    return paths
+
+
+def add_committed_paths(paths: List[str]) -> None:
+    """Record paths changed outside of a batch, like config files the director
+    wrote itself, to be staged in git along with the batches.
+    """
+    _COMMITTED_PATHS.extend(paths)
+
+
+def _lock_path() -> str:
+    return os.path.join(config.LOCK_LOCATION, "files.lock")
+
+
+def _fsync(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BatchWriter:
+    """Stage a batch of config file writes and removals and apply them together.
+
+    New files are written into a hidden staging directory next to their destination
+    (so on the same filesystem), and removed files are moved into it. On commit the
+    staged files are flushed as one group, then renamed into place, and every
+    destination directory is fsynced once. A crash before the renames leaves only
+    the staging directory behind, which Bareos never reads, instead of half-written
+    '.conf' files.
+
+    Writes are applied in the order they were staged, after all removals, so a Job
+    staged after its FileSet never appears without it.
+
+    Every path the batch looks at is locked against other runs until it is committed
+    or aborted, so a file checked for existence or read can't change before the
+    batch acts on it. Runs changing other files don't wait for each other. Files
+    shared by many runs are changed with edit instead, and only locked on commit.
+    """
+
+    def __init__(self):
+        # Destination directory -> staging directory.
+        self._staging_dirs = {}
+        # Destination path -> staged path, in staging order.
+        self._writes = {}
+        self._removals = []
+        # Destination path -> changes staged with edit, in staging order.
+        self._edits = {}
+        # Keys of the lock file held by this batch.
+        self._locks = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def __len__(self):
+        return len(self._writes) + len(self._removals) + len(self._edits)
+
+    def _staging_dir(self, path: str) -> str:
+        directory = os.path.dirname(os.path.abspath(path))
+        if directory not in self._staging_dirs:
+            self._staging_dirs[directory] = tempfile.mkdtemp(
+                prefix=".brs_backup-", dir=directory
+            )
+        return self._staging_dirs[directory]
+
+    def lock(self, path: str) -> None:
+        """Lock the file at path against other runs until the batch is committed or
+        aborted. Files are locked when the batch first looks at them, lock them up
+        front in a fixed order when runs may look at them in different orders.
+        """
+        if not config.LOCK_LOCATION:
+            return
+
+        # Every config file is a byte of one lock file, picked by a hash of its full
+        # path, so a batch holds a single file descriptor however many it locks.
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).digest()
+        key = int.from_bytes(digest[:7], "big")
+        if key in self._locks:
+            return
+
+        os.makedirs(config.LOCK_LOCATION, exist_ok=True)
+        try:
+            background.acquire(_lock_path(), key, config.LOCK_TIMEOUT)
+        except background.LockTimeout as e:
+            LOGGER.error(f"Timed out locking {path}: {e}")
+            raise
+        self._locks.add(key)
+
+    def _staged(self, path: str) -> Optional[str]:
+        # The contents after the staged writes and removals, without the edits.
+        if path in self._writes:
+            path = self._writes[path]
+        elif path in self._removals:
+            return None
+
+        try:
+            with open(path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _edited(self, path: str, contents: Optional[str]) -> Optional[str]:
+        for change in self._edits.get(path, ()):
+            contents = change(contents)
+        return contents
+
+    def exists(self, path: str) -> bool:
+        """Whether the file will exist once the batch is committed."""
+        self.lock(path)
+        if path in self._edits:
+            return self.preview(path) is not None
+        if path in self._writes:
+            return True
+        return path not in self._removals and os.path.exists(path)
+
+    def read(self, path: str) -> Optional[str]:
+        """The contents the file will have once the batch is committed, or 'None' if
+        it won't exist.
+        """
+        self.lock(path)
+        return self.preview(path)
+
+    def preview(self, path: str) -> Optional[str]:
+        """Like read, without locking the file, so other runs may still change it
+        before the batch is committed. For files changed with edit.
+        """
+        return self._edited(path, self._staged(path))
+
+    def write(self, path: str, contents: str) -> None:
+        """Stage a new file at path. Raises FileExistsError if it already exists or
+        is already staged.
+        """
+        if self.exists(path):
+            raise FileExistsError(f"{path} already exists")
+
+        self.replace(path, contents)
+
+    def replace(self, path: str, contents: str) -> None:
+        """Stage the contents of the file at path, whether it exists or not. On
+        commit the file is swapped for the new one by a rename.
+        """
+        self.lock(path)
+        self._edits.pop(path, None)
+        if path in self._removals:
+            self._removals.remove(path)
+
+        staged = self._writes.get(path) or os.path.join(
+            self._staging_dir(path), f"{len(self._writes)}-{os.path.basename(path)}"
+        )
+        with open(staged, "w") as f:
+            f.write(contents)
+
+        self._writes[path] = staged
+
+    def remove(self, path: str) -> None:
+        """Stage the removal of the file at path, dropping any write staged for it
+        earlier in this batch. Raises FileNotFoundError if it doesn't exist.
+        """
+        if not self.exists(path):
+            raise FileNotFoundError(f"{path} not found")
+
+        self._edits.pop(path, None)
+        if path in self._writes:
+            os.remove(self._writes.pop(path))
+            # Only a replaced file is still on disk.
+            if not os.path.exists(path):
+                return
+
+        self._removals.append(path)
+
+    def edit(self, path: str, change: Callable[[Optional[str]], Optional[str]]) -> None:
+        """Stage a change of the file at path. On commit 'change' is called with the
+        contents of the file at that time ('None' if it doesn't exist) and returns its
+        new contents ('None' to remove it). The file is only locked while committing,
+        so runs changing different parts of a shared file don't wait for each other.
+        """
+        self._edits.setdefault(path, []).append(change)
+
+    def _apply_edits(self) -> None:
+        # All in one go and in a fixed order, so commits never wait for each other in
+        # a cycle.
+        for path in sorted(self._edits):
+            self.lock(path)
+
+        edits = self._edits
+        self._edits = {}
+        for path, changes in edits.items():
+            contents = self._staged(path)
+            for change in changes:
+                contents = change(contents)
+
+            if contents is not None:
+                self.replace(path, contents)
+            elif self.exists(path):
+                self.remove(path)
+
+    def commit(self) -> None:
+        """Apply every staged edit, removal and write, then clean up the staging
+        directories.
+        """
+        try:
+            self._apply_edits()
+        except BaseException:
+            self.abort()
+            raise
+
+        writes = len(self._writes)
+        removals = len(self._removals)
+        paths = self._removals + list(self._writes)
+
+        try:
+            # Flush all new files before any of them become visible.
+            for staged in self._writes.values():
+                _fsync(staged)
+
+            for i, path in enumerate(self._removals):
+                os.rename(
+                    path,
+                    os.path.join(
+                        self._staging_dir(path), f"removed-{i}-{os.path.basename(path)}"
+                    ),
+                )
+
+            for path, staged in self._writes.items():
+                os.rename(staged, path)
+
+            for directory in self._staging_dirs:
+                _fsync(directory)
+        finally:
+            # Also after a failure, some of the files may have changed.
+            _COMMITTED_PATHS.extend(paths)
+            self.abort()
+
+        if writes or removals:
+            LOGGER.info(f"Committed {writes} file writes and {removals} removals")
+
+    def abort(self) -> None:
+        """Drop everything staged along with the staging directories, and release
+        the locks of the batch.
+        """
+        for staging_dir in self._staging_dirs.values():
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        self._staging_dirs = {}
+        self._writes = {}
+        self._removals = []
+        self._edits = {}
+
+        for key in self._locks:
+            background.release(_lock_path(), key)
+        self._locks = set()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+A fake bareos-dir speaking just enough of the console protocol for the tests.
+"""
+
+import asyncio
+import json
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Union
+
+from bareos.bsock.constants import Constants
+from bareos.bsock.crammd5 import CramMd5
+from bareos.bsock.protocolmessages import ProtocolMessages
+from bareos.util.password import Password
+
+Reply = Union[bytes, dict, list, Callable[[bytes], Union[bytes, dict, list]]]
+
+
+class FakeDirector:
+    """A director listening on localhost, served by an event loop in a background
+    thread so it can be used by blocking and asyncio clients alike.
+
+    Every command is answered from 'replies', keyed by the command, followed by a
+    BNET_EOD signal. Commands without a reply are answered by 'default', or with an
+    empty message. In JSON API mode, replies are wrapped into a JSON-RPC response,
+    dict and list replies become the result as they are. Signals are
+    answered with BNET_POLL, and BNET_TERMINATE closes the connection.
+    """
+
+    def __init__(self, password: str = "secret", replies: Optional[Dict] = None):
+        self.password = Password(password)
+        self.replies = {
+            b"version": b"bareos-dir Version: 17.2.4 (21 Sep 2017)\n",
+        }  # type: Dict[bytes, Reply]
+        self.replies.update(replies or {})
+        # Reply for commands not in replies.
+        self.default = b""  # type: Reply
+        self.commands = []  # type: List[bytes]
+        # Signals received from consoles.
+        self.signals = []  # type: List[int]
+        # Send a BNET_HEARTBEAT before every reply.
+        self.heartbeat = False
+        self.connections = 0
+        self.port = None
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._writers = set()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def start(self) -> "FakeDirector":
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0), self._loop
+        ).result()
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    def stop(self) -> None:
+        async def close():
+            self._server.close()
+            await self._close_connections()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def drop_connections(self) -> None:
+        """Close every console connection, as if the director restarted."""
+        asyncio.run_coroutine_threadsafe(self._close_connections(), self._loop).result()
+
+    async def _close_connections(self):
+        for writer in self._writers:
+            writer.close()
+        # Let the handlers finish.
+        while self._writers:
+            await asyncio.sleep(0.001)
+
+    async def _handle(self, reader, writer):
+        async def recv():
+            header = struct.unpack("!i", await reader.readexactly(4))[0]
+            if header <= 0:
+                return header
+            return await reader.readexactly(header)
+
+        def send(data: bytes):
+            writer.write(struct.pack("!i", len(data)) + bytes(data))
+
+        def signal(value: int):
+            writer.write(struct.pack("!i", value))
+
+        self._writers.add(writer)
+        try:
+            await recv()  # Hello
+
+            # The director challenges the console...
+            chal, msg = CramMd5.challenge("bareos-dir")
+            send(msg)
+            if await recv() not in CramMd5.expected_responses(
+                self.password.md5(), chal
+            ):
+                send(ProtocolMessages.auth_failed())
+                return
+            send(ProtocolMessages.auth_ok())
+
+            # ...and the console challenges the director.
+            chal, _ = CramMd5.parse_challenge(await recv())
+            send(CramMd5.response(self.password.md5(), chal) + b"\0")
+            if not ProtocolMessages.is_auth_ok(await recv()):
+                return
+            send(b"1000 OK: bareos-dir Version: 17.2.4 (21 Sep 2017)\n")
+            self.connections += 1
+
+            api_json = False
+            while True:
+                command = await recv()
+                if isinstance(command, int):
+                    # Like the director, answer every signal with a poll.
+                    self.signals.append(command)
+                    if command == Constants.BNET_TERMINATE:
+                        break
+                    signal(Constants.BNET_POLL)
+                    await writer.drain()
+                    continue
+                self.commands.append(command)
+
+                if self.heartbeat:
+                    signal(Constants.BNET_HEARTBEAT)
+
+                if command.startswith(b".api"):
+                    api_json = b"json" in command
+
+                reply = self.replies.get(command, self.default)
+                if callable(reply):
+                    reply = reply(command)
+                if api_json:
+                    result = reply.decode() if isinstance(reply, bytes) else reply
+                    reply = json.dumps(
+                        {"jsonrpc": "2.0", "id": None, "result": result}
+                    ).encode()
+
+                for line in reply.splitlines(True):
+                    send(line)
+                signal(Constants.BNET_EOD)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            self._writers.discard(writer)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the asyncio bareos.bsock clients, against a fake director.
+"""
+
+import asyncio
+import unittest
+
+from bareos.bsock import (
+    AsyncDirectorConsole,
+    AsyncDirectorConsoleJson,
+    DirectorConsole,
+)
+from bareos.exceptions import AuthenticationError
+from bareos.util.password import Password
+
+from tests.fake_director import FakeDirector
+
+
+class TestAsyncDirectorConsole(unittest.TestCase):
+    def setUp(self):
+        self.director = FakeDirector().start()
+        self.addCleanup(self.director.stop)
+
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def console(self, cls=AsyncDirectorConsole, password="secret"):
+        return cls(port=self.director.port, password=Password(password))
+
+    def test_call(self):
+        """
+        Testing authentication, the connection setup and a command.
+        """
+
+        async def run():
+            async with self.console() as console:
+                return await console.call("version")
+
+        result = self.loop.run_until_complete(run())
+        self.assertEqual(result, b"bareos-dir Version: 17.2.4 (21 Sep 2017)\n")
+        self.assertEqual(self.director.commands, [b"autodisplay off", b"version"])
+
+    def test_wrong_password(self):
+        """
+        Testing that a wrong password fails authentication.
+        """
+
+        async def run():
+            async with self.console(password="wrong"):
+                pass
+
+        with self.assertRaises(AuthenticationError):
+            self.loop.run_until_complete(run())
+
+    def test_json(self):
+        """
+        Testing that the JSON console switches to API mode and decodes results.
+        """
+
+        async def run():
+            async with self.console(AsyncDirectorConsoleJson) as console:
+                return await console.call("version")
+
+        result = self.loop.run_until_complete(run())
+        self.assertEqual(result, "bareos-dir Version: 17.2.4 (21 Sep 2017)\n")
+        self.assertEqual(
+            self.director.commands[:2], [b".api json", b".api json compact=yes"]
+        )
+
+    def test_concurrent_sessions(self):
+        """
+        Testing many sessions, each running several commands, in one event loop.
+        """
+        self.director.replies[b"status"] = lambda command: b"status line\n" * 100
+
+        async def session():
+            async with self.console() as console:
+                return [await console.call("status") for _ in range(5)]
+
+        async def run():
+            return await asyncio.gather(*(session() for _ in range(100)))
+
+        results = self.loop.run_until_complete(run())
+        self.assertEqual(len(results), 100)
+        for result in results:
+            self.assertEqual(result, [b"status line\n" * 100] * 5)
+        self.assertEqual(self.director.connections, 100)
+
+    def test_concurrent_calls(self):
+        """
+        Testing that concurrent calls on one session don't mix up their results.
+        """
+        for i in range(20):
+            self.director.replies[b"echo %d" % i] = b"%d\n" % i
+
+        async def run():
+            async with self.console() as console:
+                return await asyncio.gather(
+                    *(console.call("echo %d" % i) for i in range(20))
+                )
+
+        results = self.loop.run_until_complete(run())
+        self.assertEqual(results, [b"%d\n" % i for i in range(20)])
+
+    def test_reconnect(self):
+        """
+        Testing that a call on a lost connection reconnects once.
+        """
+
+        async def run():
+            async with self.console() as console:
+                await console.disconnect()
+                return await console.call("version")
+
+        result = self.loop.run_until_complete(run())
+        self.assertEqual(result, b"bareos-dir Version: 17.2.4 (21 Sep 2017)\n")
+        self.assertEqual(self.director.connections, 2)
+
+    def test_blocking_console(self):
+        """
+        Testing the blocking DirectorConsole, which shares the cram-md5 code.
+        """
+        console = DirectorConsole(port=self.director.port, password=Password("secret"))
+        self.assertEqual(
+            console.call("version"), b"bareos-dir Version: 17.2.4 (21 Sep 2017)\n"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the Bareos base64 codec in bareos/util/bareosbase64.py.
+"""
+
+import random
+import unittest
+
+from bareos.util.bareosbase64 import BASE64
+
+# string, compatible encoding, Bareos specific encoding
+STRINGS = [
+    (b"", b"", b""),
+    (b"a", b"YQ", b"YB"),
+    (b"ab", b"YWI", b"YWC"),
+    (b"abc", b"YWJj", b"YWJj"),
+    (b"\xff", b"/w", b"/D"),
+    (b"\x01\x80", b"AYA", b"A4A"),
+    (b"\x01\x02\x80", b"AQKA", b"AQ+A"),
+    (bytes(range(250, 256)), b"+vv8/f7/", b"+//8////"),
+]
+
+# The stat packet of a file in 'list files' / bvfs output.
+STAT = "gB DL+b IGk B Po Po A Cp BAA I BhjW2x BhjW2x BhjW2x A A C"
+STAT_VALUES = [2049, 835483, 33188, 1, 1000, 1000, 0, 169, 4096, 8]
+STAT_VALUES += [1636658609, 1636658609, 1636658609, 0, 0, 2]
+
+
+class TestBareosBase64(unittest.TestCase):
+    def test_string_to_base64(self):
+        """
+        Testing that strings are encoded compatible and Bareos specific.
+        """
+        for string, compatible, specific in STRINGS:
+            with self.subTest(string=string):
+                self.assertEqual(BASE64.string_to_base64(string, True), compatible)
+                self.assertEqual(BASE64.string_to_base64(string), specific)
+                self.assertEqual(
+                    BASE64.string_to_base64(bytearray(string)), bytearray(specific)
+                )
+
+    def test_int_round_trip(self):
+        """
+        Testing that signed 64 bit values survive int_to_base64 and base64_to_int.
+        """
+        values = [0, 1, 63, 64, 4095, 2**63 - 1, -(2**63), -5]
+        values += [random.randint(-(2**63), 2**63 - 1) for _ in range(1000)]
+        for value in values:
+            self.assertEqual(BASE64.base64_to_int(BASE64.int_to_base64(value)), value)
+        self.assertEqual(BASE64.int_to_base64(0), "A")
+        self.assertEqual(BASE64.int_to_base64(64), "BA")
+
+    def test_base64_to_ints(self):
+        """
+        Testing that lists of values are decoded in one call.
+        """
+        self.assertEqual(BASE64.base64_to_ints(STAT), STAT_VALUES)
+        self.assertEqual(BASE64.base64_to_ints(STAT.encode()), STAT_VALUES)
+        self.assertEqual(BASE64.base64_to_ints(["-B", b"A", "/"]), [-1, 0, 63])
+        self.assertEqual(BASE64.base64_to_ints(""), [])
+
+        values = [random.randint(-(2**63), 2**63 - 1) for _ in range(1000)]
+        encoded = " ".join(BASE64.int_to_base64(value) for value in values)
+        self.assertEqual(BASE64.base64_to_ints(encoded), values)
+
+    def test_wrap(self):
+        """
+        Testing that values are wrapped to signed 64 bit, like Bareos does.
+        """
+        self.assertEqual(BASE64.base64_to_ints("P//////////"), [-1])
+        self.assertEqual(BASE64.base64_to_ints("IAAAAAAAAAA"), [-(2**63)])
+        self.assertEqual(BASE64.base64_to_ints("-H//////////"), [-(2**63) + 1])
+
+    def test_wrap_agrees(self):
+        """
+        Testing that base64_to_int wraps values outside of 64 bit the same as
+        base64_to_ints.
+        """
+        values = ["/" * 11, "P//////////", "IAAAAAAAAAA", "-IAAAAAAAAAA"]
+        values += ["-" + "/" * 11, "-H//////////", "BAAAAAAAAAA"]
+        values += [
+            BASE64.int_to_base64(random.randint(-(2**66) + 1, 2**66 - 1))
+            for _ in range(1000)
+        ]
+        self.assertEqual(
+            [BASE64.base64_to_int(value) for value in values],
+            BASE64.base64_to_ints(values),
+        )
+        self.assertEqual(BASE64.base64_to_int("/" * 11), -1)
+
+        with self.assertRaises(ValueError):
+            BASE64.base64_to_int("AAAAAAAAAAAA")
+
+    def test_invalid(self):
+        """
+        Testing that invalid values raise ValueError.
+        """
+        for values in ("A*", "AAAAAAAAAAAA", "A.B"):
+            with self.subTest(values=values), self.assertRaises(ValueError):
+                BASE64.base64_to_ints(values)
+        with self.assertRaises(ValueError):
+            BASE64.base64_to_int("A*")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the director session broker in broker.py, against a fake director.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from bareos.bsock.constants import Constants
+
+import broker
+import util
+
+from tests.fake_director import FakeDirector
+
+VERSION = "bareos-dir Version: 17.2.4 (21 Sep 2017)\n"
+
+
+class TestBroker(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        broker.LOGGER = MagicMock(spec=logging.Logger)
+        util.LOGGER = MagicMock(spec=logging.Logger)
+
+    def setUp(self):
+        self.director = FakeDirector(password="secret").start()
+        self.addCleanup(self.director.stop)
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.path = os.path.join(tmp_dir, "broker.sock")
+
+        for target, value in (
+            ("config.DIRECTOR_ADDRESS", "127.0.0.1"),
+            ("config.DIRECTOR_PORT", self.director.port),
+            ("config.BROKER_SOCKET", self.path),
+            ("secrets.bconsole_password", "secret"),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def start_broker(self, **kwargs) -> broker.Broker:
+        """Run a broker in a background thread until the test ends."""
+        loop = asyncio.new_event_loop()
+        instance = broker.Broker(self.path, **kwargs)
+        loop.run_until_complete(instance.start())
+
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(instance.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+        self.addCleanup(stop)
+        return instance
+
+    def wait_for(self, condition, timeout: float = 5) -> None:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("timed out")
+            time.sleep(0.01)
+
+    def test_call(self):
+        """
+        Testing that commands run on the sessions opened at startup.
+        """
+        instance = self.start_broker(sessions=2)
+        for _ in range(5):
+            self.assertEqual(broker.call("version"), VERSION)
+
+        self.assertEqual(self.director.connections, 2)
+        self.assertEqual(instance.commands, 5)
+
+    def test_reload_bconsole(self):
+        """
+        Testing that reload_bconsole goes through the broker when one is running.
+        """
+        self.start_broker(sessions=1)
+        util.reload_bconsole()
+        util.reload_bconsole()
+
+        self.assertEqual(self.director.commands[-2:], [b"reload", b"reload"])
+        self.assertEqual(self.director.connections, 1)
+
+    def test_direct(self):
+        """
+        Testing that without a broker, commands run on a new connection that is
+        closed afterwards.
+        """
+        self.assertEqual(util.call_director("version"), VERSION)
+        self.assertEqual(self.director.connections, 1)
+        self.assertEqual(self.director.signals, [Constants.BNET_TERMINATE])
+
+    def test_unavailable(self):
+        """
+        Testing that calls without a broker raise BrokerUnavailable.
+        """
+        with self.assertRaises(broker.BrokerUnavailable):
+            broker.call("version")
+
+    def test_reconnect(self):
+        """
+        Testing that sessions reconnect when the director closed their connection.
+        """
+        self.start_broker(sessions=1)
+        self.assertEqual(broker.call("version"), VERSION)
+
+        self.director.drop_connections()
+        self.assertEqual(broker.call("version"), VERSION)
+        self.assertEqual(self.director.connections, 2)
+
+    def test_error(self):
+        """
+        Testing that a command the broker can't run raises BrokerError.
+        """
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            closed_port = sock.getsockname()[1]
+
+        with patch("config.DIRECTOR_PORT", closed_port):
+            self.start_broker(sessions=1)
+            with self.assertRaises(broker.BrokerError):
+                broker.call("version")
+
+    def test_keepalive(self):
+        """
+        Testing that idle sessions are kept alive with heartbeats.
+        """
+        self.start_broker(sessions=2, keepalive=0.05)
+        self.wait_for(
+            lambda: self.director.signals.count(Constants.BNET_HEARTBEAT) >= 4
+        )
+        self.assertEqual(self.director.connections, 2)
+
+    def test_heartbeat_response(self):
+        """
+        Testing that heartbeats of the director are answered.
+        """
+        self.director.heartbeat = True
+        self.start_broker(sessions=1)
+        self.assertEqual(broker.call("version"), VERSION)
+        self.assertIn(Constants.BNET_HB_RESPONSE, self.director.signals)
+
+    def test_already_running(self):
+        """
+        Testing that a second broker refuses to take over the socket.
+        """
+        self.start_broker(sessions=1)
+        with self.assertRaises(RuntimeError):
+            broker.Broker(self.path)._check_socket()
+
+    def test_stale_socket(self):
+        """
+        Testing that the socket of a broker that didn't shut down is replaced.
+        """
+        open(self.path, "w").close()
+        self.start_broker(sessions=1)
+        self.assertEqual(broker.call("version"), VERSION)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the directory cache in cache.py and its use in db.py.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import mysql.connector
+from mysql.connector.errors import InterfaceError
+
+import cache
+import db
+
+
+class TestDirCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cache.LOGGER = MagicMock(spec=logging.Logger)
+        db.LOGGER = MagicMock(spec=logging.Logger)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        self.dir_cache = cache.DirCache(
+            os.path.join(self.tmp_dir, "cache", "dirs.sqlite3"),
+            ttl=60,
+            max_entries=2,
+        )
+        self.addCleanup(self.dir_cache.close)
+
+    def test_ttl(self):
+        """
+        Testing that expired entries are only returned when asked for.
+        """
+        self.dir_cache.put_many([("TEST_USER", "test:/home/test_user", None)])
+
+        self.assertEqual(
+            self.dir_cache.get_many(["TEST_USER", "TEST_USER1"]),
+            {"TEST_USER": ("test:/home/test_user", None)},
+        )
+
+        self.dir_cache.ttl = -1
+        self.dir_cache.put_many([("TEST_USER", "test:/home/test_user", None)])
+
+        self.assertEqual(self.dir_cache.get_many(["TEST_USER"]), {})
+        self.assertEqual(
+            self.dir_cache.get_many(["TEST_USER"], include_expired=True),
+            {"TEST_USER": ("test:/home/test_user", None)},
+        )
+
+    def test_lru_eviction(self):
+        """
+        Testing that the least recently used entry is evicted past max_entries.
+        """
+        with patch("cache.time.time", return_value=100):
+            self.dir_cache.put_many(
+                [("TEST_USER", "a:/a", None), ("TEST_USER1", "b:/b", None)]
+            )
+
+        # Touch TEST_USER so TEST_USER1 becomes the least recently used entry.
+        with patch("cache.time.time", return_value=110):
+            self.dir_cache.get_many(["TEST_USER"])
+
+        with patch("cache.time.time", return_value=120):
+            self.dir_cache.put_many([("TEST_USER2", "c:/c", None)])
+
+        self.assertEqual(
+            set(
+                self.dir_cache.get_many(
+                    ["TEST_USER", "TEST_USER1", "TEST_USER2"], include_expired=True
+                )
+            ),
+            {"TEST_USER", "TEST_USER2"},
+        )
+
+    @patch("db.mysql.connector", autospec=mysql.connector)
+    def test_session_lookup(self, mock_cnx):
+        """
+        Testing that cached users are not queried and queried users are cached.
+        """
+        cur = mock_cnx.connect.return_value.cursor.return_value
+        cur.__iter__.return_value = (("TEST_USER1", "b:/b", "b:/pe"),)
+
+        self.dir_cache.put_many([("TEST_USER", "a:/a", None)])
+
+        session = db.Session()
+        with patch("db.cache.get_cache", return_value=self.dir_cache):
+            res = list(session.lookup(["TEST_USER", "TEST_USER1", "TEST_USER2"]))
+
+        self.assertEqual(
+            res,
+            [
+                ("TEST_USER", "a:/a", None),
+                ("TEST_USER1", "b:/b", "b:/pe"),
+                ("TEST_USER2", None, None),
+            ],
+        )
+
+        # Only the users missing from the cache were queried.
+        cur.execute.assert_called_once()
+        self.assertEqual(cur.execute.call_args[0][1], ("TEST_USER1", "TEST_USER2"))
+
+        self.assertEqual(
+            self.dir_cache.get_many(["TEST_USER1"]), {"TEST_USER1": ("b:/b", "b:/pe")}
+        )
+        self.assertEqual((self.dir_cache.hits, self.dir_cache.misses), (1, 2))
+
+    @patch("db.mysql.connector", autospec=mysql.connector)
+    def test_session_stop_early(self, mock_cnx):
+        """
+        Testing that the rows left when a lookup is stopped early are read, so the
+        connection can run the next query.
+        """
+        cur = mock_cnx.connect.return_value.cursor.return_value
+        cur.__iter__.return_value = (
+            ("TEST_USER", "a:/a", None),
+            ("TEST_USER1", "b:/b", "b:/pe"),
+        )
+
+        session = db.Session()
+        with patch("db.cache.get_cache", return_value=None):
+            res = session.lookup(["TEST_USER", "TEST_USER1"])
+            self.assertEqual(next(res), ("TEST_USER", "a:/a", None))
+            cur.fetchall.assert_not_called()
+            res.close()
+
+        cur.fetchall.assert_called_once()
+
+    @patch("db.mysql.connector", autospec=mysql.connector)
+    def test_session_offline(self, mock_cnx):
+        """
+        Testing that offline sessions serve expired entries when the database
+        can't be reached.
+        """
+        mock_cnx.connect.side_effect = InterfaceError("down")
+
+        self.dir_cache.ttl = -1
+        self.dir_cache.put_many([("TEST_USER", "a:/a", None)])
+
+        session = db.Session()
+        with patch("db.cache.get_cache", return_value=self.dir_cache):
+            # Without offline mode the error is raised.
+            with self.assertRaises(InterfaceError):
+                list(session.lookup(["TEST_USER"]))
+
+            session.offline = True
+            res = list(session.lookup(["TEST_USER", "TEST_USER1"]))
+
+        self.assertEqual(res, [("TEST_USER", "a:/a", None), ("TEST_USER1", None, None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
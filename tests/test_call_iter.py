@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Unit tests for streaming command results with call_iter, against a fake director.
+"""
+
+import re
+import unittest
+
+from bareos.bsock import DirectorConsole, DirectorConsoleJson
+from bareos.exceptions import JsonRpcError
+from bareos.util.password import Password
+
+from tests.fake_director import FakeDirector
+
+JOBS = [{"jobid": str(i), "name": "u%07d" % i} for i in range(2500)]
+
+
+def list_jobs(command: bytes) -> dict:
+    match = re.match(rb"list jobs limit=(\d+) offset=(\d+)$", command)
+    if not match:
+        return {}
+    limit, offset = int(match.group(1)), int(match.group(2))
+    return {"jobs": JOBS[offset : offset + limit]}
+
+
+class TestCallIter(unittest.TestCase):
+    def setUp(self):
+        self.director = FakeDirector()
+        self.output = b"".join(b"line %d\n" % i for i in range(1000))
+        self.director.replies[b"list files"] = self.output
+        self.director.replies[b"partial"] = b"first\nno newline"
+        self.director.start()
+        self.addCleanup(self.director.stop)
+
+    def console(self, cls=DirectorConsole):
+        console = cls(port=self.director.port, password=Password("secret"))
+        self.addCleanup(console.disconnect)
+        return console
+
+    def test_lines(self):
+        """
+        Testing that the result is yielded line by line.
+        """
+        console = self.console()
+        lines = list(console.call_iter("list files"))
+        self.assertEqual(lines, self.output.splitlines(True))
+        self.assertEqual(
+            list(console.call_iter("partial")), [b"first\n", b"no newline"]
+        )
+
+    def test_chunks(self):
+        """
+        Testing that without lines, the result is yielded as it was received.
+        """
+        console = self.console()
+        chunks = list(console.call_iter("list files", lines=False))
+        self.assertEqual(b"".join(chunks), self.output)
+
+        # Data left over from the previous message comes first.
+        console.receive_buffer = b"left over\n"
+        chunks = list(console.call_iter("list files", lines=False))
+        self.assertEqual(b"".join(chunks), b"left over\n" + self.output)
+
+    def test_stop_early(self):
+        """
+        Testing that the connection can still be used after the iteration stopped
+        before the end of the result.
+        """
+        console = self.console()
+        results = console.call_iter("list files")
+        self.assertEqual(next(results), b"line 0\n")
+        results.close()
+
+        self.assertEqual(
+            console.call("version"), b"bareos-dir Version: 17.2.4 (21 Sep 2017)\n"
+        )
+
+    def test_json_pages(self):
+        """
+        Testing that the JSON console yields the items of every page.
+        """
+        self.director.default = list_jobs
+        console = self.console(DirectorConsoleJson)
+        self.assertEqual(list(console.call_iter("list jobs")), JOBS)
+        self.assertEqual(
+            [c for c in self.director.commands if c.startswith(b"list")],
+            [b"list jobs limit=1000 offset=%d" % i for i in (0, 1000, 2000)],
+        )
+
+        jobs = console.call_iter("list jobs", page_size=10, key="jobs")
+        self.assertEqual(next(jobs), JOBS[0])
+        self.assertEqual(self.director.commands[-1], b"list jobs limit=10 offset=0")
+
+    def test_json_items(self):
+        """
+        Testing that items are projected, and that the connection can still be used
+        after stopping early.
+        """
+        self.director.replies[b"list jobs"] = {"jobs": JOBS}
+        console = self.console(DirectorConsoleJson)
+        items = console.call_items("list jobs", keys=["jobid"])
+        self.assertEqual(next(items), {"jobid": "0"})
+        items.close()
+
+        self.assertEqual(len(list(console.call_items("list jobs"))), len(JOBS))
+
+    def test_json_ambiguous(self):
+        """
+        Testing that a result with several lists needs a key.
+        """
+        self.director.default = {"jobs": [], "clients": []}
+        console = self.console(DirectorConsoleJson)
+        with self.assertRaises(JsonRpcError):
+            list(console.call_iter("list jobs"))
+        self.assertEqual(list(console.call_iter("list jobs", key="jobs")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Unit tests for pipelined commands with LowLevel.call_many, against a fake director.
+"""
+
+import unittest
+from unittest.mock import patch
+
+from bareos.bsock import DirectorConsole, DirectorConsoleJson
+from bareos.util.password import Password
+
+from tests.fake_director import FakeDirector
+
+
+def show(command: bytes) -> bytes:
+    name = command.split(b"=", 1)[1]
+    return b'Job {\n  Name = "%s"\n  FileSet = "%s"\n}\n' % (name, name)
+
+
+class TestCallMany(unittest.TestCase):
+    def setUp(self):
+        self.director = FakeDirector()
+        self.commands = ["show job=u%07d" % i for i in range(200)]
+        for command in self.commands:
+            self.director.replies[command.encode()] = show
+        self.director.start()
+        self.addCleanup(self.director.stop)
+
+    def console(self, cls=DirectorConsole):
+        console = cls(port=self.director.port, password=Password("secret"))
+        self.addCleanup(console.disconnect)
+        return console
+
+    def test_results_in_order(self):
+        """
+        Testing that every command gets its own result, in order.
+        """
+        console = self.console()
+        results = console.call_many(self.commands, window=8)
+        self.assertEqual(results, [show(command.encode()) for command in self.commands])
+        # Replies with a line matching the default terminator regex still end at the
+        # end of message signal.
+        self.director.replies[b"status"] = b"1000 OK: status\nmore output\n"
+        self.assertEqual(
+            console.call_many(["status", "version"]),
+            [
+                b"1000 OK: status\nmore output\n",
+                b"bareos-dir Version: 17.2.4 (21 Sep 2017)\n",
+            ],
+        )
+
+    def test_window(self):
+        """
+        Testing that no more than window commands are outstanding.
+        """
+        console = self.console()
+        outstanding = []
+        count = [0]
+        send = console.send
+        recv_msg = console.recv_msg
+
+        def counting_send(msg):
+            count[0] += 1
+            outstanding.append(count[0])
+            return send(msg)
+
+        def counting_recv_msg(*args, **kwargs):
+            count[0] -= 1
+            return recv_msg(*args, **kwargs)
+
+        with patch.object(console, "send", counting_send), patch.object(
+            console, "recv_msg", counting_recv_msg
+        ):
+            results = console.call_many(self.commands, window=5)
+
+        self.assertEqual(len(results), len(self.commands))
+        self.assertEqual(max(outstanding), 5)
+
+    def test_reconnect(self):
+        """
+        Testing that the commands are sent again on a new connection when the
+        director went away.
+        """
+        console = self.console()
+        self.director.drop_connections()
+        results = console.call_many(self.commands[:10])
+        self.assertEqual(
+            results, [show(command.encode()) for command in self.commands[:10]]
+        )
+        self.assertEqual(self.director.connections, 2)
+
+    def test_json(self):
+        """
+        Testing that the JSON console decodes every result.
+        """
+        console = self.console(DirectorConsoleJson)
+        results = console.call_many(self.commands[:10])
+        self.assertEqual(
+            results,
+            [show(command.encode()).decode() for command in self.commands[:10]],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the git commit engine in committer.py, with a local bare repository
+standing in for GitLab.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from git import GitCommandError, Repo
+
+import committer
+
+
+class TestCommitter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        committer.LOGGER = MagicMock(spec=logging.Logger)
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        self.remote = Repo.init(os.path.join(tmp_dir, "remote.git"), bare=True)
+        self.path = os.path.join(tmp_dir, "bareos")
+        self.repo = self.clone(self.path)
+        self.write("bareos-dir.conf", "Director {}\n")
+        self.repo.index.add(["bareos-dir.conf"])
+        self.repo.index.commit("Initial commit")
+        self.repo.git.push("origin", "master")
+
+    def clone(self, path: str) -> Repo:
+        repo = self.remote.clone(path)
+        with repo.config_writer() as writer:
+            writer.set_value("user", "name", "brs_backup")
+            writer.set_value("user", "email", "brs_backup@localhost")
+        repo.git.checkout("-B", "master")
+        return repo
+
+    def write(self, name: str, contents: str, path: str = None) -> str:
+        path = os.path.join(path or self.path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def remote_log(self) -> list:
+        if not self.remote.head.is_valid():
+            return []
+        return [c.message for c in self.remote.iter_commits("master")]
+
+    def test_only_recorded_paths(self):
+        """
+        Testing that only the recorded paths are committed, right away.
+        """
+        job = self.write("bareos-dir.d/job/u1.conf", "Job {}\n")
+        self.write("bareos-dir.d/job/unrelated.conf", "Job {}\n")
+
+        git = committer.Committer(self.path, window=0)
+        self.assertTrue(git.record("Ran command: brs_backup add u1", [job]))
+
+        head = self.repo.head.commit
+        self.assertEqual(head.message, "Ran command: brs_backup add u1")
+        self.assertEqual(list(head.stats.files), ["bareos-dir.d/job/u1.conf"])
+        self.assertEqual(self.repo.untracked_files, ["bareos-dir.d/job/unrelated.conf"])
+        self.assertEqual(git.pending(), 1)
+
+        # Nothing changed, nothing is queued.
+        self.assertFalse(git.record("nothing changed", [job]))
+        self.assertEqual(committer.Committer(self.path).pending(), 1)
+
+    def test_squash(self):
+        """
+        Testing that queued commits are pushed as one commit, removals included,
+        and the push is recorded.
+        """
+        git = committer.Committer(self.path, window=0)
+        for user in ("u1", "u2", "u3"):
+            path = self.write(f"bareos-dir.d/job/{user}.conf", "Job {}\n")
+            git.record(f"Ran command: brs_backup add {user}", [path])
+        os.remove(os.path.join(self.path, "bareos-dir.conf"))
+        git.record(
+            "Ran command: brs_backup remove dir", [f"{self.path}/bareos-dir.conf"]
+        )
+        self.assertEqual(git.pending(), 4)
+
+        self.assertEqual(git.push(), 4)
+        self.assertEqual(git.pending(), 0)
+        self.assertEqual(git.push(), 0)
+
+        head = self.remote.head.commit
+        self.assertEqual(
+            head.message,
+            "Ran 4 commands\n\n"
+            "Ran command: brs_backup add u1\n"
+            "Ran command: brs_backup add u2\n"
+            "Ran command: brs_backup add u3\n"
+            "Ran command: brs_backup remove dir",
+        )
+        self.assertEqual(len(head.stats.files), 4)
+        self.assertNotIn("bareos-dir.conf", [b.path for b in head.tree.traverse()])
+        self.assertEqual(self.repo.head.commit, head)
+
+        status = git.status()
+        self.assertEqual(status["queued"], 0)
+        self.assertEqual(status["last_push"]["commits"], 4)
+        self.assertGreaterEqual(status["last_push"]["seconds"], 0)
+
+    def test_no_squash_foreign(self):
+        """
+        Testing that commits which weren't queued by a run aren't squashed.
+        """
+        git = committer.Committer(self.path, window=0)
+        git.record("Ran command: add u1", [self.write("job/u1.conf", "Job {}\n")])
+        self.write("README", "committed by hand\n")
+        self.repo.index.add(["README"])
+        self.repo.index.commit("By hand")
+        git.record("Ran command: add u2", [self.write("job/u2.conf", "Job {}\n")])
+
+        self.assertEqual(git.push(), 2)
+        self.assertEqual(
+            self.remote_log()[:3],
+            ["Ran command: add u2", "By hand", "Ran command: add u1"],
+        )
+
+    def test_flush(self):
+        """
+        Testing that flush waits for the window, then pushes, merging changes pushed
+        by someone else in the meantime.
+        """
+        other = self.clone(os.path.join(os.path.dirname(self.path), "other"))
+        other.git.pull("origin", "master")
+        self.write("README", "pushed elsewhere\n", other.working_tree_dir)
+        other.index.add(["README"])
+        other.index.commit("Elsewhere")
+        other.git.push("origin", "master")
+
+        git = committer.Committer(self.path, window=0.2)
+        start = time.monotonic()
+        git.record("Ran command: add", [self.write("job/u1.conf", "Job {}\n")])
+        self.assertEqual(git.flush(), 1)
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        log = self.remote_log()
+        self.assertIn("Ran command: add", log)
+        self.assertIn("Elsewhere", log)
+
+    def test_retry(self):
+        """
+        Testing that a failed push stays queued with a backoff that doubles, and is
+        pushed once the remote is back.
+        """
+        git = committer.Committer(self.path, window=0)
+        git.record("Ran command: add", [self.write("job/u1.conf", "Job {}\n")])
+
+        moved = f"{self.remote.git_dir}.moved"
+        os.rename(self.remote.git_dir, moved)
+        with patch("config.GIT_PUSH_BACKOFF", 10), patch(
+            "config.GIT_PUSH_BACKOFF_MAX", 15
+        ):
+            for attempt in (1, 2, 3):
+                with self.assertRaises(GitCommandError):
+                    git.flush(wait=False)
+                status = git.status()
+                self.assertEqual(status["attempts"], attempt)
+                self.assertEqual(status["queued"], 1)
+                self.assertIsNotNone(status["last_error"])
+            self.assertAlmostEqual(status["retry_at"], time.time() + 15, delta=2)
+        os.rename(moved, self.remote.git_dir)
+
+        self.assertEqual(git.flush(wait=False), 1)
+        status = git.status()
+        self.assertEqual((status["queued"], status["attempts"]), (0, 0))
+        self.assertIsNone(status["last_error"])
+        self.assertEqual(self.remote_log()[0], "Ran command: add")
+
+    def test_schedule(self):
+        """
+        Testing that a background process pushes the commits of runs within the
+        window together, and the run only waits for its local commit.
+        """
+        git = committer.Committer(self.path, window=0.5)
+        start = time.monotonic()
+        for user in ("u1", "u2"):
+            path = self.write(f"job/{user}.conf", "Job {}\n")
+            git.record(f"Ran command: add {user}", [path])
+            git.schedule()
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(len(list(self.repo.iter_commits())), 3)
+
+        deadline = time.monotonic() + 10
+        while len(self.remote_log()) < 2:
+            if time.monotonic() > deadline:
+                self.fail("Nothing was pushed")
+            time.sleep(0.05)
+
+        self.assertEqual(
+            self.remote_log()[0],
+            "Ran 2 commands\n\nRan command: add u1\nRan command: add u2",
+        )
+
+    def test_schedule_after_exit(self):
+        """
+        Testing that the background process pushes the commits of separate runs
+        after the run that started it exited.
+        """
+        for user in ("u1", "u2"):
+            path = self.write(f"job/{user}.conf", "Job {}\n")
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    "import sys, committer\n"
+                    "git = committer.Committer(sys.argv[1], window=1)\n"
+                    "git.record(sys.argv[2], [sys.argv[3]])\n"
+                    "git.schedule()",
+                    self.path,
+                    f"Ran command: add {user}",
+                    path,
+                ],
+                stderr=subprocess.DEVNULL,
+                check=True,
+                cwd=os.path.dirname(os.path.abspath(committer.__file__)),
+            )
+
+        deadline = time.monotonic() + 10
+        while len(self.remote_log()) < 2:
+            if time.monotonic() > deadline:
+                self.fail("Nothing was pushed")
+            time.sleep(0.05)
+
+        self.assertEqual(
+            self.remote_log()[0],
+            "Ran 2 commands\n\nRan command: add u1\nRan command: add u2",
+        )
+        self.assertEqual(committer.Committer(self.path).status()["attempts"], 0)
+
+    def test_bare(self):
+        """
+        Testing that a bare repository raises FileNotFoundError.
+        """
+        with self.assertRaises(FileNotFoundError):
+            committer.Committer(self.remote.git_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Stress test of concurrent runs against a temporary config tree: processes adding and
+removing resources at once, some of them racing for the same names, then committing
+and reloading like the commands do.
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from git import Repo
+
+import background
+import committer
+import packed
+import reloader
+import resource_index
+import staging
+import util
+from staging import BatchWriter
+
+PROCESSES = 8
+NAMES = 6
+
+
+class TestConcurrency(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for module in (
+            background,
+            committer,
+            packed,
+            reloader,
+            resource_index,
+            staging,
+            util,
+        ):
+            module.LOGGER = MagicMock(spec=logging.Logger)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        self.remote = Repo.init(os.path.join(self.tmp_dir, "remote.git"), bare=True)
+        self.path = os.path.join(self.tmp_dir, "bareos")
+        self.repo = self.remote.clone(self.path)
+        with self.repo.config_writer() as writer:
+            writer.set_value("user", "name", "brs_backup")
+            writer.set_value("user", "email", "brs_backup@localhost")
+            # No gc left running in the background when the test cleans up.
+            writer.set_value("gc", "auto", "0")
+        self.repo.git.checkout("-B", "master")
+        with open(os.path.join(self.path, "bareos-dir.conf"), "w") as f:
+            f.write("Director {}\n")
+        self.repo.index.add(["bareos-dir.conf"])
+        self.repo.index.commit("Initial commit")
+        self.repo.git.push("origin", "master")
+
+        self.dirs = {}
+        for kind in ("job", "fileset"):
+            self.dirs[kind] = os.path.join(self.path, "bareos-dir.d", kind)
+            os.makedirs(self.dirs[kind])
+        self.reloads_path = os.path.join(self.tmp_dir, "reloads")
+
+        for target, value in (
+            ("config.JOB_FILE_LOCATION", self.dirs["job"]),
+            ("config.FILESET_FILE_LOCATION", self.dirs["fileset"]),
+            ("config.STRICT_REFERENCES", False),
+            ("config.LOCK_LOCATION", os.path.join(self.tmp_dir, "locks")),
+            ("config.GIT_LOCATION", self.path),
+            ("config.GIT_COMMIT_WINDOW", 0),
+            ("config.GIT_PUSH_ASYNC", False),
+            ("config.RELOAD_STATE_LOCATION", os.path.join(self.tmp_dir, "reload.json")),
+            ("config.RELOAD_QUIET_WINDOW", 0.2),
+            ("util.reload_bconsole", self.reload),
+            ("resource_index._INDEX", resource_index.ResourceIndex(None, self.dirs)),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reload(self) -> None:
+        with open(self.reloads_path, "a") as f:
+            f.write("reload\n")
+
+    def run_process(self, number: int) -> None:
+        """What one run does: add its own backups and race the other runs for the
+        shared ones, remove some of its own, then commit and reload.
+        """
+        won = []
+        for i in range(NAMES):
+            for name in (f"p{number}-{i}", f"shared-{i}"):
+                try:
+                    with BatchWriter() as batch:
+                        util.write_file_set_file(name, name, f"/g/{name}", batch=batch)
+                        util.write_job_file(name, name, client="host-fd", batch=batch)
+                    won.append(name)
+                except FileExistsError:
+                    pass
+
+        for i in range(0, NAMES, 2):
+            with BatchWriter() as batch:
+                util.remove_job_file(f"p{number}-{i}", batch=batch)
+                util.remove_file_set_file(f"p{number}-{i}", batch=batch)
+
+        util.push_to_gitlab(f"Ran command: run {number}")
+        util.request_reload(wait=True)
+
+        with open(os.path.join(self.tmp_dir, f"{number}.json"), "w") as f:
+            json.dump(won, f)
+
+    def defined(self, kind: str) -> list:
+        """Names of every resource defined in the files of a resource directory."""
+        names = []
+        for filename in os.listdir(self.dirs[kind]):
+            with open(os.path.join(self.dirs[kind], filename)) as f:
+                names.extend(name for name, _ in packed.split_resources(f.read()))
+        return sorted(names)
+
+    def stress(self) -> None:
+        children = []
+        for number in range(PROCESSES):
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    self.run_process(number)
+                    status = 0
+                finally:
+                    os._exit(status)
+            children.append(pid)
+
+        for pid in children:
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(os.WEXITSTATUS(status), 0)
+
+        won = []
+        for number in range(PROCESSES):
+            with open(os.path.join(self.tmp_dir, f"{number}.json")) as f:
+                won.extend(json.load(f))
+
+        # Every shared name was added by exactly one run.
+        shared = sorted(name for name in won if name.startswith("shared-"))
+        self.assertEqual(shared, sorted(f"shared-{i}" for i in range(NAMES)))
+
+        expected = sorted(
+            [f"p{n}-{i}" for n in range(PROCESSES) for i in range(1, NAMES, 2)] + shared
+        )
+        for kind in ("job", "fileset"):
+            self.assertEqual(self.defined(kind), expected)
+
+        # Every change is committed and pushed.
+        self.assertEqual(self.repo.git.status("--porcelain", "bareos-dir.d"), "")
+        self.assertEqual(
+            self.repo.head.commit, self.remote.commit("master"), "unpushed commits"
+        )
+
+        # The reload worker is done with the state before the test cleans up.
+        while reloader.Reloader(self.reload).status()["worker"]:
+            time.sleep(0.05)
+        with open(self.reloads_path) as f:
+            reloads = len(f.readlines())
+        self.assertGreaterEqual(reloads, 1)
+        self.assertLess(reloads, PROCESSES)
+
+    def test_per_file(self):
+        """
+        Testing that concurrent runs writing one file per resource don't lose or
+        duplicate resources.
+        """
+        self.stress()
+
+    def test_packed(self):
+        """
+        Testing that concurrent runs sharing shard files don't lose each other's
+        changes.
+        """
+        with patch("config.PACKED_SHARDS", 4):
+            self.stress()
+
+
+if __name__ == "__main__":
+    unittest.main()
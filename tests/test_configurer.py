@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Unit tests for adding resources with 'configure add' in configurer.py and
+util.configure_backups, against a fake director.
+"""
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import configurer
+import resource_index
+import staging
+import util
+
+from tests.fake_director import FakeDirector
+
+ARGUMENT_RE = re.compile(rb'(\w+)="([^"]*)"')
+
+
+class ConfiguringDirector(FakeDirector):
+    """Answers 'configure add' by writing the resource file, like the director does,
+    and 'show' with the resources it added.
+    """
+
+    def __init__(self, dirs: dict):
+        super().__init__(password="secret")
+        self.dirs = dirs
+        self.shown = {}
+        # Names 'configure add' fails for.
+        self.refuse = set()
+        self.default = self.reply
+
+    def reply(self, command: bytes) -> bytes:
+        words = command.split(b" ", 3)
+        if words[:2] == [b"configure", b"add"]:
+            kind = words[2].decode()
+            arguments = {
+                k.decode(): v.decode() for k, v in ARGUMENT_RE.findall(command)
+            }
+            name = arguments.pop("name")
+            if name in self.refuse:
+                return b"Configure add failed\n"
+            if (kind, name) in self.shown:
+                return f'Resource "{name}" already exists\n'.encode()
+
+            lines = [f'  Name = "{name}"']
+            include = arguments.pop("include", None)
+            for key, value in arguments.items():
+                lines.append(f'  {key.capitalize()} = "{value}"')
+            if include:
+                location = re.search(r"File = (\S+)", include).group(1)
+                lines.append(f'  Include {{\n    File = "{location}"\n  }}')
+            text = f"{kind} {{\n" + "\n".join(lines) + "\n}\n"
+
+            path = os.path.join(self.dirs[kind], f"{name}.conf")
+            with open(path, "w") as f:
+                f.write(text)
+            self.shown[(kind, name)] = text
+            return f'Created resource config file "{path}"\n'.encode()
+
+        if words[0] == b"show":
+            kind, name = words[1].decode().split("=", 1)
+            return self.shown.get((kind, name.strip('"')), "").encode()
+
+        return b""
+
+
+class TestConfigurer(unittest.TestCase):
+    def test_commands(self):
+        """
+        Testing that directives are quoted, and the Include block is given as one
+        directive.
+        """
+        file_set = configurer.file_set("u1", "Home directory for u1", "/home/u1")
+        self.assertEqual(
+            file_set.add_command(),
+            'configure add fileset name="u1" description="Home directory for u1" '
+            'include="{ Options { Signature = MD5; aclsupport = yes; '
+            'xattrsupport = yes; compression = GZIP }; File = /home/u1 }"',
+        )
+        self.assertEqual(file_set.show_command(), 'show fileset="u1"')
+
+        job = configurer.job("u1", "u1", "host-fd", "DefaultJob", "S3_Object")
+        self.assertEqual(
+            job.add_command(),
+            'configure add job name="u1" client="host-fd" jobdefs="DefaultJob" '
+            'fileset="u1" storage="S3_Object"',
+        )
+
+    def test_needs_reload(self):
+        """
+        Testing that values the console can't pass raise NeedsReload.
+        """
+        with self.assertRaises(configurer.NeedsReload):
+            configurer.file_set("u1", "Home", "/home/with space")
+        with self.assertRaises(configurer.NeedsReload):
+            configurer.job('u"1', "u1", "host-fd", "DefaultJob", "S3").add_command()
+
+    def test_verify(self):
+        """
+        Testing that the directives missing from the 'show' output are returned,
+        whether quoted or not.
+        """
+        job = configurer.job("u1", "u1", "host-fd", "DefaultJob", "S3_Object")
+        self.assertEqual(
+            job.verify(
+                'Job {\n  Name = "u1"\n  Client = "host-fd"\n  JobDefs = DefaultJob\n'
+                '  FileSet = "u1"\n}\n'
+            ),
+            ["Storage = S3_Object"],
+        )
+        self.assertEqual(len(job.verify("")), 5)
+
+
+class TestConfigureBackups(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        util.LOGGER = MagicMock(spec=logging.Logger)
+        resource_index.LOGGER = MagicMock(spec=logging.Logger)
+        staging.LOGGER = MagicMock(spec=logging.Logger)
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.dirs = {}
+        for kind in ("job", "fileset"):
+            self.dirs[kind] = os.path.join(tmp_dir, kind)
+            os.mkdir(self.dirs[kind])
+
+        self.director = ConfiguringDirector(self.dirs).start()
+        self.addCleanup(self.director.stop)
+
+        for target, value in (
+            ("config.DIRECTOR_ADDRESS", "127.0.0.1"),
+            ("config.DIRECTOR_PORT", self.director.port),
+            ("config.BROKER_SOCKET", None),
+            ("config.JOB_FILE_LOCATION", self.dirs["job"]),
+            ("config.FILESET_FILE_LOCATION", self.dirs["fileset"]),
+            ("config.STRICT_REFERENCES", False),
+            ("secrets.bconsole_password", "secret"),
+            ("resource_index._INDEX", resource_index.ResourceIndex(None, self.dirs)),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        staging.take_committed_paths()
+
+    def test_add(self):
+        """
+        Testing that a batch is added on one connection and verified, and the files
+        the director wrote are committed to git.
+        """
+        errors = util.configure_backups(
+            [
+                ("u1", "Home directory for u1", "host-fd:/home/u1", None),
+                ("g1", "Group space for g1", "host-fd:/group/g1", "LZ4"),
+            ]
+        )
+
+        self.assertEqual(errors, [None, None])
+        self.assertEqual(self.director.connections, 1)
+        # After 'autodisplay off', the FileSets are added before the Jobs.
+        self.assertEqual(
+            [c.split(b" ")[:3] for c in self.director.commands[1:5]],
+            [[b"configure", b"add", b"fileset"]] * 2
+            + [[b"configure", b"add", b"job"]] * 2,
+        )
+        self.assertEqual(len(self.director.commands), 9)
+        self.assertEqual(
+            sorted(staging.take_committed_paths()),
+            sorted(
+                os.path.join(self.dirs[kind], f"{name}.conf")
+                for kind in ("job", "fileset")
+                for name in ("u1", "g1")
+            ),
+        )
+
+    def test_fallback(self):
+        """
+        Testing that backups the director refuses, or the console can't express,
+        need a reload, and existing or repeated ones fail.
+        """
+        self.director.refuse.add("u2")
+        with open(os.path.join(self.dirs["job"], "u3.conf"), "w") as f:
+            f.write('Job {\n  Name = "u3"\n}\n')
+
+        errors = util.configure_backups(
+            [
+                ("u1", "Home directory for u1", "host-fd:/home/u 1", None),
+                ("u2", "Home directory for u2", "host-fd:/home/u2", None),
+                ("u3", "Home directory for u3", "host-fd:/home/u3", None),
+                ("u4", "Home directory for u4", "host-fd:/home/u4", None),
+                ("u4", "Home directory for u4", "host-fd:/home/u4", None),
+            ]
+        )
+
+        self.assertIsInstance(errors[0], configurer.NeedsReload)
+        self.assertIsInstance(errors[1], configurer.NeedsReload)
+        self.assertIsInstance(errors[2], FileExistsError)
+        self.assertIsNone(errors[3])
+        self.assertIsInstance(errors[4], FileExistsError)
+        self.assertEqual(sorted(os.listdir(self.dirs["fileset"])), ["u4.conf"])
+
+    def test_stale(self):
+        """
+        Testing that a backup removed while the reload is pending isn't reported as
+        added again, since 'show' still matches the old resource.
+        """
+        backup = ("u1", "Home directory for u1", "host-fd:/home/u1", None)
+        self.assertEqual(util.configure_backups([backup]), [None])
+        util.remove_job_file("u1")
+        util.remove_file_set_file("u1")
+
+        errors = util.configure_backups([backup])
+
+        self.assertIsInstance(errors[0], configurer.NeedsReload)
+        self.assertEqual(os.listdir(self.dirs["job"]), [])
+        self.assertEqual(os.listdir(self.dirs["fileset"]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the incremental JSON-RPC decoder in bareos/util/jsonstream.py.
+"""
+
+import json
+import unittest
+
+from bareos.exceptions import JsonRpcError
+from bareos.util.jsonstream import JsonStream
+
+JOBS = [
+    {"jobid": 1, "name": "backup-été", "jobbytes": 123456789012},
+    {"jobid": 2, "name": "restore", "jobbytes": 0, "level": None},
+]
+
+
+def response(result, **members) -> bytes:
+    members.update({"jsonrpc": "2.0", "id": None, "result": result})
+    return json.dumps(members).encode()
+
+
+def split(data: bytes, size: int):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class TestJsonStream(unittest.TestCase):
+    def items(self, data: bytes, size: int = 7, **kwargs) -> list:
+        return list(JsonStream(split(data, size)).items(**kwargs))
+
+    def test_chunk_boundaries(self):
+        """
+        Testing that items are decoded however the response is split, including
+        numbers and multi-byte characters spanning two chunks.
+        """
+        data = response({"jobs": JOBS})
+        for size in range(1, 40):
+            self.assertEqual(self.items(data, size), JOBS)
+        self.assertEqual(self.items(response([1, 22, 333]), 1), [1, 22, 333])
+
+    def test_key(self):
+        """
+        Testing that key selects the list of items, skipping other members.
+        """
+        data = response({"meta": {"range": [0, 2]}, "jobs": JOBS, "clients": []})
+        self.assertEqual(self.items(data, key="jobs"), JOBS)
+        self.assertEqual(self.items(data, key="clients"), [])
+        with self.assertRaises(JsonRpcError):
+            self.items(data)
+
+    def test_keys(self):
+        """
+        Testing that keys projects every item to the given members.
+        """
+        self.assertEqual(
+            self.items(response({"jobs": JOBS}), keys=("jobid", "level")),
+            [{"jobid": 1}, {"jobid": 2, "level": None}],
+        )
+
+    def test_lazy(self):
+        """
+        Testing that items are yielded before the rest of the response was read.
+        """
+        chunks = iter(split(response({"jobs": JOBS * 100}), 64))
+        items = JsonStream(chunks).items()
+        self.assertEqual(next(items), JOBS[0])
+        self.assertGreater(len(list(chunks)), 0)
+
+    def test_errors(self):
+        """
+        Testing that error responses and invalid JSON raise JsonRpcError.
+        """
+        error = json.dumps({"error": {"code": 1, "message": "unknown command"}})
+        for data in (
+            error.encode(),
+            response("not a list"),
+            b'{"result": [1, 2',
+            b"no json",
+        ):
+            with self.subTest(data=data), self.assertRaises(JsonRpcError):
+                self.items(data)
+
+    def test_empty(self):
+        """
+        Testing that an empty response has no items.
+        """
+        self.assertEqual(self.items(b""), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
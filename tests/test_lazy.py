@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the lazily imported backends in lazy.py.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import lazy
+
+# Imported by the commands using them only.
+BACKENDS = ("asyncio", "bareos.bsock", "git", "mysql.connector", "sqlite3")
+
+
+class TestLazy(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        sys.path.insert(0, tmp_dir)
+        self.addCleanup(sys.path.remove, tmp_dir)
+
+        with open(os.path.join(tmp_dir, "lazy_backend.py"), "w") as f:
+            f.write("import sys\nsys.lazy_backend_runs += 1\nVALUE = 1\n")
+        sys.lazy_backend_runs = 0
+        self.addCleanup(delattr, sys, "lazy_backend_runs")
+        self.addCleanup(sys.modules.pop, "lazy_backend", None)
+
+    def test_load(self):
+        """
+        Testing that a module only runs on first use, and only once.
+        """
+        backend = lazy.load("lazy_backend")
+        self.assertEqual(sys.lazy_backend_runs, 0)
+        self.assertIs(lazy.load("lazy_backend"), backend)
+
+        self.assertEqual(backend.VALUE, 1)
+        self.assertEqual(backend.VALUE, 1)
+        self.assertEqual(sys.lazy_backend_runs, 1)
+
+        with self.assertRaises(ImportError):
+            lazy.load("lazy_missing_backend")
+
+    def test_main(self):
+        """
+        Testing that importing the CLI and showing its help imports no backend.
+        """
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, main\n"
+                "try:\n"
+                "    main.cli.main(['remove', '--help'], standalone_mode=False)\n"
+                "except SystemExit:\n"
+                "    pass\n"
+                f"print([name for name in {BACKENDS!r} if name in sys.modules])",
+            ],
+            stdout=subprocess.PIPE,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(lazy.__file__)),
+        ).stdout
+        self.assertEqual(output.decode("utf-8").splitlines()[-1], "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the queue backed syslog logging in logger.py.
+"""
+
+import logging
+import queue
+import threading
+import unittest
+from unittest.mock import patch
+
+import logger
+
+
+class CapturingHandler(logging.Handler):
+    """Stands in for syslog, optionally blocking until released."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.released = threading.Event()
+        self.released.set()
+
+    def emit(self, record):
+        self.released.wait()
+        self.messages.append(record.getMessage())
+
+
+class TestLogger(unittest.TestCase):
+    def test_one_handler(self):
+        """
+        Testing that getting a logger again doesn't add another handler.
+        """
+        first = logger.get_logger("test_logger")
+        second = logger.get_logger("test_logger")
+
+        self.assertIs(first, second)
+        self.assertEqual(len(first.handlers), 1)
+        self.assertIs(
+            first.handlers[0], logger.get_logger("test_logger_other").handlers[0]
+        )
+        self.assertIsInstance(first.handlers[0], logger.DroppingQueueHandler)
+
+    def test_level(self):
+        """
+        Testing that records below the configured level are rejected before they
+        are queued.
+        """
+        with patch("config.LOG_LEVEL", "WARNING"):
+            log = logger.get_logger("test_logger_level")
+        self.addCleanup(log.setLevel, logging.DEBUG)
+
+        with patch.object(logger.DroppingQueueHandler, "enqueue") as enqueue:
+            log.debug("not queued")
+            log.info("not queued")
+            enqueue.assert_not_called()
+            log.warning("queued")
+            enqueue.assert_called_once()
+
+    def test_drop(self):
+        """
+        Testing that records are dropped and counted when the queue is full, and the
+        drops are reported once syslog catches up.
+        """
+        records = queue.Queue(5)
+        handler = logger.DroppingQueueHandler(records)
+        syslog = CapturingHandler()
+        listener = logger.BatchingQueueListener(records, syslog, 64, handler)
+
+        log = logging.getLogger("test_logger_drop")
+        log.propagate = False
+        log.addHandler(handler)
+        self.addCleanup(log.removeHandler, handler)
+
+        for i in range(8):
+            log.warning("record %d", i)
+        self.assertEqual(handler.dropped, 3)
+
+        listener.start()
+        listener.stop()
+        self.assertEqual(
+            syslog.messages,
+            ["record %d" % i for i in range(5)]
+            + ["Dropped 3 log records, syslog is backed up"],
+        )
+
+    def test_batches(self):
+        """
+        Testing that records queued while syslog was busy are handed over in one
+        batch, and that stopping writes every queued record.
+        """
+        records = queue.Queue()
+        handler = logger.DroppingQueueHandler(records)
+        syslog = CapturingHandler()
+        listener = logger.BatchingQueueListener(records, syslog, 4, handler)
+        batches = []
+        handle = listener.handle
+
+        def recording_handle(batch):
+            batches.append(len(batch))
+            handle(batch)
+
+        listener.handle = recording_handle
+
+        log = logging.getLogger("test_logger_batches")
+        log.propagate = False
+        log.addHandler(handler)
+        self.addCleanup(log.removeHandler, handler)
+
+        syslog.released.clear()
+        listener.start()
+        log.warning("first")
+        for i in range(6):
+            log.warning("record %d", i)
+        syslog.released.set()
+        listener.stop()
+
+        self.assertEqual(len(syslog.messages), 7)
+        self.assertEqual(sum(batches), 7)
+        self.assertLessEqual(max(batches), 4)
+        self.assertLess(len(batches), 7)
+
+    def test_after_fork(self):
+        """
+        Testing that a child started from the listener of its parent gets its own,
+        moving the loggers over, and only once.
+        """
+        log = logger.get_logger("test_logger_fork")
+        parent = logger._LISTENER
+
+        # As in a child forked without os.register_at_fork (Python 3.6).
+        with patch("logger._PID", -1):
+            logger.after_fork()
+            child = logger._LISTENER
+        # In a real child the thread of the parent's listener is gone.
+        parent.stop()
+        self.assertIsNot(child, parent)
+        self.assertEqual(log.handlers, [logger._HANDLER])
+        self.assertIs(child.source, logger._HANDLER)
+
+        logger.after_fork()
+        self.assertIs(logger._LISTENER, child)
+
+
+if __name__ == "__main__":
+    unittest.main()
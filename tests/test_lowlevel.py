@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the receive path of bareos.bsock.LowLevel, against a socketpair.
+"""
+
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from bareos.bsock.constants import Constants
+from bareos.bsock.lowlevel import LowLevel
+from bareos.exceptions import SocketEmptyHeader
+
+
+def frame(data: bytes) -> bytes:
+    return struct.pack("!i", len(data)) + data
+
+
+def signal(value: int) -> bytes:
+    return struct.pack("!i", value)
+
+
+class TestLowLevelReceive(unittest.TestCase):
+    def setUp(self):
+        self.director, client = socket.socketpair()
+        self.addCleanup(self.director.close)
+        self.addCleanup(client.close)
+
+        self.bsock = LowLevel()
+        self.bsock.socket = client
+
+    def test_recv(self):
+        """
+        Testing that recv returns a single frame as a bytearray.
+        """
+        self.director.sendall(frame(b"auth cram-md5 <1.2@dir> ssl=0\x00"))
+        msg = self.bsock.recv()
+        self.assertIsInstance(msg, bytearray)
+        self.assertEqual(msg, bytearray(b"auth cram-md5 <1.2@dir> ssl=0\x00"))
+
+    def test_recv_msg_until_signal(self):
+        """
+        Testing that recv_msg joins frames until an end of message signal.
+        """
+        self.director.sendall(
+            frame(b"first line\n")
+            + frame(b"second ")
+            + frame(b"line\n")
+            + signal(Constants.BNET_EOD)
+        )
+        self.assertEqual(self.bsock.recv_msg(), b"first line\nsecond line\n")
+        self.assertEqual(self.bsock.status, Constants.BNET_EOD)
+
+    def test_recv_msg_regex(self):
+        """
+        Testing that recv_msg stops at a line matching the regex, even when the
+        line spans frames, and keeps the rest for the next message.
+        """
+        self.director.sendall(
+            frame(b"output\n10")
+            + frame(b"00 OK: bareos-dir\nnext message\n")
+            + signal(Constants.BNET_EOD)
+        )
+        self.assertEqual(self.bsock.recv_msg(), b"output\n1000 OK: bareos-dir")
+        self.assertEqual(self.bsock.recv_msg(), b"next message\n")
+
+    def test_partial_frames(self):
+        """
+        Testing that frames arriving in pieces are reassembled.
+        """
+        data = frame(b"x" * 1000 + b"\n") + signal(Constants.BNET_EOD)
+        for i in range(0, len(data), 7):
+            self.director.sendall(data[i : i + 7])
+        self.assertEqual(self.bsock.recv_msg(), b"x" * 1000 + b"\n")
+
+    def test_large_message(self):
+        """
+        Testing messages much larger than the receive buffer, in small and large
+        frames.
+        """
+        line = b"%d some output line\n"
+        lines = [line % i for i in range(50000)]
+        huge = b"y" * (LowLevel.RECV_BUFFER_SIZE * 5)
+
+        data = (
+            b"".join(frame(l) for l in lines) + frame(huge) + signal(Constants.BNET_EOD)
+        )
+
+        # The message doesn't fit in the socket buffers, so send it while receiving.
+        sender = threading.Thread(target=self.director.sendall, args=(data,))
+        sender.start()
+        self.addCleanup(sender.join)
+
+        self.assertEqual(self.bsock.recv_msg(), b"".join(lines) + huge)
+
+    def test_recv_msg_timeout(self):
+        """
+        Testing that recv_msg gives up once its timeout passes, and drops the
+        connection the rest of the message could still arrive on.
+        """
+        self.director.sendall(frame(b"incomplete line"))
+        start = time.monotonic()
+        with self.assertRaises(socket.timeout):
+            self.bsock.recv_msg(timeout=0.2)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertIsNone(self.bsock.socket)
+
+    def test_has_data(self):
+        """
+        Testing has_data, including data that is already buffered.
+        """
+        self.assertFalse(self.bsock.has_data(timeout=0))
+        self.director.sendall(frame(b"1000 OK\n") + frame(b"more\n"))
+        self.assertTrue(self.bsock.has_data())
+        self.assertEqual(self.bsock.recv_msg(), b"1000 OK")
+        # The second frame was received together with the first one.
+        self.assertTrue(self.bsock.has_data(timeout=0))
+
+    def test_send(self):
+        """
+        Testing that send delivers messages larger than the socket buffers.
+        """
+        msg = bytearray(b"z" * 4 * 1024 * 1024)
+        received = bytearray()
+
+        def receive():
+            while len(received) < len(msg) + 4:
+                received.extend(self.director.recv(65536))
+
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+        self.bsock.send(msg)
+        receiver.join()
+        self.assertEqual(received, frame(bytes(msg)))
+
+    def test_connection_closed(self):
+        """
+        Testing that a closed connection raises SocketEmptyHeader.
+        """
+        self.director.sendall(frame(b"partial")[:6])
+        self.director.close()
+        with self.assertRaises(SocketEmptyHeader):
+            self.bsock.recv()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Unit tests for methods in manifest.py.
+"""
+
+import os
+import tempfile
+import unittest
+
+import manifest
+
+
+class TestManifestMethods(unittest.TestCase):
+    def write_manifest(self, suffix: str, contents: str) -> str:
+        """
+        Write a manifest to a temporary file that is removed after the test.
+        """
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, "w") as f:
+            f.write(contents)
+
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_read_csv_manifest(self):
+        """
+        Testing read_manifest with a CSV manifest.
+        """
+        path = self.write_manifest(
+            ".csv",
+            "type,name,directory,pe,compression\n"
+            "user,TEST_USER,,,\n"
+            "user,TEST_USER1,,yes,GZIP9\n"
+            "group,TEST_GROUP,test.chpc.edu:/uufs/test_group,,\n",
+        )
+
+        rows = list(manifest.read_manifest(path))
+
+        self.assertEqual(
+            rows,
+            [
+                manifest.ManifestRow(line=2, kind="user", name="TEST_USER"),
+                manifest.ManifestRow(
+                    line=3, kind="user", name="TEST_USER1", pe=True, compression="GZIP9"
+                ),
+                manifest.ManifestRow(
+                    line=4,
+                    kind="group",
+                    name="TEST_GROUP",
+                    directory="test.chpc.edu:/uufs/test_group",
+                ),
+            ],
+        )
+
+    def test_read_jsonl_manifest(self):
+        """
+        Testing read_manifest with a JSONL manifest, including rows that are
+        reported as errors instead of aborting the read.
+        """
+        path = self.write_manifest(
+            ".jsonl",
+            '{"type": "user", "name": "TEST_USER", "pe": true}\n'
+            "\n"
+            "not json\n"
+            '{"type": "group", "name": "TEST_GROUP"}\n'
+            '{"type": "user", "name": "TEST_USER1", "compression": "NOPE"}\n'
+            '{"type": "user", "name": 12345}\n'
+            '{"type": "user", "name": ["TEST_USER2"]}\n',
+        )
+
+        rows = list(manifest.read_manifest(path))
+
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(
+            rows[0],
+            manifest.ManifestRow(line=1, kind="user", name="TEST_USER", pe=True),
+        )
+        # Numbers are read as their text.
+        self.assertEqual(
+            rows[4], manifest.ManifestRow(line=6, kind="user", name="12345")
+        )
+
+        # Every other row is invalid, but still reported with its line number.
+        rows = rows[1:4] + rows[5:]
+        self.assertEqual([row.line for row in rows], [3, 4, 5, 7])
+        for row in rows:
+            self.assertIsNotNone(row.error)
+
+    def test_unknown_format(self):
+        """
+        Testing read_manifest with an unsupported format.
+        """
+        path = self.write_manifest(".csv", "")
+
+        with self.assertRaises(ValueError):
+            list(manifest.read_manifest(path, "xml"))
+
+
+if __name__ == "__main__":
+    unittest.main()
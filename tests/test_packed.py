@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the packed config layout in packed.py and its use by util.py.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import packed
+import resource_index
+import staging
+import util
+
+
+class TestPacked(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        packed.LOGGER = MagicMock(spec=logging.Logger)
+        resource_index.LOGGER = MagicMock(spec=logging.Logger)
+        staging.LOGGER = MagicMock(spec=logging.Logger)
+        util.LOGGER = MagicMock(spec=logging.Logger)
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.dirs = {}
+        for kind in ("job", "fileset"):
+            self.dirs[kind] = os.path.join(tmp_dir, kind)
+            os.mkdir(self.dirs[kind])
+
+        for target, value in (
+            ("config.JOB_FILE_LOCATION", self.dirs["job"]),
+            ("config.FILESET_FILE_LOCATION", self.dirs["fileset"]),
+            ("config.STRICT_REFERENCES", False),
+            ("config.PACKED_SHARDS", 4),
+            ("resource_index._INDEX", resource_index.ResourceIndex(None, self.dirs)),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def add(self, name: str, batch=None) -> None:
+        util.write_file_set_file(
+            name, f"Group space for {name}", f"/g/{name}", batch=batch
+        )
+        util.write_job_file(name, name, client="host-fd", batch=batch)
+
+    def files(self, kind: str) -> dict:
+        """File name -> (inode, contents) of every file of a resource directory."""
+        files = {}
+        for filename in os.listdir(self.dirs[kind]):
+            path = os.path.join(self.dirs[kind], filename)
+            with open(path) as f:
+                files[filename] = (os.stat(path).st_ino, f.read())
+        return files
+
+    def test_split_resources(self):
+        """
+        Testing that resources are split at their top level braces, ignoring braces
+        in quoted strings and comments.
+        """
+        contents = (
+            "# A comment {\n"
+            'Job {\n  Name = "j1"\n  Description = "a } brace"\n}\n\n'
+            "FileSet {\n  Name = f1\n  Include {\n    File = /x # }\n  }\n}\n"
+            "Client { Address = h }"
+        )
+        resources = packed.split_resources(contents)
+        self.assertEqual([name for name, _ in resources], ["j1", "f1", None])
+        self.assertTrue(resources[0][1].startswith("Job {"))
+        self.assertTrue(resources[1][1].endswith("  }\n}"))
+
+        with self.assertRaises(ValueError):
+            packed.split_resources("Job {\n  Name = j1\n")
+
+    def test_shard_path(self):
+        """
+        Testing that shards are stable and named with a fixed width.
+        """
+        path = packed.shard_path("/d", "u1", 256)
+        self.assertEqual(path, packed.shard_path("/d", "u1", 256))
+        self.assertRegex(path, r"^/d/packed@[0-9a-f]{2}\.conf$")
+        self.assertTrue(packed.is_shard(path))
+        self.assertFalse(packed.is_shard("/d/u1.conf"))
+
+    def test_write_remove(self):
+        """
+        Testing that resources are written into shards, and that removing one only
+        rewrites its shard.
+        """
+        names = [f"g{i}" for i in range(12)]
+        with staging.BatchWriter() as batch:
+            for name in names:
+                self.add(name, batch)
+
+        jobs = self.files("job")
+        self.assertLessEqual(len(jobs), 4)
+        for name in names:
+            shard = os.path.basename(packed.shard_path(self.dirs["job"], name, 4))
+            self.assertIn(f'Name = "{name}"', jobs[shard][1])
+
+        with self.assertRaises(FileExistsError):
+            util.write_job_file("g3", "g3", client="host-fd")
+
+        util.remove_job_file("g3")
+        shard = os.path.basename(packed.shard_path(self.dirs["job"], "g3", 4))
+        after = self.files("job")
+        self.assertNotIn('Name = "g3"', after[shard][1])
+        for filename, (inode, contents) in jobs.items():
+            if filename != shard:
+                self.assertEqual(after[filename], (inode, contents))
+
+        with self.assertRaises(FileNotFoundError):
+            util.remove_job_file("g3")
+
+        # Removing the last resource of a shard removes the shard.
+        with staging.BatchWriter() as batch:
+            for name in names:
+                util.remove_file_set_file(name, batch=batch)
+        self.assertEqual(self.files("fileset"), {})
+
+    def test_migrate(self):
+        """
+        Testing that migrating to the packed layout and back restores the files.
+        """
+        with patch("config.PACKED_SHARDS", None):
+            for name in ("u1", "u2", "u3"):
+                self.add(name)
+        before = {
+            name: contents.strip() for name, (_, contents) in self.files("job").items()
+        }
+
+        self.assertEqual(util.migrate_layout(2), 6)
+        jobs = self.files("job")
+        self.assertTrue(all(packed.is_shard(name) for name in jobs))
+        self.assertLessEqual(len(jobs), 2)
+        util.remove_job_file("u2")
+        util.write_job_file("u2", "u2", client="host-fd")
+
+        self.assertEqual(util.migrate_layout(None), 6)
+        after = {
+            name: contents.strip() for name, (_, contents) in self.files("job").items()
+        }
+        self.assertEqual(after, before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the coalescing director reloads in reloader.py. The reloads run in
+background processes, so they are counted in a file.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import background
+import reloader
+
+
+class TestReloader(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        reloader.LOGGER = MagicMock(spec=logging.Logger)
+        background.LOGGER = MagicMock(spec=logging.Logger)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.reloads_path = os.path.join(self.tmp_dir, "reloads")
+        self.fail_path = os.path.join(self.tmp_dir, "fail")
+
+    def reload(self) -> None:
+        if os.path.exists(self.fail_path):
+            raise ConnectionRefusedError("director down")
+        time.sleep(0.05)
+        with open(self.reloads_path, "a") as f:
+            f.write("reload\n")
+
+    def reloads(self) -> int:
+        try:
+            with open(self.reloads_path) as f:
+                return len(f.readlines())
+        except FileNotFoundError:
+            return 0
+
+    def coordinator(self, **kwargs) -> reloader.Reloader:
+        kwargs.setdefault("window", 0.3)
+        kwargs.setdefault("max_delay", 10)
+        return reloader.Reloader(
+            self.reload, os.path.join(self.tmp_dir, "state", "reload.json"), **kwargs
+        )
+
+    def request(self, coordinator: reloader.Reloader) -> int:
+        sequence = coordinator.request()
+        coordinator.schedule()
+        return sequence
+
+    def test_coalesce(self):
+        """
+        Testing that back-to-back requests share one reload, which the last one can
+        wait for.
+        """
+        coordinator = self.coordinator()
+        start = time.monotonic()
+        for _ in range(10):
+            sequence = self.request(coordinator)
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertEqual(coordinator.status()["pending"], 10)
+
+        coordinator.wait(sequence)
+        self.assertEqual(self.reloads(), 1)
+        status = coordinator.status()
+        self.assertEqual(status["pending"], 0)
+        self.assertEqual(status["last_reload"]["requests"], 10)
+
+    def test_processes(self):
+        """
+        Testing that concurrent processes share one reload and all of them see it.
+        """
+        children = []
+        for _ in range(4):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    coordinator = self.coordinator()
+                    coordinator.wait(self.request(coordinator))
+                finally:
+                    os._exit(0 if self.reloads() else 1)
+            children.append(pid)
+
+        for pid in children:
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertEqual(self.reloads(), 1)
+
+    def test_max_delay(self):
+        """
+        Testing that requests that never settle are reloaded after the maximum delay.
+        """
+        coordinator = self.coordinator(window=1, max_delay=0.3)
+        deadline = time.monotonic() + 1.2
+        while time.monotonic() < deadline:
+            sequence = self.request(coordinator)
+            time.sleep(0.05)
+        self.assertGreaterEqual(self.reloads(), 1)
+
+        coordinator.wait(sequence)
+        self.assertLess(self.reloads(), 6)
+
+    def test_failure(self):
+        """
+        Testing that a failed reload is raised to the waiting run, and the next
+        request reloads again.
+        """
+        open(self.fail_path, "w").close()
+        coordinator = self.coordinator(window=0)
+        with self.assertRaises(reloader.ReloadError):
+            coordinator.wait(self.request(coordinator))
+        self.assertEqual(coordinator.status()["last_error"], "director down")
+
+        os.remove(self.fail_path)
+        coordinator.wait(self.request(coordinator))
+        self.assertEqual(self.reloads(), 1)
+        self.assertIsNone(coordinator.status()["last_error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Unit tests for methods in renderer.py.
+"""
+
+import os
+import unittest
+
+import renderer
+
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(renderer.__file__)), "templates"
+)
+
+
+class TestRendererMethods(unittest.TestCase):
+    def test_matches_str_format(self):
+        """
+        Testing that compiled templates render exactly like str.format.
+        """
+        values = {
+            "name": "TEST_FILE_SET",
+            "description": "100% of TEST_FILE_SET_DESCRIPTION",
+            "file_location": "/home/TEST_DIR",
+            "compression": "TESTCOMP",
+        }
+
+        with open(os.path.join(TEMPLATE_DIR, "fileset.txt"), "r") as f:
+            expected_contents = f.read().format(**values)
+
+        self.assertEqual(renderer.render("fileset", **values), expected_contents)
+
+    def test_template_cached(self):
+        """
+        Testing that each template is only loaded once.
+        """
+        self.assertIs(renderer.get_template("job"), renderer.get_template("job"))
+
+    def test_render_many(self):
+        """
+        Testing rendering a batch of resources in one call.
+        """
+        template = renderer.Template("Name = {name} {{{name}}}\n")
+
+        self.assertEqual(
+            template.render_many([{"name": "a"}, {"name": "b"}]),
+            ["Name = a {a}\n", "Name = b {b}\n"],
+        )
+        self.assertEqual(template.fields, ["name"])
+
+    def test_unsupported_field(self):
+        """
+        Testing that fields with format specs are rejected when compiling.
+        """
+        with self.assertRaises(ValueError):
+            renderer.Template("{name:>10}")
+
+
+if __name__ == "__main__":
+    unittest.main()
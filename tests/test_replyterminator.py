@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Unit tests for bareos.bsock.replyterminator.
+"""
+
+import unittest
+
+from bareos.bsock.replyterminator import ReplyTerminator, starts_with_status
+
+
+class TestReplyTerminator(unittest.TestCase):
+    def test_starts_with_status(self):
+        """
+        Testing which regexes take the 4 digit status fast path.
+        """
+        self.assertTrue(starts_with_status(rb"^\d\d\d\d OK.*$"))
+        self.assertTrue(starts_with_status(rb"^1000 OK.*$"))
+        self.assertTrue(starts_with_status(rb"^2000 OK Hello.*$"))
+        self.assertFalse(starts_with_status(rb"^\d\d\d OK.*$"))
+        self.assertFalse(starts_with_status(rb"^\d\d\d\d? OK.*$"))
+        self.assertFalse(starts_with_status(rb"^\d\d\d\d OK|^Error.*$"))
+        self.assertFalse(starts_with_status(rb"OK.*$"))
+
+    def test_search(self):
+        """
+        Testing that both paths find the same terminating line.
+        """
+        msg = b"output\n12 not a status\n1000 OK: bareos-dir\nnext\n"
+        for regex in (rb"^\d\d\d\d OK.*$", rb"^(\d\d\d\d) OK.*$", rb"^1000 OK.*$"):
+            match, pos = ReplyTerminator(regex).search(msg)
+            self.assertEqual(match.group(), b"1000 OK: bareos-dir")
+            self.assertEqual(pos, msg.index(b"1000"))
+
+    def test_incremental(self):
+        """
+        Testing a terminating line split over several frames, searching only from
+        the last incomplete line each time.
+        """
+        for regex in (rb"^\d\d\d\d OK.*$", rb"^(\d\d\d\d) OK.*$"):
+            terminator = ReplyTerminator(regex)
+            msg = bytearray()
+            pos = 0
+            for frame in (b"first\nsec", b"ond\n10", b"00", b" OK"):
+                msg += frame
+                match, pos = terminator.search(msg, pos)
+                if frame != b" OK":
+                    self.assertIsNone(match)
+            self.assertEqual(pos, len(b"first\nsecond\n"))
+            self.assertEqual(match.group(), b"1000 OK")
+
+
+if __name__ == "__main__":
+    unittest.main()
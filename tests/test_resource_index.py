@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the ResourceIndex in resource_index.py.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import resource_index
+
+
+class TestResourceIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        resource_index.LOGGER = MagicMock(spec=logging.Logger)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        self.dirs = {}
+        for kind in ("job", "fileset"):
+            self.dirs[kind] = os.path.join(self.tmp_dir, kind)
+            os.mkdir(self.dirs[kind])
+
+        self.index_path = os.path.join(self.tmp_dir, "cache", "resources.json")
+
+    def write(self, kind: str, filename: str, contents: str) -> None:
+        with open(os.path.join(self.dirs[kind], filename), "w") as f:
+            f.write(contents)
+
+    def age(self) -> None:
+        """
+        Move every mtime out of the window in which the index doesn't trust them.
+        """
+        old = time.time() - 60
+        for directory in self.dirs.values():
+            for filename in os.listdir(directory):
+                os.utime(os.path.join(directory, filename), (old, old))
+            os.utime(directory, (old, old))
+
+    def load(self) -> resource_index.ResourceIndex:
+        return resource_index.ResourceIndex(self.index_path, self.dirs).load()
+
+    def test_parse_names(self):
+        """
+        Testing that only resource names are parsed, quoted or not.
+        """
+        self.assertEqual(
+            resource_index.parse_names(
+                b'Job {\n    Name = "TEST_JOB"\n    FileSet = "TEST_FILE_SET"\n}\n'
+                b"Client {\n  name=TEST_CLIENT\n  Address = test\n}\n"
+            ),
+            ["TEST_JOB", "TEST_CLIENT"],
+        )
+
+    def test_index(self):
+        """
+        Testing lookups, including names that differ from their file name.
+        """
+        self.write("job", "TEST_JOB.conf", 'Job {\n  Name = "TEST_JOB"\n}\n')
+        self.write("job", "OTHER.conf", 'Job {\n  Name = "TEST_JOB1"\n}\n')
+        self.write("job", "DUPLICATE.conf", 'Job {\n  Name = "TEST_JOB1"\n}\n')
+        self.write("job", "IGNORED.txt", 'Job {\n  Name = "TEST_JOB2"\n}\n')
+
+        index = self.load()
+
+        self.assertEqual(index.names("job"), {"TEST_JOB", "TEST_JOB1"})
+        self.assertIn(("job", "TEST_JOB1"), index)
+        self.assertNotIn(("fileset", "TEST_JOB1"), index)
+        self.assertEqual(
+            index.files("job", "TEST_JOB"),
+            [os.path.join(self.dirs["job"], "TEST_JOB.conf")],
+        )
+        self.assertEqual(set(index.duplicates("job")), {"TEST_JOB1"})
+        self.assertEqual(index.missing("job", ["TEST_JOB", "TEST_JOB2"]), ["TEST_JOB2"])
+
+    def test_persisted(self):
+        """
+        Testing that a persisted index skips unchanged directories and only
+        rescans changed files.
+        """
+        self.write("job", "A.conf", 'Job {\n  Name = "A"\n}\n')
+        self.write("fileset", "A.conf", 'FileSet {\n  Name = "A"\n}\n')
+        self.age()
+
+        self.assertEqual(self.load().scanned_files, 2)
+
+        # Nothing changed, nothing is scanned.
+        index = self.load()
+        self.assertEqual(index.scanned_files, 0)
+        self.assertEqual(index.names("fileset"), {"A"})
+
+        # Only the new file in the changed directory is scanned.
+        self.write("job", "B.conf", 'Job {\n  Name = "B"\n}\n')
+        index = self.load()
+        self.assertEqual(index.scanned_files, 1)
+        self.assertEqual(index.names("job"), {"A", "B"})
+
+        # Changes right after a scan share its timestamps, so they are rescanned.
+        self.assertEqual(self.load().scanned_files, 1)
+
+        os.remove(os.path.join(self.dirs["job"], "A.conf"))
+        self.assertEqual(self.load().names("job"), {"B"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the BatchWriter in staging.py.
+"""
+
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import staging
+
+
+class TestBatchWriter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        staging.LOGGER = MagicMock(spec=logging.Logger)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmp_dir, name)
+
+    def test_commit(self):
+        """
+        Testing that staged writes and removals only land on commit.
+        """
+        with open(self.path("OLD.conf"), "w") as f:
+            f.write("old")
+
+        batch = staging.BatchWriter()
+        batch.write(self.path("NEW.conf"), "new")
+        batch.remove(self.path("OLD.conf"))
+
+        # Nothing changed yet, apart from the hidden staging directory.
+        self.assertTrue(os.path.exists(self.path("OLD.conf")))
+        self.assertFalse(os.path.exists(self.path("NEW.conf")))
+        self.assertTrue(batch.exists(self.path("NEW.conf")))
+        self.assertFalse(batch.exists(self.path("OLD.conf")))
+
+        batch.commit()
+
+        self.assertEqual(os.listdir(self.tmp_dir), ["NEW.conf"])
+        with open(self.path("NEW.conf"), "r") as f:
+            self.assertEqual(f.read(), "new")
+
+    def test_conflicts(self):
+        """
+        Testing conflicts with existing and staged files.
+        """
+        with open(self.path("OLD.conf"), "w") as f:
+            f.write("old")
+
+        with staging.BatchWriter() as batch:
+            with self.assertRaises(FileExistsError):
+                batch.write(self.path("OLD.conf"), "new")
+
+            batch.write(self.path("NEW.conf"), "new")
+            with self.assertRaises(FileExistsError):
+                batch.write(self.path("NEW.conf"), "new")
+
+            with self.assertRaises(FileNotFoundError):
+                batch.remove(self.path("MISSING.conf"))
+
+            # Removing a staged write just drops it.
+            batch.remove(self.path("NEW.conf"))
+
+        self.assertEqual(os.listdir(self.tmp_dir), ["OLD.conf"])
+
+    def test_replace(self):
+        """
+        Testing that replaced files read back their staged contents until commit.
+        """
+        with open(self.path("OLD.conf"), "w") as f:
+            f.write("old")
+
+        with staging.BatchWriter() as batch:
+            self.assertIsNone(batch.read(self.path("NEW.conf")))
+            batch.replace(self.path("NEW.conf"), "new")
+            batch.replace(self.path("OLD.conf"), "old 1")
+            batch.replace(self.path("OLD.conf"), "old 2")
+            self.assertEqual(batch.read(self.path("OLD.conf")), "old 2")
+            with open(self.path("OLD.conf")) as f:
+                self.assertEqual(f.read(), "old")
+
+        with open(self.path("OLD.conf")) as f:
+            self.assertEqual(f.read(), "old 2")
+
+        # Removing a replaced file removes the file on disk too.
+        with staging.BatchWriter() as batch:
+            batch.replace(self.path("OLD.conf"), "old 3")
+            batch.remove(self.path("OLD.conf"))
+            self.assertIsNone(batch.read(self.path("OLD.conf")))
+
+        self.assertEqual(os.listdir(self.tmp_dir), ["NEW.conf"])
+
+    def test_edit(self):
+        """
+        Testing that edits apply to the contents of the file at commit, so batches
+        editing the same file keep each other's changes.
+        """
+        first = staging.BatchWriter()
+        second = staging.BatchWriter()
+        first.edit(self.path("SHARED.conf"), lambda c: (c or "") + "first\n")
+        second.edit(self.path("SHARED.conf"), lambda c: (c or "") + "second\n")
+        self.assertEqual(first.preview(self.path("SHARED.conf")), "first\n")
+
+        second.commit()
+        first.commit()
+        with open(self.path("SHARED.conf")) as f:
+            self.assertEqual(f.read(), "second\nfirst\n")
+
+        # An edit returning None removes the file.
+        with staging.BatchWriter() as batch:
+            batch.edit(self.path("SHARED.conf"), lambda c: None)
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_many_locks(self):
+        """
+        Testing that a batch locking more files than the process may open only uses
+        one file descriptor for the locks.
+        """
+        patcher = patch("config.LOCK_LOCATION", self.path("locks"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = len(os.listdir("/proc/self/fd")) + 32
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        self.addCleanup(resource.setrlimit, resource.RLIMIT_NOFILE, (soft, hard))
+
+        names = [f"u{i}.conf" for i in range(limit + 100)]
+        with staging.BatchWriter() as batch:
+            for name in names:
+                batch.write(self.path(name), name)
+
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), sorted(names + ["locks"]))
+
+    def test_failed_commit(self):
+        """
+        Testing that a failure before the renames leaves no partial files.
+        """
+        batch = staging.BatchWriter()
+        batch.write(self.path("A.conf"), "a")
+        batch.write(self.path("B.conf"), "b")
+
+        with patch("staging._fsync", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                batch.commit()
+
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_abort_on_exception(self):
+        """
+        Testing that an exception inside the context manager discards the batch.
+        """
+        with self.assertRaises(RuntimeError):
+            with staging.BatchWriter() as batch:
+                batch.write(self.path("A.conf"), "a")
+                raise RuntimeError()
+
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the instrumentation of LowLevel, against a fake director.
+"""
+
+import logging
+import socket
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from bareos.bsock import DirectorConsole, Stats
+from bareos.bsock.stats import LatencyHistogram
+from bareos.util.password import Password
+
+from tests.fake_director import FakeDirector
+
+VERSION = b"bareos-dir Version: 17.2.4 (21 Sep 2017)\n"
+
+
+def slow(command: bytes) -> bytes:
+    time.sleep(0.2)
+    return b"done\n"
+
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        self.director = FakeDirector()
+        self.director.start()
+        self.addCleanup(self.director.stop)
+        self.console = DirectorConsole(
+            port=self.director.port, password=Password("secret")
+        )
+        self.addCleanup(self.console.disconnect)
+
+    def test_off(self):
+        """
+        Testing that nothing is recorded, and no per frame debug message is logged,
+        unless measuring.
+        """
+        self.console.logger = MagicMock(spec=logging.Logger)
+        self.console.logger.isEnabledFor.return_value = True
+        self.assertIsNone(self.console.stats)
+        self.assertEqual(self.console.call("version"), VERSION)
+        self.console.logger.debug.assert_not_called()
+
+        with self.console.measure():
+            self.console.call("version")
+        self.console.logger.debug.assert_called()
+
+    def test_measure(self):
+        """
+        Testing that bytes, frames and command latencies are recorded.
+        """
+        with self.console.measure() as stats:
+            self.assertEqual(self.console.call("version"), VERSION)
+            self.console.call_many(["version", "version", "status"])
+        self.assertIsNone(self.console.stats)
+
+        # 4 bytes header plus the command for each.
+        self.assertEqual(stats.bytes_sent, 4 * 4 + 7 * 3 + 6)
+        self.assertEqual(stats.frames_sent, 4)
+        # Every version reply is one line and BNET_EOD, status only BNET_EOD.
+        self.assertEqual(stats.frames_received, 7)
+        self.assertEqual(stats.bytes_received, 3 * (8 + len(VERSION)) + 4)
+        self.assertGreaterEqual(stats.recv_calls, 1)
+        self.assertEqual(stats.commands["version"].count, 3)
+        self.assertEqual(stats.commands["status"].count, 1)
+        self.assertEqual(stats.as_dict()["commands"]["version"]["count"], 3)
+        self.assertIn("version: 3 calls", str(stats))
+
+    def test_handshake(self):
+        """
+        Testing that handshakes are recorded, and nested measurements add up.
+        """
+        outer = Stats()
+        with self.console.measure(outer):
+            with self.console.measure() as inner:
+                self.console.reconnect()
+                self.assertEqual(outer.handshakes, 0)
+            self.assertIs(self.console.stats, outer)
+        self.assertEqual(inner.handshakes, 1)
+        self.assertEqual(outer.handshakes, 1)
+        self.assertEqual(outer.handshake_latency.count, 1)
+
+    def test_timeout(self):
+        """
+        Testing that timeouts are counted.
+        """
+        self.director.replies[b"slow"] = slow
+        with self.console.measure() as stats:
+            self.console.send(bytearray(b"slow"))
+            with self.assertRaises(socket.timeout):
+                self.console.recv_msg(timeout=0.05)
+        self.assertEqual(stats.timeouts, 1)
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentile(self):
+        """
+        Testing that percentiles are the upper bounds of their buckets.
+        """
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        for seconds in [0.0005] * 90 + [0.3] * 9 + [400]:
+            histogram.add(seconds)
+        self.assertEqual(histogram.percentile(50), 0.001)
+        self.assertEqual(histogram.percentile(95), 0.5)
+        self.assertEqual(histogram.percentile(100), 400)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.min, 0.0005)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,13 +6,15 @@ Theses tests will be performed using the settings in config.py and secrets.py.
 
 import os
 import logging
+import shutil
+import tempfile
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, call, patch
 
-import git
 import mysql.connector
 
 import config
+import db
 import util
 
 # This user must both have a standard and PE home directory.
@@ -204,23 +206,38 @@ class TestUtilMethods(unittest.TestCase):
             f"{config.JOB_FILE_LOCATION}/TEST_FILE_SET.conf"
         )
 
-    @patch("util.mysql.connector", autospec=mysql.connector)
-    def test_get_dir_from_db(self, mock_cnx):
+    def mock_db(self, mock_cnx):
         """
-        Testing get_dir_from_db method.
+        Reset the shared database session and return the mocked connection and
+        prepared cursor it will use.
         """
-        # Mock returned objects.
+        db.get_session().close()
+
+        # Always go to the mocked database instead of the directory cache.
+        patcher = patch("db.cache.get_cache", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
         cnx = mock_cnx.connect.return_value = MagicMock(
             autospec=mysql.connector.MySQLConnection
         )
         cur = cnx.cursor.return_value = MagicMock(
-            autospec=mysql.connector.cursor.MySQLCursor
+            autospec=mysql.connector.cursor.MySQLCursorPrepared
         )
 
-        # Setting the return value for 'for name, homedir_source in cur'.
+        return cnx, cur
+
+    @patch("db.mysql.connector", autospec=mysql.connector)
+    def test_get_dir_from_db(self, mock_cnx):
+        """
+        Testing get_dir_from_db method.
+        """
+        cnx, cur = self.mock_db(mock_cnx)
+
+        # Setting the return value for 'for name, homedir_source, ... in cur'.
         cur.__iter__.return_value = (
-            ("TEST_USER", "test.chpc.edu:/uufs/home/test_user"),
-            ("TEST_USER1", "test.chpc.edu:/uufs/home/test_user1"),
+            ("TEST_USER", "test.chpc.edu:/uufs/home/test_user", None),
+            ("TEST_USER1", "test.chpc.edu:/uufs/home/test_user1", None),
         )
 
         res = util.get_dir_from_db(["TEST_USER", "TEST_USER1", "TEST_USER2"])
@@ -235,16 +252,16 @@ class TestUtilMethods(unittest.TestCase):
             },
         )
 
-        # Ensure .execute was called correctly.
+        # Ensure .execute was called correctly, padded to a power of two.
+        cnx.cursor.assert_called_with(prepared=True)
         cur.execute.assert_called_with(
-            "SELECT name, homedir_source FROM accounts_user WHERE name in (%s,%s,%s)",
-            ("TEST_USER", "TEST_USER1", "TEST_USER2"),
+            (
+                "SELECT name, homedir_source, pe_homedir_source FROM accounts_user "
+                "WHERE name in (?,?,?,?)"
+            ),
+            ("TEST_USER", "TEST_USER1", "TEST_USER2", None),
         )
 
-        # Sanity check to ensure we closed resources.
-        cur.close.assert_called()
-        cnx.close.assert_called()
-
         # Test edge case with no directories retrieved from the DB.
         cur.__iter__.return_value = ()
 
@@ -255,23 +272,26 @@ class TestUtilMethods(unittest.TestCase):
             res, {"TEST_USER": None, "TEST_USER1": None, "TEST_USER2": None}
         )
 
-    @patch("util.mysql.connector", autospec=mysql.connector)
+        # The connection and prepared statement were reused for the second lookup.
+        mock_cnx.connect.assert_called_once()
+        cnx.cursor.assert_called_once()
+
+        # Sanity check to ensure we close resources.
+        db.get_session().close()
+        cur.close.assert_called()
+        cnx.close.assert_called()
+
+    @patch("db.mysql.connector", autospec=mysql.connector)
     def test_get_pe_dir_from_db(self, mock_cnx):
         """
         Testing get_pe_dir_from_db method.
         """
-        # Mock returned objects.
-        cnx = mock_cnx.connect.return_value = MagicMock(
-            autospec=mysql.connector.MySQLConnection
-        )
-        cur = cnx.cursor.return_value = MagicMock(
-            autospec=mysql.connector.cursor.MySQLCursor
-        )
+        cnx, cur = self.mock_db(mock_cnx)
 
-        # Setting the return value for 'for name, homedir_source in cur'.
+        # Setting the return value for 'for name, ..., pe_homedir_source in cur'.
         cur.__iter__.return_value = (
-            ("TEST_USER", "test.chpc.edu:/uufs/home/test_user"),
-            ("TEST_USER1", "test.chpc.edu:/uufs/home/test_user1"),
+            ("TEST_USER", None, "test.chpc.edu:/uufs/home/test_user"),
+            ("TEST_USER1", None, "test.chpc.edu:/uufs/home/test_user1"),
         )
 
         res = util.get_pe_dir_from_db(["TEST_USER", "TEST_USER1", "TEST_USER2"])
@@ -289,16 +309,12 @@ class TestUtilMethods(unittest.TestCase):
         # Ensure .execute was called correctly.
         cur.execute.assert_called_with(
             (
-                "SELECT name, pe_homedir_source FROM accounts_user WHERE name in "
-                "(%s,%s,%s)"
+                "SELECT name, homedir_source, pe_homedir_source FROM accounts_user "
+                "WHERE name in (?,?,?,?)"
             ),
-            ("TEST_USER", "TEST_USER1", "TEST_USER2"),
+            ("TEST_USER", "TEST_USER1", "TEST_USER2", None),
         )
 
-        # Sanity check to ensure we closed resources.
-        cur.close.assert_called()
-        cnx.close.assert_called()
-
         # Test edge case with no directories retrieved from the DB.
         cur.__iter__.return_value = ()
 
@@ -309,28 +325,98 @@ class TestUtilMethods(unittest.TestCase):
             res, {"TEST_USER": None, "TEST_USER1": None, "TEST_USER2": None}
         )
 
-    @patch("util.Repo", autospec=git.Repo)
-    def test_push_to_gitlab(self, mock_repo):
+    @patch("db.mysql.connector", autospec=mysql.connector)
+    def test_get_dirs_from_db(self, mock_cnx):
+        """
+        Testing that get_dirs_from_db returns both directories from one query.
+        """
+        cnx, cur = self.mock_db(mock_cnx)
+
+        cur.__iter__.return_value = (
+            (
+                "TEST_USER",
+                "test.chpc.edu:/uufs/home/test_user",
+                "test.chpc.edu:/uufs/pe/test_user",
+            ),
+        )
+
+        res = util.get_dirs_from_db(["TEST_USER", "TEST_USER1"])
+
+        self.assertEqual(
+            res,
+            {
+                "TEST_USER": (
+                    "test.chpc.edu:/uufs/home/test_user",
+                    "test.chpc.edu:/uufs/pe/test_user",
+                ),
+                "TEST_USER1": (None, None),
+            },
+        )
+        cur.execute.assert_called_once()
+
+    @patch("db.mysql.connector", autospec=mysql.connector)
+    def test_iter_dir_from_db(self, mock_cnx):
+        """
+        Testing that iter_dir_from_db splits lookups into chunks and streams
+        the results.
+        """
+        cnx, cur = self.mock_db(mock_cnx)
+
+        # Each chunk only finds its first user.
+        cur.__iter__.side_effect = [
+            iter((("TEST_USER", "test.chpc.edu:/uufs/home/test_user", None),)),
+            iter((("TEST_USER2", "test.chpc.edu:/uufs/home/test_user2", None),)),
+        ]
+
+        res = util.iter_dir_from_db(
+            ["TEST_USER", "TEST_USER1", "TEST_USER1", "TEST_USER2"], chunk_size=2
+        )
+
+        # Nothing is queried until the results are consumed.
+        mock_cnx.connect.assert_not_called()
+
+        self.assertEqual(
+            list(res),
+            [
+                ("TEST_USER", "test.chpc.edu:/uufs/home/test_user"),
+                ("TEST_USER1", None),
+                ("TEST_USER2", "test.chpc.edu:/uufs/home/test_user2"),
+            ],
+        )
+
+        # Ensure we ran one query per chunk, with the duplicate user only looked
+        # up once.
+        self.assertEqual(
+            cur.execute.call_args_list,
+            [
+                call(
+                    "SELECT name, homedir_source, pe_homedir_source FROM "
+                    "accounts_user WHERE name in (?,?)",
+                    ("TEST_USER", "TEST_USER1"),
+                ),
+                call(
+                    "SELECT name, homedir_source, pe_homedir_source FROM "
+                    "accounts_user WHERE name in (?)",
+                    ("TEST_USER2",),
+                ),
+            ],
+        )
+
+    @patch("util.committer.Committer", autospec=True)
+    def test_push_to_gitlab(self, mock_committer):
         """
         Testing the 'push_to_gitlab' method.
         """
-        mock_repo.return_value = MagicMock(autospec=git.Repo)
+        committer = mock_committer.return_value
 
         # Test the bare exception.
-        mock_repo.return_value.bare = True
+        mock_committer.side_effect = FileNotFoundError("not a repo")
         with self.assertRaises(FileNotFoundError):
             util.push_to_gitlab("test message")
+        mock_committer.side_effect = None
 
-        # Ensure this was logged.
-        util.LOGGER.error.assert_called_with(
-            f"{config.GIT_LOCATION} is not an initialized git repo."
-        )
-
-        # Reset bare flag.
-        mock_repo.return_value.bare = False
-
-        # Simulate .add throwing an exception.
-        mock_repo.return_value.git.add.side_effect = Exception("TEST ERROR MSG")
+        # Simulate .record throwing an exception.
+        committer.record.side_effect = Exception("TEST ERROR MSG")
         util.push_to_gitlab("test message")
 
         # Ensure this was logged.
@@ -339,14 +425,23 @@ class TestUtilMethods(unittest.TestCase):
         )
 
         # Reset the exception side effect.
-        mock_repo.return_value.git.add.side_effect = None
-
-        # Full test.
-        util.push_to_gitlab("test")
-        mock_repo.return_value.git.push.assert_called_once()
-        util.LOGGER.info.assert_called_with(
-            "Pushing to GitLab with commit message: 'test'"
-        )
+        committer.record.side_effect = None
+
+        # Full test, only the paths of committed batches are recorded.
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        with util.BatchWriter() as batch:
+            batch.write(f"{tmp_dir}/push_test.conf", "Job {}")
+
+        with patch("config.GIT_PUSH_ASYNC", False):
+            util.push_to_gitlab("test")
+        committer.record.assert_called_with("test", [f"{tmp_dir}/push_test.conf"])
+        committer.flush.assert_called_once()
+
+        with patch("config.GIT_PUSH_ASYNC", True):
+            util.push_to_gitlab("test")
+        committer.record.assert_called_with("test", [])
+        committer.schedule.assert_called_once()
 
 
 class TestUtilMethodsConfig(unittest.TestCase):
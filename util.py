@@ -1,18 +1,147 @@
 #!/usr/bin/env python3
 
+import contextlib
 import os
-from typing import List, Dict, Optional
-
-import mysql.connector
-import bareos.bsock
-from git import Repo
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 
+import configurer
+import lazy
 import logger
 import config
+import packed
+import reloader
+import renderer
+import resource_index
 import secrets
+import staging
+from staging import BatchWriter
+
+# Backends only imported by the commands using them, see lazy.load.
+bareos = lazy.load("bareos")
+broker = lazy.load("broker")
+cache = lazy.load("cache")
+committer = lazy.load("committer")
+db = lazy.load("db")
 
 LOGGER = logger.get_logger(__name__)
 
+# Default of request_reload's 'wait', see set_reload_wait.
+_RELOAD_WAIT = False
+
+# Whether lookups are served from the cache when the database is down, see
+# set_offline.
+_OFFLINE = False
+
+
+def _check_defined(kind: str, name: str, writer: BatchWriter) -> None:
+    """Raise FileExistsError if a resource of the given kind and name is already
+    defined in any file, not only in the file named after it.
+    """
+    for path in resource_index.get_index().files(kind, name):
+        if packed.is_shard(path):
+            # A shard holds many resources, this one may be removed in the batch.
+            defined = packed.contains(path, name, writer)
+        else:
+            defined = writer.exists(path)
+        if defined:
+            err_msg = f"{kind} resource '{name}' is already defined in {path}"
+            LOGGER.error(err_msg)
+            raise FileExistsError(err_msg)
+
+
+def _check_references(job: str, writer: BatchWriter, **references: str) -> None:
+    """Check that every resource a Job references by kind is defined, either already
+    or staged in the current batch.
+    """
+    index = resource_index.get_index()
+    missing = []
+
+    for kind, name in references.items():
+        if (kind, name) in index:
+            continue
+        if (
+            kind == "fileset"
+            and _resource_path(config.FILESET_FILE_LOCATION, name, writer) is not None
+        ):
+            continue
+        missing.append(f"{kind} '{name}'")
+
+    if missing:
+        err_msg = f"Job '{job}' references undefined {', '.join(missing)}"
+        if config.STRICT_REFERENCES:
+            LOGGER.error(err_msg)
+            raise LookupError(err_msg)
+        LOGGER.warning(err_msg)
+
+
+def _lock_name(name: str, writer: BatchWriter) -> None:
+    """Lock the Job and FileSet of the name against other runs until the batch is
+    committed, always in the same order so runs don't wait for each other in a
+    cycle. Their shards are only locked on commit, see packed.add.
+    """
+    for location in sorted((config.FILESET_FILE_LOCATION, config.JOB_FILE_LOCATION)):
+        writer.lock(f"{location}/{name}.conf")
+
+
+def _resource_path(location: str, name: str, writer: BatchWriter) -> Optional[str]:
+    """The file defining the resource 'name' in 'location' once the batch is
+    committed: the file named after it, or its shard when config.PACKED_SHARDS is
+    set. 'None' when neither defines it.
+    """
+    path = f"{location}/{name}.conf"
+    if writer.exists(path):
+        return path
+
+    if config.PACKED_SHARDS:
+        shard = packed.shard_path(location, name, config.PACKED_SHARDS)
+        if packed.contains(shard, name, writer):
+            return shard
+
+    return None
+
+
+@contextlib.contextmanager
+def _writing(batch: Optional[BatchWriter]) -> Iterator[BatchWriter]:
+    """The given batch, or a new one committed on exit (aborted on errors), so the
+    files it locked are released either way.
+    """
+    if batch is not None:
+        yield batch
+        return
+
+    with BatchWriter() as writer:
+        yield writer
+
+
+def _write_resource(
+    location: str, name: str, contents: str, writer: BatchWriter
+) -> str:
+    """Stage a new resource in the file named after it, or in its shard when
+    config.PACKED_SHARDS is set. Returns the path of the file.
+    """
+    if config.PACKED_SHARDS:
+        path = packed.shard_path(location, name, config.PACKED_SHARDS)
+        packed.add(path, name, contents, writer)
+    else:
+        path = f"{location}/{name}.conf"
+        writer.write(path, contents)
+    return path
+
+
+def _remove_resource(location: str, name: str, writer: BatchWriter) -> Optional[str]:
+    """Stage the removal of a resource, editing only its shard when it is packed.
+    Returns the path of the file, or 'None' when no file defines it.
+    """
+    path = _resource_path(location, name, writer)
+    if path is None:
+        return None
+
+    if packed.is_shard(path):
+        packed.remove(path, name, writer)
+    else:
+        writer.remove(path)
+    return path
+
 
 def write_job_file(
     name: str,
@@ -20,190 +149,493 @@ def write_job_file(
     client: str = config.DEFAULT_CLIENT,
     jobdef: str = config.DEFAULT_JOB_DEFS,
     storage: str = config.DEFAULT_STORAGE,
+    batch: Optional[BatchWriter] = None,
 ) -> None:
-    job_contents: str
-
-    with open("templates/job.txt", "r") as f:
-        job_contents = f.read()
-
-    job_contents = job_contents.format(
-        name=name, client=client, jobdef=jobdef, fileset=fileset, storage=storage
+    """Write a new Job file. When a batch is given the file is only staged in it and
+    lands with the rest of the batch on commit, otherwise it is written atomically
+    right away.
+    """
+    job_contents = renderer.render(
+        "job", name=name, client=client, jobdef=jobdef, fileset=fileset, storage=storage
     )
 
-    if os.path.exists(f"{config.JOB_FILE_LOCATION}/{name}.conf"):
-        err_msg = (
-            f"Job file for '{name}' already exists at "
-            f"{config.JOB_FILE_LOCATION}/{name}.conf"
+    with _writing(batch) as writer:
+        _lock_name(name, writer)
+        existing = _resource_path(config.JOB_FILE_LOCATION, name, writer)
+        if existing is not None:
+            err_msg = f"Job file for '{name}' already exists at {existing}"
+            LOGGER.error(err_msg)
+            raise FileExistsError(err_msg)
+
+        _check_defined("job", name, writer)
+        _check_references(
+            name,
+            writer,
+            fileset=fileset,
+            client=client,
+            jobdefs=jobdef,
+            storage=storage,
         )
-        LOGGER.error(err_msg)
-        raise FileExistsError(err_msg)
 
-    with open(f"{config.JOB_FILE_LOCATION}/{name}.conf", "w") as f:
-        f.write(job_contents)
+        path = _write_resource(config.JOB_FILE_LOCATION, name, job_contents, writer)
 
     LOGGER.info(
-        f"Wrote new job file at {config.JOB_FILE_LOCATION}/{name}.conf with "
+        f"{'Staged' if batch is not None else 'Wrote'} new job file at {path} with "
         f"name={name}, fileset={fileset}, client={client}, jobdef={jobdef}, "
         f"storage={storage}"
     )
 
 
-def remove_job_file(name: str) -> None:
-    if os.path.exists(f"{config.JOB_FILE_LOCATION}/{name}.conf"):
-        os.remove(f"{config.JOB_FILE_LOCATION}/{name}.conf")
-        LOGGER.info(f"Removed job file at {config.JOB_FILE_LOCATION}/{name}.conf")
-    else:
-        err_msg = (
-            f"Job file for '{name}' not found at {config.JOB_FILE_LOCATION}/{name}.conf"
-        )
-        LOGGER.error(err_msg)
-        raise FileNotFoundError(err_msg)
+def remove_job_file(name: str, batch: Optional[BatchWriter] = None) -> None:
+    """Remove a Job file, either right away or on commit of the given batch."""
+    with _writing(batch) as writer:
+        _lock_name(name, writer)
+        path = _remove_resource(config.JOB_FILE_LOCATION, name, writer)
+        if path is None:
+            err_msg = (
+                f"Job file for '{name}' not found at "
+                f"{config.JOB_FILE_LOCATION}/{name}.conf"
+            )
+            LOGGER.error(err_msg)
+            raise FileNotFoundError(err_msg)
+
+    LOGGER.info(
+        f"{'Staged removal of' if batch is not None else 'Removed'} job file at {path}"
+    )
 
 
 def write_file_set_file(
-    name: str, description: str, file_location: str, compression: str = "GZIP"
+    name: str,
+    description: str,
+    file_location: str,
+    compression: str = "GZIP",
+    batch: Optional[BatchWriter] = None,
 ) -> None:
-    file_contents: str
-
-    with open("templates/fileset.txt", "r") as f:
-        file_contents = f.read()
-
-    file_contents = file_contents.format(
+    """Write a new FileSet file. When a batch is given the file is only staged in it
+    and lands with the rest of the batch on commit, otherwise it is written atomically
+    right away.
+    """
+    file_contents = renderer.render(
+        "fileset",
         name=name,
         description=description,
         file_location=file_location,
         compression=compression,
     )
 
-    if os.path.exists(f"{config.FILESET_FILE_LOCATION}/{name}.conf"):
-        err_msg = (
-            f"FileSet file for '{name}' already exists at "
-            f"{config.JOB_FILE_LOCATION}/{name}.conf"
-        )
-        LOGGER.error(err_msg)
-        raise FileExistsError(err_msg)
+    with _writing(batch) as writer:
+        _lock_name(name, writer)
+        if _resource_path(config.FILESET_FILE_LOCATION, name, writer) is not None:
+            err_msg = (
+                f"FileSet file for '{name}' already exists at "
+                f"{config.JOB_FILE_LOCATION}/{name}.conf"
+            )
+            LOGGER.error(err_msg)
+            raise FileExistsError(err_msg)
 
-    with open(f"{config.FILESET_FILE_LOCATION}/{name}.conf", "w") as f:
-        f.write(file_contents)
+        _check_defined("fileset", name, writer)
+
+        path = _write_resource(
+            config.FILESET_FILE_LOCATION, name, file_contents, writer
+        )
 
     LOGGER.info(
-        f"Wrote new FileSet file at {config.FILESET_FILE_LOCATION}/{name}.conf "
+        f"{'Staged' if batch is not None else 'Wrote'} new FileSet file at {path} "
         f"with name={name}, description={description}, file_location={file_location}, "
         f"compression={compression}"
     )
 
 
-def remove_file_set_file(name: str) -> None:
-    if os.path.exists(f"{config.FILESET_FILE_LOCATION}/{name}.conf"):
-        os.remove(f"{config.FILESET_FILE_LOCATION}/{name}.conf")
-        LOGGER.info(
-            f"Removed FileSet file at {config.FILESET_FILE_LOCATION}/{name}.conf"
-        )
-    else:
-        err_msg = (
-            f"FileSet file for '{name}' not found at "
-            f"{config.JOB_FILE_LOCATION}/{name}.conf"
+def remove_file_set_file(name: str, batch: Optional[BatchWriter] = None) -> None:
+    """Remove a FileSet file, either right away or on commit of the given batch."""
+    with _writing(batch) as writer:
+        _lock_name(name, writer)
+        path = _remove_resource(config.FILESET_FILE_LOCATION, name, writer)
+        if path is None:
+            err_msg = (
+                f"FileSet file for '{name}' not found at "
+                f"{config.JOB_FILE_LOCATION}/{name}.conf"
+            )
+            LOGGER.error(err_msg)
+            raise FileNotFoundError(err_msg)
+
+    LOGGER.info(
+        f"{'Staged removal of' if batch is not None else 'Removed'} FileSet file at "
+        f"{path}"
+    )
+
+
+def migrate_layout(shards: Optional[int]) -> int:
+    """Move every Job and FileSet into 'shards' packed files per directory, or into
+    one file per resource when 'shards' is None. All files change together on commit.
+    Returns the number of resources.
+    """
+    with BatchWriter() as batch:
+        count = sum(
+            packed.migrate(location, shards, batch)
+            for location in (config.JOB_FILE_LOCATION, config.FILESET_FILE_LOCATION)
         )
-        LOGGER.error(err_msg)
-        raise FileNotFoundError(err_msg)
+        changed = len(batch)
 
+    LOGGER.info(
+        f"Moved {count} resources into "
+        f"{f'{shards} shards' if shards else 'one file each'}, {changed} files changed"
+    )
+    return count
+
+
+def call_director(command: str) -> str:
+    """Run a bconsole command on the director and return its output.
+
+    The command runs on a session of the broker when one is listening on
+    config.BROKER_SOCKET, otherwise on a new connection that is closed afterwards.
+    """
+    if config.BROKER_SOCKET:
+        try:
+            return broker.call(command)
+        except broker.BrokerUnavailable as e:
+            LOGGER.debug(f"{e}, connecting to the director directly")
 
-def reload_bconsole() -> None:
     passwd = bareos.bsock.Password(secrets.bconsole_password)
 
     console = bareos.bsock.DirectorConsole(
-        address="localhost", port=9101, password=passwd
+        address=config.DIRECTOR_ADDRESS, port=config.DIRECTOR_PORT, password=passwd
     )
+    try:
+        return (console.call(command) or b"").decode("utf-8", "replace")
+    finally:
+        console.disconnect()
 
+
+def reload_bconsole() -> None:
     LOGGER.debug("Reloading Bareos Director...")
-    console.call("reload")
+    call_director("reload")
     LOGGER.info("Reloaded Bareos director.")
 
 
-def get_dir_from_db(users: List[str]) -> Dict[str, Optional[str]]:
-    """Given a list of users, look up their home directory in the provided database
-    in config.py.
+def set_reload_wait(wait: bool) -> None:
+    """Make request_reload wait for the reload by default."""
+    global _RELOAD_WAIT
+    _RELOAD_WAIT = wait
 
-    Returns a dictionary keyed by the provided users list with a string value of their
-    home directory or 'None' when one was not found.
+
+def request_reload(wait: Optional[bool] = None) -> None:
+    """Have the director reloaded, once for all runs asking within
+    config.RELOAD_QUIET_WINDOW seconds of each other, by a background process.
+
+    Waits for the reload covering this run's changes when 'wait' is set (by default
+    when config.RELOAD_WAIT or set_reload_wait is set). Without
+    config.RELOAD_STATE_LOCATION the director is reloaded right away.
     """
-    ret = {key: None for key in users}
+    if not config.RELOAD_STATE_LOCATION:
+        reload_bconsole()
+        return
+
+    coordinator = reloader.Reloader(reload_bconsole)
+    sequence = coordinator.request()
+    coordinator.schedule()
+    if wait if wait is not None else (_RELOAD_WAIT or config.RELOAD_WAIT):
+        LOGGER.debug("Waiting for the director reload...")
+        coordinator.wait(sequence)
 
-    cnx = mysql.connector.connect(
-        user=secrets.sql_username,
-        password=secrets.sql_password,
-        host=secrets.DB_HOST,
-        port=secrets.DB_PORT,
-        database=secrets.DB_NAME,
-        connection_timeout=3,
+
+def call_director_many(commands: List[str]) -> List[str]:
+    """Run bconsole commands on the director and return their outputs in order.
+
+    Without a broker the commands are pipelined on a single new connection.
+    """
+    if config.BROKER_SOCKET:
+        outputs = []
+        try:
+            for command in commands:
+                outputs.append(broker.call(command))
+            return outputs
+        except broker.BrokerUnavailable as e:
+            if outputs:
+                raise
+            LOGGER.debug(f"{e}, connecting to the director directly")
+
+    passwd = bareos.bsock.Password(secrets.bconsole_password)
+
+    console = bareos.bsock.DirectorConsole(
+        address=config.DIRECTOR_ADDRESS, port=config.DIRECTOR_PORT, password=passwd
     )
+    try:
+        return [
+            (output or b"").decode("utf-8", "replace")
+            for output in console.call_many(commands)
+        ]
+    finally:
+        console.disconnect()
+
+
+def configure_backups(
+    backups: Iterable[Tuple[str, str, str, Optional[str]]],
+) -> List[Optional[Exception]]:
+    """Add the FileSet and Job of each backup, given as (name, description,
+    'client:/path', compression), to the running director with 'configure add'
+    instead of writing their files and reloading it. The director writes the files
+    itself, and both resources are verified with 'show' afterwards.
+
+    Returns the error of each backup in order, None when it was added. Nothing
+    changed for backups with a configurer.NeedsReload error, write their files and
+    reload instead.
+    """
+    errors = []  # type: List[Optional[Exception]]
+    # The FileSet and Job resources by the position of their backup.
+    resources = {}
+    names = set()
+    # The checks lock the files of the resources, so no other run writes them until
+    # the director did.
+    writer = BatchWriter()
+    try:
+        for i, (name, description, directory, compression) in enumerate(backups):
+            errors.append(None)
+            try:
+                client, file_location = directory.split(":", 1)
+                _lock_name(name, writer)
+                for kind, location in (
+                    ("fileset", config.FILESET_FILE_LOCATION),
+                    ("job", config.JOB_FILE_LOCATION),
+                ):
+                    existing = _resource_path(location, name, writer)
+                    if name in names or existing is not None:
+                        err_msg = f"{existing or location} already defines '{name}'"
+                        LOGGER.error(err_msg)
+                        raise FileExistsError(err_msg)
+                    _check_defined(kind, name, writer)
+                _check_references(
+                    name,
+                    writer,
+                    client=client,
+                    jobdefs=config.DEFAULT_JOB_DEFS,
+                    storage=config.DEFAULT_STORAGE,
+                )
+                names.add(name)
+                resources[i] = (
+                    configurer.file_set(
+                        name, description, file_location, compression or "GZIP"
+                    ),
+                    configurer.job(
+                        name,
+                        name,
+                        client,
+                        config.DEFAULT_JOB_DEFS,
+                        config.DEFAULT_STORAGE,
+                    ),
+                )
+            except configurer.NeedsReload as e:
+                LOGGER.info(f"{e}, writing the files of '{name}' instead")
+                errors[i] = e
+            except Exception as e:
+                errors[i] = e
+
+        if not resources:
+            return errors
+
+        # FileSets first, the Jobs reference them.
+        ordered = [file_set for file_set, _ in resources.values()] + [
+            job for _, job in resources.values()
+        ]
+        try:
+            outputs = call_director_many(
+                [r.add_command() for r in ordered] + [r.show_command() for r in ordered]
+            )
+        except Exception as e:
+            LOGGER.error(f"Failed to add resources with 'configure add': {e}")
+            outputs = None
+
+        for k, (i, (file_set, job)) in enumerate(resources.items()):
+            name = file_set.name
+            paths = [
+                f"{config.FILESET_FILE_LOCATION}/{name}.conf",
+                f"{config.JOB_FILE_LOCATION}/{name}.conf",
+            ]
+            written = [path for path in paths if os.path.exists(path)]
+            # Commit whatever the director wrote, also after a failure.
+            staging.add_committed_paths(written)
+
+            if outputs is None:
+                if written:
+                    errors[i] = IOError(f"Lost the director while adding '{name}'")
+                else:
+                    errors[i] = configurer.NeedsReload(
+                        "The director couldn't be reached"
+                    )
+                continue
+
+            # The outputs of the 'configure add' and 'show' commands of the resources.
+            added = outputs[k], outputs[len(resources) + k]
+            shown = (
+                outputs[len(ordered) + k],
+                outputs[len(ordered) + len(resources) + k],
+            )
+            missing = file_set.verify(shown[0]) + job.verify(shown[1])
+            if written == paths and not missing:
+                LOGGER.info(f"Added FileSet and Job '{name}' with 'configure add'")
+                continue
+
+            # 'show' also matches a resource the director still holds without its
+            # file, ex: removed while the reload is pending. Only the files count.
+            stale = "" if missing else ", the director still holds the old one"
+            if not written:
+                err_msg = (
+                    f"'configure add' of '{name}' failed{stale}: "
+                    f"{added[0].strip()} {added[1].strip()}"
+                )
+                LOGGER.info(f"{err_msg}, writing its files instead")
+                errors[i] = configurer.NeedsReload(err_msg)
+                continue
+
+            if missing:
+                err_msg = (
+                    f"'{name}' doesn't show {', '.join(missing)} after 'configure add'"
+                )
+            else:
+                err_msg = f"'configure add' of the Job '{name}' failed{stale}"
+            LOGGER.error(err_msg)
+            errors[i] = LookupError(err_msg)
+            if written == paths[:1]:
+                # The Job failed, drop its FileSet like when writing the files.
+                try:
+                    remove_file_set_file(name)
+                except Exception:
+                    LOGGER.error(f"Failed FileSet file cleanup for {name}")
+
+        return errors
+
+    finally:
+        writer.abort()
+
+
+def iter_dirs_from_db(
+    users: Iterable[str], chunk_size: int = config.DB_CHUNK_SIZE
+) -> Iterator["db.UserDirs"]:
+    """Given an iterable of users, lazily look up both their home and PE home
+    directory in the provided database in config.py, with one query per chunk.
+
+    Yields '(user, home directory, PE home directory)' tuples as the rows arrive,
+    with 'None' for a directory that was not found.
+    """
+    return _session().lookup(users, chunk_size)
+
+
+def iter_dir_from_db(
+    users: Iterable[str], chunk_size: int = config.DB_CHUNK_SIZE
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """Given an iterable of users, lazily look up their home directory in the provided
+    database in config.py.
+
+    Yields '(user, home directory)' tuples as the rows arrive, with 'None' as the
+    directory when one was not found.
+    """
+    for name, homedir_source, _ in iter_dirs_from_db(users, chunk_size):
+        yield name, homedir_source
+
 
-    cur = cnx.cursor()
+def iter_pe_dir_from_db(
+    users: Iterable[str], chunk_size: int = config.DB_CHUNK_SIZE
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """Given an iterable of users, lazily look up their PE home directory in the
+    provided database in config.py.
 
-    # The number of '%s' we need in the query statement.
-    s_str = ",".join(["%s"] * len(users))
-    query = f"SELECT name, homedir_source FROM accounts_user WHERE name in ({s_str})"
+    Yields '(user, PE home directory)' tuples as the rows arrive, with 'None' as the
+    directory when one was not found.
+    """
+    for name, _, pe_homedir_source in iter_dirs_from_db(users, chunk_size):
+        yield name, pe_homedir_source
 
-    cur.execute(query, tuple(users))
 
-    for name, homedir_source in cur:
-        ret[name] = homedir_source
+def get_dirs_from_db(
+    users: List[str],
+) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """Given a list of users, look up both their home and PE home directory in the
+    provided database in config.py.
 
-    cur.close()
-    cnx.close()
+    Returns a dictionary keyed by the provided users list with a tuple value of their
+    home and PE home directory, each 'None' when one was not found.
+    """
+    ret = {key: (None, None) for key in users}
+    for name, homedir_source, pe_homedir_source in iter_dirs_from_db(users):
+        ret[name] = (homedir_source, pe_homedir_source)
 
     return ret
 
 
-def get_pe_dir_from_db(users: List[str]) -> List[str]:
-    """Given a list of users, look up their PE home directory in the provided database
+def get_dir_from_db(users: List[str]) -> Dict[str, Optional[str]]:
+    """Given a list of users, look up their home directory in the provided database
     in config.py.
 
     Returns a dictionary keyed by the provided users list with a string value of their
     home directory or 'None' when one was not found.
     """
     ret = {key: None for key in users}
+    ret.update(iter_dir_from_db(users))
 
-    cnx = mysql.connector.connect(
-        user=secrets.sql_username,
-        password=secrets.sql_password,
-        host=secrets.DB_HOST,
-        port=secrets.DB_PORT,
-        database=secrets.DB_NAME,
-        connection_timeout=5,
-    )
+    return ret
 
-    cur = cnx.cursor()
 
-    # The number of '%s' we need in the query statement.
-    s_str = ",".join(["%s"] * len(users))
-    query = f"SELECT name, pe_homedir_source FROM accounts_user WHERE name in ({s_str})"
+def get_pe_dir_from_db(users: List[str]) -> Dict[str, Optional[str]]:
+    """Given a list of users, look up their PE home directory in the provided database
+    in config.py.
 
-    cur.execute(query, tuple(users))
+    Returns a dictionary keyed by the provided users list with a string value of their
+    home directory or 'None' when one was not found.
+    """
+    ret = {key: None for key in users}
+    ret.update(iter_pe_dir_from_db(users))
 
-    for name, homedir_source in cur:
-        ret[name] = homedir_source
+    return ret
 
-    cur.close()
-    cnx.close()
 
-    return ret
+def set_offline(offline: bool) -> None:
+    """Serve directory lookups from the cache, even when expired, if the database
+    can't be reached.
+    """
+    # Applied when the session is first used, so commands that don't look up
+    # directories don't import the database backend.
+    global _OFFLINE
+    _OFFLINE = offline
 
 
-def push_to_gitlab(message: str) -> None:
-    repo = Repo(config.GIT_LOCATION)
+def _session() -> "db.Session":
+    session = db.get_session()
+    session.offline = _OFFLINE
+    return session
+
+
+def warm_dir_cache() -> int:
+    """Fill the directory cache from a full dump of the accounts table.
+
+    Returns the number of users stored.
+    """
+    dir_cache = cache.get_cache()
 
-    if repo.bare:
-        err_msg = f"{config.GIT_LOCATION} is not an initialized git repo."
+    if dir_cache is None:
+        err_msg = "The directory cache is disabled or could not be opened."
         LOGGER.error(err_msg)
-        raise FileNotFoundError(err_msg)
+        raise RuntimeError(err_msg)
+
+    count = dir_cache.put_many(_session().dump())
+    LOGGER.info(f"Warmed directory cache at {dir_cache.path} with {count} users")
+
+    return count
+
 
-    git = repo.git
+def push_to_gitlab(message: str) -> None:
+    """Commit the config files changed by this run and push them.
+
+    The commit is queued and pushed by a background process when
+    config.GIT_PUSH_ASYNC is set, together with the commits of runs within
+    config.GIT_COMMIT_WINDOW seconds. A failed push stays queued, see
+    'brs_backup flush'.
+    """
+    git = committer.Committer()
     try:
-        git.pull()
-        git.add(A=True)
-        git.commit(m=message)
-        LOGGER.info(f"Pushing to GitLab with commit message: '{message}'")
-        git.push()
+        git.record(message, staging.take_committed_paths())
+        if config.GIT_PUSH_ASYNC:
+            git.schedule()
+        else:
+            git.flush()
     except Exception as e:
         LOGGER.critical(f"Failed to push to GitLab due to: {e}")